@@ -2,9 +2,31 @@
 """
 🎯 Financial Literacy Assistant - ChatGPT Style
 Simple, clean, and ready to use!
+
+Interactive:  python app.py
+Batch:        python app.py --batch questions.jsonl --output answers.jsonl
+              cat questions.jsonl | python app.py --batch - --output answers.jsonl --workers 4
+
+In batch mode each input line is a JSON object (the question is read from
+"question", "message", "prompt", "text" or "title"/"body", and the id from
+"id" or "request_id") or a plain line of text. Retrieval runs --retrieval-batch
+questions at a time with one batched embedding call, in a background thread
+that fetches the next batch's contexts while the current batch generates. If
+retrieval fails for a batch, its questions get error records and the run
+moves on. Generations go to Ollama through a pool of --workers threads. Each
+result is appended to the output JSONL as soon as it completes, and that file
+is the checkpoint: rerunning the same command skips ids already answered
+(and, with --retry-errors, ids whose record is an error; those error
+records are removed before the retry, so each id keeps one record).
 """
 
+import argparse
+import json
 import os
+import sys
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
 from dotenv import load_dotenv
 load_dotenv()
 
@@ -99,60 +121,271 @@ def show_examples():
         print(f"   {i}. {question}")
     print()
 
-# Main application loop
-show_welcome()
+def interactive():
+    """Main application loop"""
+    show_welcome()
 
-print("=" * 70)
-print()
+    print("=" * 70)
+    print()
 
-question_count = 0
+    question_count = 0
 
-while True:
-    try:
-        # Get user input
-        user_input = input("You: ").strip()
-        
-        # Empty input
-        if not user_input:
-            print("  (Please ask a question or type 'help' for examples)\n")
-            continue
-        
-        # Exit command
-        if user_input.lower() == 'exit':
-            print(f"\n👋 Thank you for {question_count} questions! Stay financially smart! 💡\n")
+    while True:
+        try:
+            # Get user input
+            user_input = input("You: ").strip()
+            
+            # Empty input
+            if not user_input:
+                print("  (Please ask a question or type 'help' for examples)\n")
+                continue
+            
+            # Exit command
+            if user_input.lower() == 'exit':
+                print(f"\n👋 Thank you for {question_count} questions! Stay financially smart! 💡\n")
+                break
+            
+            # Help command
+            if user_input.lower() == 'help':
+                show_examples()
+                continue
+            
+            question_count += 1
+            
+            # Show loading state
+            print("\n🔍 Analyzing your question...")
+            print("⏳ Generating response...\n")
+            
+            # Get relevant context
+            context = retriever.invoke(user_input)
+            
+            # Generate response
+            response = chain.invoke({
+                "context": context,
+                "question": user_input
+            })
+            
+            # Display response
+            print("💼 Financial Advisor:\n")
+            print(response)
+            print("\n" + "=" * 70 + "\n")
+            
+        except KeyboardInterrupt:
+            print(f"\n\n👋 Goodbye! You asked {question_count} questions. Great learning session! 💡\n")
             break
-        
-        # Help command
-        if user_input.lower() == 'help':
-            show_examples()
+        except EOFError:
+            print("\n\n👋 Thank you for using the Financial Advisor! 💰\n")
+            break
+        except Exception as e:
+            print(f"\n⚠️  Error: {str(e)}")
+            print("Please try again or ask a different question.\n")
+
+
+# --- batch mode -------------------------------------------------------------
+
+QUESTION_FIELDS = ("question", "message", "prompt", "text")
+
+
+def read_questions(stream):
+    """Yield (id, question) from JSONL or plain-text lines"""
+    for line_no, line in enumerate(stream, 1):
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            record = json.loads(line)
+        except ValueError:
+            record = line
+        if isinstance(record, str):
+            yield str(line_no), record
             continue
-        
-        question_count += 1
-        
-        # Show loading state
-        print("\n🔍 Analyzing your question...")
-        print("⏳ Generating response...\n")
-        
-        # Get relevant context
-        context = retriever.invoke(user_input)
-        
-        # Generate response
-        response = chain.invoke({
-            "context": context,
-            "question": user_input
-        })
-        
-        # Display response
-        print("💼 Financial Advisor:\n")
-        print(response)
-        print("\n" + "=" * 70 + "\n")
-        
+        question = next((record[f] for f in QUESTION_FIELDS if record.get(f)), None)
+        if question is None:
+            question = "\n\n".join(str(record[f]) for f in ("title", "body") if record.get(f))
+        if question:
+            qid = next((record[f] for f in ("id", "request_id") if record.get(f) is not None), line_no)
+            yield str(qid), question
+
+
+def completed_ids(path, retry_errors=False):
+    """Ids already written to the output file (the checkpoint)"""
+    done = set()
+    if not os.path.exists(path):
+        return done
+    with open(path) as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                continue  # torn last line from an interrupted run
+            if retry_errors and record.get("error"):
+                continue
+            done.add(record["id"])
+    return done
+
+
+def drop_records(path, ids):
+    """Rewrite the output file without the records for `ids` (error records
+    about to be retried), so each id ends up with one record"""
+    tmp = f"{path}.tmp"
+    with open(path) as src, open(tmp, "w") as dst:
+        for line in src:
+            try:
+                if json.loads(line)["id"] in ids:
+                    continue
+            except (ValueError, KeyError, TypeError):
+                if not line.endswith("\n"):
+                    continue  # torn last line from an interrupted run
+            dst.write(line)
+    os.replace(tmp, path)
+
+
+def retrieve_batch(questions):
+    """Context documents per question, with one embedding call for the batch"""
+    try:
+        from vector_enhanced import retrieve_many
+    except ImportError:
+        return [retriever.invoke(q) for q in questions]
+    return retrieve_many(questions)
+
+
+def percentile(values, p):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(p / 100 * (len(values) - 1))))]
+
+
+def run_batch(args):
+    source = sys.stdin if args.batch == "-" else open(args.batch)
+    done = set() if args.restart else completed_ids(args.output, args.retry_errors)
+    pending = [(qid, q) for qid, q in read_questions(source) if qid not in done]
+    if source is not sys.stdin:
+        source.close()
+    if args.limit:
+        pending = pending[:args.limit]
+    print(f"📚 {len(pending)} questions to answer ({len(done)} already in {args.output})")
+    if not pending:
+        return
+    if args.retry_errors and not args.restart and os.path.exists(args.output):
+        drop_records(args.output, {qid for qid, _ in pending})
+
+    out = open(args.output, "w" if args.restart else "a")
+    write_lock = threading.Lock()
+    generation_times = []
+    written = errors = 0
+    started = time.monotonic()
+    last_report = started
+
+    def generate(qid, question, docs, retrieval_ms):
+        t0 = time.monotonic()
+        record = {"id": qid, "question": question, "model": model_name,
+                  "context_ids": [getattr(d, "id", None) for d in docs],
+                  "retrieval_ms": round(retrieval_ms, 1)}
+        try:
+            record["answer"] = chain.invoke({"context": docs, "question": question})
+        except Exception as e:
+            record["error"] = str(e)
+        record["generation_ms"] = round((time.monotonic() - t0) * 1000, 1)
+        return record
+
+    def fetch(batch):
+        """(contexts, error, retrieval ms per question) for one batch"""
+        t0 = time.monotonic()
+        try:
+            contexts, error = retrieve_batch([q for _, q in batch]), None
+        except Exception as e:
+            contexts, error = None, str(e)
+        return contexts, error, (time.monotonic() - t0) * 1000 / len(batch)
+
+    def write(record):
+        nonlocal written, errors
+        with write_lock:
+            out.write(json.dumps(record, ensure_ascii=False) + "\n")
+            out.flush()
+        written += 1
+        errors += bool(record.get("error"))
+        if "generation_ms" in record:
+            generation_times.append(record["generation_ms"])
+
+    def report(final=False):
+        finished = written
+        elapsed = time.monotonic() - started
+        rate = finished / elapsed if elapsed else 0.0
+        eta = (len(pending) - finished) / rate if rate else float("inf")
+        label = "✅ Done" if final else "⏳"
+        print(f"{label} {finished}/{len(pending)} answered, {errors} errors, "
+              f"{rate:.2f} q/s ({rate * 60:.1f}/min), elapsed {elapsed:.0f}s"
+              + ("" if final else f", ETA {eta:.0f}s"), flush=True)
+
+    # At most workers x 2 generations queued, so retrieval for later batches
+    # doesn't run far ahead of Ollama
+    max_in_flight = args.workers * 2
+    in_flight = set()
+
+    def drain(block_until):
+        nonlocal last_report, in_flight
+        while len(in_flight) > block_until:
+            finished, in_flight = wait(in_flight, return_when=FIRST_COMPLETED)
+            for future in finished:
+                write(future.result())
+            if time.monotonic() - last_report >= args.report_every:
+                last_report = time.monotonic()
+                report()
+
+    batches = [pending[start:start + args.retrieval_batch]
+               for start in range(0, len(pending), args.retrieval_batch)]
+    executor = ThreadPoolExecutor(max_workers=args.workers, thread_name_prefix="batch-generate")
+    # One batch ahead: the next contexts are retrieved while this batch generates
+    prefetcher = ThreadPoolExecutor(max_workers=1, thread_name_prefix="batch-retrieve")
+    try:
+        upcoming = prefetcher.submit(fetch, batches[0])
+        for i, batch in enumerate(batches):
+            contexts, error, retrieval_ms = upcoming.result()
+            if i + 1 < len(batches):
+                upcoming = prefetcher.submit(fetch, batches[i + 1])
+            if error:
+                print(f"⚠️  Retrieval failed for {len(batch)} questions, recorded as errors: {error}", flush=True)
+                for qid, question in batch:
+                    write({"id": qid, "question": question, "model": model_name,
+                           "retrieval_ms": round(retrieval_ms, 1), "error": f"retrieval failed: {error}"})
+                continue
+            for (qid, question), docs in zip(batch, contexts):
+                drain(max_in_flight - 1)
+                in_flight.add(executor.submit(generate, qid, question, docs, retrieval_ms))
+        drain(0)
     except KeyboardInterrupt:
-        print(f"\n\n👋 Goodbye! You asked {question_count} questions. Great learning session! 💡\n")
-        break
-    except EOFError:
-        print("\n\n👋 Thank you for using the Financial Advisor! 💰\n")
-        break
-    except Exception as e:
-        print(f"\n⚠️  Error: {str(e)}")
-        print("Please try again or ask a different question.\n")
+        print("\n⏹️  Interrupted - finished answers are saved; rerun the same command to resume")
+        prefetcher.shutdown(wait=False, cancel_futures=True)
+        executor.shutdown(wait=False, cancel_futures=True)
+        out.close()
+        raise SystemExit(130)
+    prefetcher.shutdown()
+    executor.shutdown()
+    out.close()
+
+    report(final=True)
+    print(f"   generation p50 {percentile(generation_times, 50) / 1000:.1f}s, "
+          f"p95 {percentile(generation_times, 95) / 1000:.1f}s, workers {args.workers}")
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Financial Literacy Assistant")
+    parser.add_argument("--batch", metavar="JSONL", help="Answer questions from a JSONL file ('-' for stdin)")
+    parser.add_argument("--output", default="answers.jsonl", help="Output JSONL (also the resume checkpoint)")
+    parser.add_argument("--workers", type=int, default=int(os.getenv("BATCH_WORKERS", "2")),
+                        help="Concurrent Ollama generations")
+    parser.add_argument("--retrieval-batch", type=int, default=64, help="Questions embedded per retrieval call")
+    parser.add_argument("--limit", type=int, default=0, help="Answer at most this many questions")
+    parser.add_argument("--report-every", type=float, default=10, help="Seconds between progress lines")
+    parser.add_argument("--retry-errors", action="store_true", help="Re-ask questions whose answer was an error")
+    parser.add_argument("--restart", action="store_true", help="Ignore and overwrite an existing output file")
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    if args.batch:
+        run_batch(args)
+    else:
+        interactive()
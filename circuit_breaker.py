@@ -0,0 +1,138 @@
+"""
+Circuit breaker for calls to the Ollama backend
+
+After OLLAMA_BREAKER_FAILURES consecutive failures or timeouts the breaker
+opens and callers skip Ollama entirely (answering from retrieval only).
+While open, a background thread probes GET /api/tags every
+OLLAMA_BREAKER_RESET_SECONDS; once it answers, the breaker goes half-open and
+lets a single real request through to decide whether to close again.
+
+ollama_pool gives every configured backend its own breaker.
+"""
+import logging
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+
+class CircuitOpenError(Exception):
+    """Raised instead of calling a backend whose breaker is open"""
+
+
+class CircuitBreaker:
+    def __init__(self, name, failure_threshold=3, reset_timeout=30.0, probe=None):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.probe = probe
+        self._lock = threading.Lock()
+        self._state = CLOSED
+        self._failures = 0
+        self._opened_at = None
+        self._trial_in_flight = False
+        self._prober = None
+        self._last_error = None
+        self._last_probe_at = None
+        self._times_opened = 0
+
+    @property
+    def state(self):
+        return self._state
+
+    def is_open(self):
+        """True while callers should route around the backend (no side effects)"""
+        return self._state == OPEN or (self._state == HALF_OPEN and self._trial_in_flight)
+
+    def allow(self):
+        """Whether a call may proceed now; in half-open state only one trial call is let through"""
+        with self._lock:
+            if self._state == CLOSED:
+                return True
+            if self._state == HALF_OPEN and not self._trial_in_flight:
+                self._trial_in_flight = True
+                return True
+            return False
+
+    def record_success(self):
+        with self._lock:
+            if self._state != CLOSED:
+                logger.info("Circuit '%s' closed - backend recovered", self.name)
+            self._state = CLOSED
+            self._failures = 0
+            self._trial_in_flight = False
+            self._opened_at = None
+
+    def record_failure(self, error=None):
+        with self._lock:
+            self._failures += 1
+            self._last_error = str(error) if error else None
+            reopen = self._state == HALF_OPEN
+            if reopen or (self._state == CLOSED and self._failures >= self.failure_threshold):
+                self._open()
+
+    def _open(self):
+        # Caller holds self._lock
+        self._state = OPEN
+        self._opened_at = time.time()
+        self._trial_in_flight = False
+        self._times_opened += 1
+        logger.warning("Circuit '%s' opened after %d failure(s): %s",
+                       self.name, self._failures, self._last_error)
+        if self._prober is None or not self._prober.is_alive():
+            self._prober = threading.Thread(
+                target=self._probe_loop, name=f"breaker-probe-{self.name}", daemon=True
+            )
+            self._prober.start()
+
+    def _probe_loop(self):
+        while True:
+            time.sleep(self.reset_timeout)
+            with self._lock:
+                if self._state != OPEN:
+                    return
+            try:
+                healthy = self.probe() if self.probe else True
+            except Exception:
+                healthy = False
+            with self._lock:
+                self._last_probe_at = time.time()
+                if self._state != OPEN:
+                    return
+                if healthy:
+                    logger.info("Circuit '%s' half-open - probe succeeded", self.name)
+                    self._state = HALF_OPEN
+                    self._trial_in_flight = False
+                    return
+
+    def call(self, fn, *args, **kwargs):
+        """Run fn through the breaker, raising CircuitOpenError if it is open"""
+        if not self.allow():
+            raise CircuitOpenError(f"{self.name} circuit is open")
+        try:
+            result = fn(*args, **kwargs)
+        except Exception as e:
+            self.record_failure(e)
+            raise
+        self.record_success()
+        return result
+
+    def snapshot(self):
+        """Cached health state for status endpoints - never touches the backend"""
+        with self._lock:
+            return {
+                "name": self.name,
+                "state": self._state,
+                "consecutive_failures": self._failures,
+                "failure_threshold": self.failure_threshold,
+                "reset_timeout": self.reset_timeout,
+                "opened_at": self._opened_at,
+                "last_probe_at": self._last_probe_at,
+                "last_error": self._last_error,
+                "times_opened": self._times_opened,
+            }
+
@@ -0,0 +1,230 @@
+"""
+Two-stage (cluster-then-passage) search over the index artifact
+
+Brute force scores every passage per query, which is fine for the 5.5k-row
+CSV but not for millions of passages on a CPU box. HierarchicalIndex groups
+the artifact's vectors into clusters with spherical k-means. Each cluster
+is summarised by its centroid. A query is first scored against the
+centroids. Only the passages of the `nprobe` best clusters are then scored
+exactly, so raising nprobe buys recall with latency.
+
+The clustering lives in a sidecar file next to the artifact
+(finguide_index.fgix.ivf, an uncompressed .npz): centroids, per-centroid
+counts, the cluster of every vector, and any passages inserted since the
+clustering was built. `manage.py cluster_index` builds it offline.
+`cluster_index --add` inserts new passages without a rebuild. Each new
+passage joins its nearest cluster and that centroid moves toward it as a
+running mean. imbalance() reports when clusters have drifted far enough to
+warrant a rebuild.
+
+The sidecar is tied to one artifact (corpus version, embedding model,
+chunking and build time) and is ignored once the artifact is rebuilt.
+It exposes the same chunks / search / search_many / mmr interface as
+IndexArtifact, so ArtifactRetriever can use either.
+"""
+import json
+import os
+from pathlib import Path
+
+import numpy as np
+
+from index_artifact import mmr_select
+
+FORMAT_VERSION = 1
+
+
+def sidecar_path(artifact_path):
+    return Path(str(artifact_path) + ".ivf")
+
+
+def _normalise(vectors):
+    vectors = np.asarray(vectors, dtype=np.float32)
+    return vectors / np.clip(np.linalg.norm(vectors, axis=-1, keepdims=True), 1e-9, None)
+
+
+def default_clusters(count):
+    """About 4*sqrt(N) clusters: ~250 for 5k passages, ~4000 for 1M"""
+    return max(1, min(count, int(4 * np.sqrt(count))))
+
+
+def assign(vectors, centroids, batch=8192):
+    """Nearest centroid (by cosine) for each vector, in batches"""
+    labels = np.empty(len(vectors), dtype=np.int32)
+    for start in range(0, len(vectors), batch):
+        block = np.asarray(vectors[start:start + batch], dtype=np.float32)
+        labels[start:start + batch] = np.argmax(block @ centroids.T, axis=1)
+    return labels
+
+
+def kmeans(vectors, n_clusters, iterations=20, sample=None, seed=0):
+    """Spherical k-means (k-means++ seeding) on at most `sample` vectors;
+    returns unit-length centroids"""
+    rng = np.random.default_rng(seed)
+    count = len(vectors)
+    sample = min(count, sample or max(64 * n_clusters, 20000))
+    rows = np.sort(rng.choice(count, sample, replace=False)) if sample < count else np.arange(count)
+    data = _normalise(vectors[rows])
+    n_clusters = min(n_clusters, len(data))
+
+    # k-means++ on a random subset: each next seed drawn proportionally to its
+    # distance from the seeds chosen so far
+    pool = data[rng.permutation(len(data))[:20 * n_clusters]]
+    centroids = np.empty((n_clusters, data.shape[1]), dtype=np.float32)
+    centroids[0] = pool[rng.integers(len(pool))]
+    distance = np.clip(1.0 - pool @ centroids[0], 0.0, None)
+    for i in range(1, n_clusters):
+        total = distance.sum()
+        pick = rng.choice(len(pool), p=distance / total) if total > 0 else rng.integers(len(pool))
+        centroids[i] = pool[pick]
+        distance = np.minimum(distance, np.clip(1.0 - pool @ centroids[i], 0.0, None))
+
+    for _ in range(iterations):
+        labels = assign(data, centroids)
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, labels, data)
+        empty = np.bincount(labels, minlength=n_clusters) == 0
+        # Re-seed empty clusters with random points so none stay dead
+        sums[empty] = data[rng.choice(len(data), int(empty.sum()))]
+        updated = _normalise(sums)
+        if np.allclose(updated, centroids, atol=1e-5):
+            centroids = updated
+            break
+        centroids = updated
+    return centroids
+
+
+class HierarchicalIndex:
+    def __init__(self, artifact, centroids, labels, counts, extra_vectors=None, extra_chunks=None, nprobe=8):
+        self.artifact = artifact
+        self.header = artifact.header
+        self.centroids = np.asarray(centroids, dtype=np.float32)
+        self.counts = np.asarray(counts, dtype=np.int64)
+        self.labels = np.asarray(labels, dtype=np.int32)
+        self.base_count = len(artifact.vectors)
+        dim = self.centroids.shape[1]
+        self.extra_vectors = (np.asarray(extra_vectors, dtype=np.float32).reshape(-1, dim)
+                              if extra_vectors is not None else np.empty((0, dim), dtype=np.float32))
+        self.chunks = list(artifact.chunks) + list(extra_chunks or [])
+        self.nprobe = nprobe
+        self._build_lists()
+
+    @classmethod
+    def build(cls, artifact, n_clusters=None, iterations=20, nprobe=8):
+        centroids = kmeans(artifact.vectors, n_clusters or default_clusters(len(artifact.vectors)), iterations)
+        # Centroids that win no vector in the full assignment are dropped
+        used = np.bincount(assign(artifact.vectors, centroids), minlength=len(centroids)) > 0
+        centroids = centroids[used]
+        labels = assign(artifact.vectors, centroids)
+        counts = np.bincount(labels, minlength=len(centroids))
+        return cls(artifact, centroids, labels, counts, nprobe=nprobe)
+
+    def _build_lists(self):
+        order = np.argsort(self.labels, kind="stable")
+        bounds = np.searchsorted(self.labels[order], np.arange(len(self.centroids) + 1))
+        self.lists = [order[bounds[c]:bounds[c + 1]] for c in range(len(self.centroids))]
+
+    def __len__(self):
+        return len(self.labels)
+
+    def vectors_for(self, ids):
+        ids = np.asarray(ids)
+        base = ids < self.base_count
+        if base.all():
+            return np.asarray(self.artifact.vectors[ids], dtype=np.float32)
+        out = np.empty((len(ids), self.centroids.shape[1]), dtype=np.float32)
+        out[base] = self.artifact.vectors[ids[base]]
+        out[~base] = self.extra_vectors[ids[~base] - self.base_count]
+        return out
+
+    def candidates(self, query, nprobe=None):
+        """Passage ids in the nprobe clusters whose centroids best match the query"""
+        scores = self.centroids @ query
+        scores[self.counts == 0] = -np.inf
+        nprobe = min(nprobe or self.nprobe, int((self.counts > 0).sum()))
+        if nprobe < 1:
+            return np.empty(0, dtype=np.int64)
+        top = np.argpartition(-scores, nprobe - 1)[:nprobe]
+        return np.concatenate([self.lists[c] for c in top])
+
+    def search(self, query_vector, k=5, nprobe=None):
+        query = _normalise(query_vector)
+        ids = self.candidates(query, nprobe)
+        if not len(ids):
+            return ids, np.empty(0, dtype=np.float32)
+        scores = self.vectors_for(ids) @ query
+        k = min(k, len(scores))
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        return ids[top], scores[top]
+
+    def search_many(self, query_vectors, k=5):
+        return [self.search(vector, k)[0] for vector in query_vectors]
+
+    def mmr(self, query_vector, k=5, fetch_k=20, lambda_mult=0.5):
+        ids, scores = self.search(query_vector, max(k, fetch_k))
+        return mmr_select(ids, scores, self.vectors_for(ids), k, lambda_mult)
+
+    def add(self, vectors, chunks):
+        """Insert passages: each joins its nearest cluster, whose centroid
+        moves toward it (running mean, renormalised)"""
+        vectors = _normalise(np.atleast_2d(vectors))
+        if len(vectors) != len(chunks):
+            raise ValueError(f"{len(chunks)} chunks but {len(vectors)} vectors")
+        labels = assign(vectors, self.centroids)
+        for vector, label in zip(vectors, labels):
+            self.counts[label] += 1
+            self.centroids[label] += (vector - self.centroids[label]) / self.counts[label]
+            self.centroids[label] /= max(float(np.linalg.norm(self.centroids[label])), 1e-9)
+        self.extra_vectors = np.concatenate([self.extra_vectors, vectors])
+        self.labels = np.concatenate([self.labels, labels])
+        self.chunks.extend(chunks)
+        self._build_lists()
+        return labels
+
+    def imbalance(self):
+        """Largest cluster relative to the mean size; scans cost grows with it"""
+        return float(self.counts.max() / max(self.counts.mean(), 1e-9))
+
+    def stats(self):
+        return {
+            "passages": len(self),
+            "inserted": len(self.extra_vectors),
+            "clusters": len(self.centroids),
+            "nprobe": self.nprobe,
+            "mean_cluster": float(self.counts.mean()),
+            "max_cluster": int(self.counts.max()),
+            "imbalance": round(self.imbalance(), 2),
+            "scanned_per_query": int(self.counts.mean() * min(self.nprobe, len(self.centroids))),
+        }
+
+    def save(self, path):
+        path = Path(path)
+        tmp = path.with_name(path.name + ".tmp")
+        meta = json.dumps({"format": FORMAT_VERSION, "artifact": artifact_stamp(self.header),
+                           "extra_chunks": self.chunks[self.base_count:]}, ensure_ascii=False)
+        with open(tmp, "wb") as f:
+            np.savez(f, centroids=self.centroids, counts=self.counts, labels=self.labels,
+                     extra_vectors=self.extra_vectors, meta=np.frombuffer(meta.encode("utf-8"), dtype=np.uint8))
+        os.replace(tmp, path)
+        return path
+
+
+def artifact_stamp(header):
+    """What identifies the artifact a clustering was built from"""
+    return {key: header.get(key) for key in ("corpus_version", "embedding_model", "chunking",
+                                              "created_at", "count")}
+
+
+def load_hierarchical(artifact, path=None, nprobe=8):
+    """The clustering for `artifact`, or None if there is no sidecar or it
+    was built for a different artifact"""
+    path = Path(path or sidecar_path(artifact.path))
+    if not path.exists():
+        return None
+    with np.load(path) as data:
+        meta = json.loads(bytes(data["meta"]).decode("utf-8"))
+        if meta.get("format") != FORMAT_VERSION or meta["artifact"] != artifact_stamp(artifact.header):
+            return None
+        arrays = {name: data[name] for name in ("centroids", "counts", "labels", "extra_vectors")}
+    return HierarchicalIndex(artifact, arrays["centroids"], arrays["labels"], arrays["counts"],
+                             arrays["extra_vectors"], meta["extra_chunks"], nprobe=nprobe)
@@ -0,0 +1,211 @@
+"""
+Shared, compact in-memory copy of the knowledge-base CSV
+
+Both retrieval paths (vector_enhanced for indexing, simple_fallback for
+keyword search) read the corpus through get_corpus(), so each process parses
+the file once and never imports pandas for it. Cell values are stored in one
+contiguous string with an offsets array rather than as thousands of separate
+objects, alongside a lowercased copy for case-insensitive matching and an
+inverted index of lowercase tokens. count_matches uses the index to visit
+only the rows whose tokens contain a search word, instead of scanning the
+whole text for every word.
+
+The file is resolved relative to this module (CORPUS_PATH overrides), not
+the current directory, so workers started from anywhere find it.
+"""
+import csv
+import hashlib
+import os
+import re
+import threading
+from array import array
+from bisect import bisect_right
+from pathlib import Path
+
+BASE_DIR = Path(__file__).resolve().parent
+CORPUS_PATH = Path(os.getenv("CORPUS_PATH", BASE_DIR / "Financial-Literacy-Compilation.csv"))
+# Rows at least this similar (word-shingle Jaccard) are indexed once; 0 disables
+DEDUP_THRESHOLD = float(os.getenv("DEDUP_THRESHOLD", "0.8"))
+
+_TOKEN = re.compile(r"\w+")
+# Never appears in the text, so no search term can match across two cells
+_SEP = "\x00"
+
+
+class Corpus:
+    def __init__(self, columns, rows):
+        self.columns = tuple(columns)
+        self.width = max(1, len(self.columns))
+        cells = []
+        for row in rows:
+            row = list(row[:self.width]) + [""] * (self.width - len(row))
+            cells.extend(value.strip() for value in row)
+        self.rows = len(cells) // self.width
+
+        self._text, self._offsets = self._pack(cells)
+        self._lower, self._lower_offsets = self._pack([c.lower() for c in cells])
+
+        postings = {}
+        for i in range(self.rows):
+            for token in set(_TOKEN.findall(self.row_lower(i))):
+                postings.setdefault(token, array('I')).append(i)
+        self.postings = postings
+        # Every distinct token in one string, to find the tokens containing a word
+        self._vocab = sorted(postings)
+        self._vocab_text, self._vocab_offsets = self._pack(self._vocab)
+        self._duplicates = {}  # threshold -> {canonical row: [duplicate rows]}
+
+    @staticmethod
+    def _pack(cells):
+        offsets = array('I', [0])
+        for cell in cells:
+            offsets.append(offsets[-1] + len(cell) + 1)
+        return _SEP.join(cells) + _SEP, offsets
+
+    def __len__(self):
+        return self.rows
+
+    def cell(self, row, col=0):
+        i = row * self.width + col
+        return self._text[self._offsets[i]:self._offsets[i + 1] - 1]
+
+    def values(self, row):
+        return [self.cell(row, c) for c in range(self.width)]
+
+    def row_lower(self, row):
+        start = self._lower_offsets[row * self.width]
+        end = self._lower_offsets[(row + 1) * self.width] - 1
+        return self._lower[start:end].replace(_SEP, " ")
+
+    def is_empty(self, row):
+        return not any(self.values(row))
+
+    def document_text(self, row):
+        """Row rendered as `column: value` lines (the text that gets embedded)"""
+        return "\n".join(f"{col}: {val}" for col, val in zip(self.columns, self.values(row)))
+
+    def duplicates(self, threshold=DEDUP_THRESHOLD):
+        """{canonical row: [near-duplicate rows]} (see dedup.py). The longest
+        row of each cluster is canonical, so it carries the most text."""
+        if not threshold:
+            return {}
+        if threshold not in self._duplicates:
+            from dedup import near_duplicate_clusters
+
+            rows = [i for i in range(self.rows) if not self.is_empty(i)]
+            texts = [" ".join(self.values(i)) for i in rows]
+            groups = {}
+            for cluster in near_duplicate_clusters(texts, threshold):
+                best = max(cluster, key=lambda i: (len(texts[i]), -i))
+                groups[rows[best]] = sorted(rows[i] for i in cluster if i != best)
+            self._duplicates[threshold] = groups
+        return self._duplicates[threshold]
+
+    def canonical_rows(self, threshold=DEDUP_THRESHOLD):
+        """{duplicate row: its canonical row}"""
+        return {dup: canonical for canonical, dups in self.duplicates(threshold).items() for dup in dups}
+
+    def chunks(self, dedup_threshold=0):
+        """Non-empty rows as index chunks: {"id", "row_index", "text"}. With
+        dedup_threshold, each near-duplicate cluster becomes one chunk for
+        its canonical row, listing the folded rows under "duplicates"."""
+        duplicates = self.duplicates(dedup_threshold)
+        folded = {row for rows in duplicates.values() for row in rows}
+        chunks = []
+        for i in range(self.rows):
+            if self.is_empty(i) or i in folded:
+                continue
+            chunk = {"id": str(i), "row_index": i, "text": self.document_text(i)}
+            if i in duplicates:
+                chunk["duplicates"] = duplicates[i]
+            chunks.append(chunk)
+        return chunks
+
+    def count_matches(self, words):
+        """{row: total occurrences of `words` (lowercase substrings) in that row}"""
+        scores = {}
+        text, offsets, width = self._lower, self._lower_offsets, self.width
+        for word in words:
+            if _TOKEN.fullmatch(word):
+                # Within one token, so only rows with a token containing it can match
+                for row in self.rows_containing(word):
+                    start, end = offsets[row * width], offsets[(row + 1) * width]
+                    pos = text.find(word, start, end)
+                    while pos != -1:
+                        scores[row] = scores.get(row, 0) + 1
+                        pos = text.find(word, pos + 1, end)
+                continue
+            pos = text.find(word)
+            while pos != -1:
+                row = (bisect_right(offsets, pos) - 1) // width
+                scores[row] = scores.get(row, 0) + 1
+                pos = text.find(word, pos + 1)
+        return scores
+
+    def tokens_containing(self, word):
+        """Indexed tokens that have `word` (lowercase) as a substring"""
+        text, offsets = self._vocab_text, self._vocab_offsets
+        tokens = []
+        pos = text.find(word)
+        while pos != -1:
+            i = bisect_right(offsets, pos) - 1
+            tokens.append(self._vocab[i])
+            # Next token; each is listed once however often it contains the word
+            pos = text.find(word, offsets[i + 1])
+        return tokens
+
+    def rows_containing(self, word):
+        """Sorted rows with a token that contains `word` (lowercase)"""
+        tokens = self.tokens_containing(word)
+        if len(tokens) == 1:
+            return self.postings[tokens[0]]
+        return sorted({row for token in tokens for row in self.postings[token]})
+
+    def rows_with_token(self, token):
+        return self.postings.get(token.lower(), array('I'))
+
+    def memory_bytes(self):
+        """Approximate footprint of the packed buffers (excluding the token index)"""
+        return (len(self._text) + len(self._lower)
+                + self._offsets.itemsize * (len(self._offsets) + len(self._lower_offsets)))
+
+
+def load(path=CORPUS_PATH):
+    with open(path, newline='', encoding='utf-8') as f:
+        reader = csv.reader(f)
+        columns = next(reader, [])
+        # Skip blank lines, like the pandas loader this replaces
+        return Corpus(columns, (row for row in reader if row))
+
+
+_corpus = None
+_corpus_version = None
+_lock = threading.Lock()
+
+
+def get_corpus():
+    """The process-wide corpus, loaded on first use"""
+    global _corpus
+    if _corpus is None:
+        with _lock:
+            if _corpus is None:
+                _corpus = load()
+                print(f"✅ Successfully loaded {len(_corpus)} financial records")
+    return _corpus
+
+
+def chunking_id(threshold=DEDUP_THRESHOLD):
+    """How the corpus is cut into chunks; recorded with every built index"""
+    return f"rows+dedup{threshold:g}" if threshold else "rows"
+
+
+def corpus_version():
+    """Content hash of the knowledge-base CSV (computed once per process)."""
+    global _corpus_version
+    if _corpus_version is None:
+        digest = hashlib.sha256()
+        with open(CORPUS_PATH, 'rb') as f:
+            for block in iter(lambda: f.read(1 << 16), b''):
+                digest.update(block)
+        _corpus_version = digest.hexdigest()[:16]
+    return _corpus_version
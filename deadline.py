@@ -0,0 +1,124 @@
+"""
+Per-request time budgets for the chat path
+
+A chat request gets one Deadline when it arrives: CHAT_DEADLINE seconds, or
+what the client asks for in an X-Request-Timeout header (at most
+CHAT_DEADLINE_MAX). Every stage after that
+spends only what is left of the same budget: retrieval (and its query
+embedding), the wait for an LLM slot or a coalesced generation, and the
+generation itself. So the request ends in time, not after the sum of each
+stage's own timeout.
+
+The active deadline is kept in a context variable (deadline_scope), so
+ollama_pool caps the timeout of every HTTP call made under it without each
+caller passing it down. Part of the budget (`reserve`) is held back so that
+a request that runs out of time can still answer from retrieved context.
+
+GenerationRate learns each model's tokens per second and fixed overhead
+from Ollama's eval_count / eval_duration. Deadline.num_predict uses it to
+ask for no more tokens than fit in the time that remains.
+"""
+import contextvars
+import threading
+import time
+from contextlib import contextmanager
+
+
+class DeadlineExceeded(Exception):
+    """The request's time budget ran out before a stage could start"""
+
+
+class Deadline:
+    def __init__(self, seconds, reserve=0.0):
+        self.budget = float(seconds)
+        self.reserve = min(float(reserve), self.budget / 2)
+        self.started = time.monotonic()
+        self.expires = self.started + self.budget
+
+    def elapsed(self):
+        return time.monotonic() - self.started
+
+    def remaining(self):
+        """Seconds left for work (the reserve excluded)"""
+        return max(0.0, self.expires - self.reserve - time.monotonic())
+
+    def expired(self):
+        return self.remaining() <= 0
+
+    def check(self, stage, minimum=0.0):
+        """Raise DeadlineExceeded unless more than `minimum` seconds remain"""
+        if self.remaining() <= minimum:
+            raise DeadlineExceeded(f'{stage}: {self.elapsed():.1f}s of a {self.budget:g}s budget used')
+
+    def timeout(self, cap=None, stage='call'):
+        """Timeout for the next call: what remains, at most `cap`"""
+        self.check(stage)
+        remaining = self.remaining()
+        return remaining if cap is None else min(cap, remaining)
+
+    def child(self, seconds):
+        """A deadline ending `seconds` from now, or with this one if sooner"""
+        child = Deadline(seconds)
+        child.expires = min(child.expires, self.expires - self.reserve)
+        return child
+
+    def num_predict(self, requested, rate, minimum=32):
+        """Largest token budget up to `requested` that fits the remaining time
+        at `rate` (tokens_per_second, overhead_seconds)"""
+        tokens_per_second, overhead = rate
+        affordable = int((self.remaining() - overhead) * tokens_per_second)
+        return max(minimum, min(requested, affordable))
+
+
+_current = contextvars.ContextVar('deadline', default=None)
+
+
+def current():
+    return _current.get()
+
+
+@contextmanager
+def deadline_scope(deadline):
+    """Make `deadline` the one call_timeout() applies to in this context"""
+    token = _current.set(deadline)
+    try:
+        yield deadline
+    finally:
+        _current.reset(token)
+
+
+def call_timeout(default, stage='call'):
+    """`default` seconds, capped at what remains of the active deadline"""
+    deadline = _current.get()
+    return default if deadline is None else deadline.timeout(default, stage)
+
+
+class GenerationRate:
+    """Exponentially weighted tokens/second and overhead per model"""
+
+    def __init__(self, default_tokens_per_second=8.0, default_overhead=1.0, alpha=0.3):
+        self.default = (float(default_tokens_per_second), float(default_overhead))
+        self.alpha = alpha
+        self._rates = {}
+        self._lock = threading.Lock()
+
+    def observe(self, model, body):
+        """Update from a finished Ollama /api/generate response body"""
+        tokens, eval_ns, total_ns = body.get('eval_count'), body.get('eval_duration'), body.get('total_duration')
+        if not tokens or not eval_ns:
+            return
+        sample = (tokens / (eval_ns / 1e9), max(0.0, ((total_ns or eval_ns) - eval_ns) / 1e9))
+        with self._lock:
+            old = self._rates.get(model)
+            self._rates[model] = sample if old is None else tuple(
+                (1 - self.alpha) * o + self.alpha * s for o, s in zip(old, sample))
+
+    def get(self, model):
+        """(tokens_per_second, overhead_seconds) for `model`"""
+        with self._lock:
+            return self._rates.get(model, self.default)
+
+    def snapshot(self):
+        with self._lock:
+            return {model: {'tokens_per_second': round(tps, 1), 'overhead_s': round(overhead, 2)}
+                    for model, (tps, overhead) in self._rates.items()}
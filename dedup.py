@@ -0,0 +1,94 @@
+"""
+Near-duplicate detection for corpus rows (MinHash + LSH)
+
+The knowledge base is a compilation, so the same sentence or advice often
+appears several times with small wording changes. Before indexing,
+near_duplicate_clusters() groups rows whose word-shingle Jaccard
+similarity is at least `threshold`:
+
+  1. each text becomes a set of word 3-grams (shorter texts use their words),
+  2. a MinHash signature of `num_perm` values is computed for every set,
+  3. LSH banding (bands x rows = num_perm) proposes candidate pairs,
+  4. candidates are confirmed with the exact Jaccard of their shingle sets,
+  5. confirmed pairs are merged with union-find.
+
+Only candidate pairs are compared, so the cost stays close to linear in the
+number of rows.
+"""
+import re
+import zlib
+
+import numpy as np
+
+_WORD = re.compile(r"[a-z0-9]+")
+_PRIME = np.uint64(4294967311)  # smallest prime above 2**32
+MAX_PAIRWISE = 100
+
+
+def shingles(text, size=3):
+    words = _WORD.findall(text.lower())
+    if len(words) <= size:
+        return {" ".join(words)} if words else set()
+    return {" ".join(words[i:i + size]) for i in range(len(words) - size + 1)}
+
+
+def jaccard(a, b):
+    if not a or not b:
+        return 0.0
+    return len(a & b) / len(a | b)
+
+
+def minhash_signatures(shingle_sets, num_perm=64, seed=1):
+    """(len(shingle_sets), num_perm) uint64 MinHash signatures"""
+    rng = np.random.RandomState(seed)
+    a = rng.randint(1, 2**32 - 1, size=num_perm, dtype=np.uint64)
+    b = rng.randint(0, 2**32 - 1, size=num_perm, dtype=np.uint64)
+    signatures = np.full((len(shingle_sets), num_perm), np.iinfo(np.uint64).max, dtype=np.uint64)
+    for i, items in enumerate(shingle_sets):
+        if not items:
+            continue
+        hashes = np.fromiter((zlib.crc32(s.encode("utf-8")) for s in items), dtype=np.uint64, count=len(items))
+        # a, x < 2**32, so a * x + b stays below 2**64
+        signatures[i] = ((np.outer(hashes, a) + b) % _PRIME).min(axis=0)
+    return signatures
+
+
+def _find(parent, i):
+    while parent[i] != i:
+        parent[i] = parent[parent[i]]
+        i = parent[i]
+    return i
+
+
+def near_duplicate_clusters(texts, threshold=0.8, num_perm=64, bands=16):
+    """Clusters (lists of indices into `texts`, smallest first) with two or
+    more members whose texts are at least `threshold` similar"""
+    sets = [shingles(t) for t in texts]
+    signatures = minhash_signatures(sets, num_perm)
+    rows_per_band = num_perm // bands
+
+    parent = list(range(len(texts)))
+    checked = set()
+    for band in range(bands):
+        buckets = {}
+        block = signatures[:, band * rows_per_band:(band + 1) * rows_per_band]
+        for i, key in enumerate(map(bytes, block)):
+            if sets[i]:
+                buckets.setdefault(key, []).append(i)
+        for members in buckets.values():
+            # Pairwise within a bucket; a huge bucket (boilerplate) only against its first member
+            heads = members[:-1] if len(members) <= MAX_PAIRWISE else members[:1]
+            for pos, first in enumerate(heads):
+                for other in members[pos + 1:]:
+                    pair = (first, other)
+                    if pair in checked:
+                        continue
+                    checked.add(pair)
+                    root_a, root_b = _find(parent, first), _find(parent, other)
+                    if root_a != root_b and jaccard(sets[first], sets[other]) >= threshold:
+                        parent[max(root_a, root_b)] = min(root_a, root_b)
+
+    clusters = {}
+    for i in range(len(texts)):
+        clusters.setdefault(_find(parent, i), []).append(i)
+    return [members for members in clusters.values() if len(members) > 1]
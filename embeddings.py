@@ -0,0 +1,182 @@
+"""
+Pluggable embedding providers for the retrieval layer
+
+EMBED_PROVIDER selects where query and document vectors come from:
+  - "ollama" (default): the Ollama daemon, as before (EMBED_MODEL)
+  - "local":  a small model run in-process on CPU, so retrieval keeps working
+              while Ollama is busy generating or down (LOCAL_EMBED_MODEL)
+
+The local provider uses an exported ONNX model when LOCAL_EMBED_MODEL points at
+a directory containing model.onnx + tokenizer.json, and sentence-transformers
+otherwise. EMBED_THREADS caps CPU threads and EMBED_BATCH_SIZE sets how many
+texts go through the model per forward pass. Neither runtime is in
+requirements.txt: install requirements-local.txt to use the local provider.
+"""
+import os
+import threading
+from pathlib import Path
+
+from langchain_core.embeddings import Embeddings
+
+EMBED_PROVIDER = os.getenv("EMBED_PROVIDER", "ollama").lower()
+EMBED_MODEL = os.getenv("EMBED_MODEL", "nomic-embed-text")
+LOCAL_EMBED_MODEL = os.getenv("LOCAL_EMBED_MODEL", "sentence-transformers/all-MiniLM-L6-v2")
+EMBED_THREADS = int(os.getenv("EMBED_THREADS", "2"))
+EMBED_BATCH_SIZE = int(os.getenv("EMBED_BATCH_SIZE", "32"))
+
+
+def _require(backend, packages):
+    """ImportError naming what to install when a local backend's packages are missing"""
+    return ImportError(f"EMBED_PROVIDER=local with the {backend} backend needs {', '.join(packages)}: "
+                       f"pip install -r requirements-local.txt")
+
+
+class LocalEmbeddings(Embeddings):
+    """In-process CPU embeddings (ONNX Runtime or sentence-transformers)."""
+
+    def __init__(self, model_name=LOCAL_EMBED_MODEL, threads=EMBED_THREADS, batch_size=EMBED_BATCH_SIZE):
+        self.model_name = model_name
+        self.threads = max(1, int(threads))
+        self.batch_size = max(1, int(batch_size))
+
+        model_dir = Path(model_name)
+        if (model_dir / "model.onnx").exists():
+            self.backend = "onnx"
+            self._load_onnx(model_dir)
+        else:
+            self.backend = "sentence-transformers"
+            self._load_sentence_transformers()
+
+    @property
+    def model_id(self):
+        """Identifier recorded in the index so mismatched providers are detected"""
+        return f"{self.backend}:{Path(self.model_name).name}"
+
+    def _load_onnx(self, model_dir):
+        try:
+            import onnxruntime as ort
+            from tokenizers import Tokenizer
+        except ImportError as e:
+            raise _require("ONNX", ["onnxruntime", "tokenizers"]) from e
+
+        options = ort.SessionOptions()
+        options.intra_op_num_threads = self.threads
+        options.inter_op_num_threads = 1
+        self._session = ort.InferenceSession(
+            str(model_dir / "model.onnx"),
+            sess_options=options,
+            providers=["CPUExecutionProvider"],
+        )
+        self._input_names = {i.name for i in self._session.get_inputs()}
+        self._tokenizer = Tokenizer.from_file(str(model_dir / "tokenizer.json"))
+        self._tokenizer.enable_truncation(max_length=256)
+        self._tokenizer.enable_padding()
+
+    def _load_sentence_transformers(self):
+        try:
+            import torch
+            from sentence_transformers import SentenceTransformer
+        except ImportError as e:
+            raise _require("sentence-transformers", ["sentence-transformers", "torch"]) from e
+
+        torch.set_num_threads(self.threads)
+        self._model = SentenceTransformer(self.model_name, device="cpu")
+
+    def _embed_batch(self, texts):
+        if self.backend == "sentence-transformers":
+            vectors = self._model.encode(
+                texts,
+                batch_size=self.batch_size,
+                normalize_embeddings=True,
+                show_progress_bar=False,
+            )
+            return vectors.tolist()
+
+        import numpy as np
+
+        encoded = self._tokenizer.encode_batch(texts)
+        input_ids = np.array([e.ids for e in encoded], dtype=np.int64)
+        attention_mask = np.array([e.attention_mask for e in encoded], dtype=np.int64)
+        feeds = {"input_ids": input_ids, "attention_mask": attention_mask}
+        if "token_type_ids" in self._input_names:
+            feeds["token_type_ids"] = np.zeros_like(input_ids)
+
+        token_embeddings = self._session.run(None, feeds)[0]
+
+        # Mean pooling over real tokens, then L2-normalise for cosine search
+        mask = attention_mask[..., None].astype(np.float32)
+        pooled = (token_embeddings * mask).sum(axis=1) / np.clip(mask.sum(axis=1), 1e-9, None)
+        pooled /= np.clip(np.linalg.norm(pooled, axis=1, keepdims=True), 1e-9, None)
+        return pooled.tolist()
+
+    def embed_documents(self, texts):
+        vectors = []
+        for start in range(0, len(texts), self.batch_size):
+            vectors.extend(self._embed_batch(list(texts[start:start + self.batch_size])))
+        return vectors
+
+    def embed_query(self, text):
+        return self._embed_batch([text])[0]
+
+
+class OllamaPoolEmbeddings(Embeddings):
+    """Ollama /api/embed client routed through the shared backend pool, so
+    embedding calls get least-loaded routing and per-backend circuit breakers
+    (an outage fails fast with CircuitOpenError instead of waiting)"""
+
+    def __init__(self, model=EMBED_MODEL, batch_size=EMBED_BATCH_SIZE, timeout=60):
+        self.model = model
+        self.batch_size = max(1, int(batch_size))
+        self.timeout = timeout
+
+    def _embed(self, texts):
+        from ollama_pool import get_pool
+        from ollama_warmup import KEEP_ALIVE
+
+        payload = {"model": self.model, "input": texts, "keep_alive": KEEP_ALIVE}
+        resp = get_pool().post("/api/embed", payload, timeout=self.timeout)
+        resp.raise_for_status()
+        return resp.json()["embeddings"]
+
+    def embed_documents(self, texts):
+        vectors = []
+        for start in range(0, len(texts), self.batch_size):
+            vectors.extend(self._embed(list(texts[start:start + self.batch_size])))
+        return vectors
+
+    def embed_query(self, text):
+        return self._embed([text])[0]
+
+
+def get_embeddings(provider=None):
+    """Return the configured embedding function (LangChain Embeddings interface)"""
+    provider = (provider or EMBED_PROVIDER).lower()
+
+    if provider == "local":
+        return LocalEmbeddings()
+    if provider == "ollama":
+        return OllamaPoolEmbeddings()
+
+    raise ValueError(f"Unknown EMBED_PROVIDER '{provider}' (expected 'ollama' or 'local')")
+
+
+_shared = None
+_shared_lock = threading.Lock()
+
+
+def shared_embeddings():
+    """Process-wide embeddings instance, so a local model is only loaded once"""
+    global _shared
+    if _shared is None:
+        with _shared_lock:
+            if _shared is None:
+                _shared = get_embeddings()
+    return _shared
+
+
+def embedding_model_id(embeddings):
+    """Stable '<provider>:<model>' id for any embeddings object we hand out"""
+    model_id = getattr(embeddings, "model_id", None)
+    if model_id:
+        return model_id
+    return f"ollama:{getattr(embeddings, 'model', EMBED_MODEL)}"
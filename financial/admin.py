@@ -1,3 +1,18 @@
 from django.contrib import admin
 
-# Register your models here.
+from .models import ChatEvent, PrecomputedAnswer
+
+
+@admin.register(PrecomputedAnswer)
+class PrecomputedAnswerAdmin(admin.ModelAdmin):
+    list_display = ('question', 'corpus_version', 'embedding_model', 'updated_at')
+    search_fields = ('question', 'answer')
+    list_filter = ('corpus_version', 'embedding_model')
+
+
+@admin.register(ChatEvent)
+class ChatEventAdmin(admin.ModelAdmin):
+    list_display = ('created_at', 'source', 'question', 'latency_ms', 'model', 'retrieval')
+    search_fields = ('question',)
+    list_filter = ('source', 'tier', 'retrieval', 'follow_up')
+    date_hierarchy = 'created_at'
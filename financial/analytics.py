@@ -0,0 +1,157 @@
+"""
+Write-behind log of chat requests (ChatEvent).
+
+chat_api never waits on the database for analytics. record() puts the event
+on a bounded in-memory queue and returns. A background thread writes the
+queue with bulk_create once it holds `batch_size` events, or every
+`flush_ms` milliseconds, whichever comes first.
+
+Under backpressure (the queue is full, or the database is unavailable)
+events are appended to a JSONL spill file when `spill_path` is set, and
+dropped otherwise. The writer re-imports spilled events once the queue is
+idle again. The counters in snapshot() show how many events were written,
+spilled and dropped. `manage.py chat_stats` reports on the table.
+"""
+import atexit
+import hashlib
+import json
+import logging
+import os
+import queue
+import threading
+import time
+from datetime import datetime, timezone
+
+from .singleflight import normalize_text
+
+logger = logging.getLogger(__name__)
+
+
+def question_hash(question):
+    return hashlib.sha1(normalize_text(question).encode('utf-8')).hexdigest()[:16]
+
+
+class EventLogger:
+    def __init__(self, batch_size=100, flush_ms=2000, max_queue=10000, spill_path=None):
+        self.batch_size = max(1, batch_size)
+        self.flush_interval = max(0.05, flush_ms / 1000.0)
+        self.spill_path = str(spill_path) if spill_path else None
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._spill_lock = threading.Lock()
+        self._lock = threading.Lock()
+        self._pid = None
+        self.stats = {'queued': 0, 'written': 0, 'spilled': 0, 'dropped': 0, 'reloaded': 0, 'batches': 0}
+
+    def record(self, **fields):
+        """Queue one event (never blocks)."""
+        fields.setdefault('created_at', datetime.now(timezone.utc).isoformat())
+        fields['question'] = (fields.get('question') or '')[:2000]
+        fields.setdefault('question_hash', question_hash(fields['question']))
+        try:
+            self._queue.put_nowait(fields)
+            self.stats['queued'] += 1
+        except queue.Full:
+            self._spill([fields])
+
+    def _spill(self, events):
+        if not self.spill_path:
+            self.stats['dropped'] += len(events)
+            return
+        try:
+            with self._spill_lock, open(self.spill_path, 'a', encoding='utf-8') as f:
+                for event in events:
+                    f.write(json.dumps(event, ensure_ascii=False) + '\n')
+            self.stats['spilled'] += len(events)
+        except OSError as e:
+            logger.warning('Could not spill %d chat events: %s', len(events), str(e))
+            self.stats['dropped'] += len(events)
+
+    def _write(self, events):
+        from django.db import close_old_connections
+
+        from .models import ChatEvent
+
+        try:
+            ChatEvent.objects.bulk_create([
+                ChatEvent(**{**event, 'created_at': datetime.fromisoformat(event['created_at'])})
+                for event in events
+            ])
+            self.stats['written'] += len(events)
+            self.stats['batches'] += 1
+            return True
+        except Exception as e:
+            logger.warning('Writing %d chat events failed: %s', len(events), str(e))
+            close_old_connections()
+            self._spill(events)
+            return False
+
+    def _reload_spill(self):
+        """Feed spilled events back in once the database keeps up again."""
+        if not self.spill_path or not os.path.exists(self.spill_path):
+            return
+        claimed = f'{self.spill_path}.{os.getpid()}.loading'
+        try:
+            with self._spill_lock:
+                os.replace(self.spill_path, claimed)
+        except OSError:
+            return  # another worker claimed it
+        events = []
+        with open(claimed, encoding='utf-8') as f:
+            for line in f:
+                try:
+                    events.append(json.loads(line))
+                except ValueError:
+                    continue
+        os.remove(claimed)
+        self.stats['reloaded'] += len(events)
+        self.stats['spilled'] -= min(self.stats['spilled'], len(events))
+        for start in range(0, len(events), self.batch_size):
+            if not self._write(events[start:start + self.batch_size]):
+                break
+
+    def flush(self):
+        """Write everything queued right now (used at exit and by the writer loop)."""
+        batch = []
+        while True:
+            try:
+                batch.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+            if len(batch) >= self.batch_size:
+                self._write(batch)
+                batch = []
+        if batch:
+            self._write(batch)
+
+    def _loop(self):
+        reload_after = time.monotonic() + 30
+        while True:
+            batch = []
+            deadline = time.monotonic() + self.flush_interval
+            while len(batch) < self.batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self._queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+            if batch:
+                self._write(batch)
+            elif time.monotonic() >= reload_after:
+                reload_after = time.monotonic() + 30
+                self._reload_spill()
+
+    def ensure_started(self):
+        """Start the writer thread in this process once (keyed by pid, so
+        forked gunicorn workers each get their own; see financial.startup.start_serving)"""
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+        threading.Thread(target=self._loop, name='chat-analytics-writer', daemon=True).start()
+        atexit.register(self.flush)
+
+    def snapshot(self):
+        return dict(self.stats, pending=self._queue.qsize(), batch_size=self.batch_size,
+                    flush_ms=int(self.flush_interval * 1000), spill_path=self.spill_path)
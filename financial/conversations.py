@@ -0,0 +1,159 @@
+"""
+Bounded in-memory conversation sessions for multi-turn chat.
+
+Each session keeps its recent turns, a running summary of older turns once
+the history outgrows CHAT_HISTORY_TOKEN_BUDGET, and the `context` token array
+Ollama returned for the last generation. Passing that array back lets Ollama
+continue from the already-evaluated prefix (system prompt + earlier turns)
+instead of re-processing it, which is where most of a follow-up's prompt
+evaluation time goes.
+
+Sessions are evicted after CHAT_SESSION_IDLE_SECONDS of inactivity, and the
+least recently used ones are dropped when the store exceeds its session
+count or byte cap.
+"""
+import re
+import threading
+import time
+import uuid
+from array import array
+from collections import OrderedDict
+
+_SENTENCE_END = re.compile(r'(?<=[.!?])\s')
+
+
+def estimate_tokens(text):
+    """Rough token count (about four characters per token for English)."""
+    return len(text) // 4 + 1
+
+
+def first_sentence(text, limit=160):
+    text = ' '.join(text.split())
+    sentence = _SENTENCE_END.split(text, maxsplit=1)[0]
+    return sentence if len(sentence) <= limit else sentence[:limit].rstrip() + '...'
+
+
+class Conversation:
+    def __init__(self, session_id):
+        self.session_id = session_id
+        self.turns = []          # [(role, text)], oldest first
+        self.summary = ''
+        self.ollama_context = None  # array('i') of prompt tokens, valid for ollama_model
+        self.ollama_model = None
+        self.last_used = time.monotonic()
+        self.lock = threading.Lock()
+
+    def history_tokens(self):
+        return estimate_tokens(self.summary) + sum(estimate_tokens(t) for _, t in self.turns)
+
+    def size_bytes(self):
+        text = len(self.summary) + sum(len(t) for _, t in self.turns)
+        tokens = self.ollama_context.itemsize * len(self.ollama_context) if self.ollama_context else 0
+        return text + tokens
+
+    def reusable_context(self, model):
+        """Ollama token context to continue from, if it was produced by `model`."""
+        if self.ollama_context and self.ollama_model == model:
+            return self.ollama_context.tolist()
+        return None
+
+    def history_text(self):
+        """Summary plus recent turns, for prompts that cannot reuse a token context."""
+        parts = []
+        if self.summary:
+            parts.append(f"Earlier in this conversation: {self.summary}")
+        for role, text in self.turns:
+            parts.append(f"{'User' if role == 'user' else 'Assistant'}: {text}")
+        return '\n'.join(parts)
+
+    def record(self, user_message, reply, model=None, ollama_context=None,
+               token_budget=1500, max_context_tokens=4096):
+        self.turns.append(('user', user_message))
+        self.turns.append(('assistant', reply))
+
+        if ollama_context and len(ollama_context) <= max_context_tokens:
+            self.ollama_context = array('i', ollama_context)
+            self.ollama_model = model
+        else:
+            # Too long to keep re-feeding (or none returned): fall back to text history
+            self.ollama_context = None
+            self.ollama_model = None
+
+        # Fold the oldest exchanges into the summary until we fit the budget
+        while self.history_tokens() > token_budget and len(self.turns) > 2:
+            (_, question), (_, answer) = self.turns[0], self.turns[1]
+            del self.turns[:2]
+            note = f"asked \"{first_sentence(question, 100)}\" - answered: {first_sentence(answer)}"
+            self.summary = f"{self.summary} {note}".strip()
+            if estimate_tokens(self.summary) > token_budget // 2:
+                self.summary = self.summary[-(token_budget // 2) * 4:]
+            # The summarised prompt no longer matches the cached token prefix
+            self.ollama_context = None
+            self.ollama_model = None
+
+
+class ConversationStore:
+    def __init__(self, max_sessions=500, idle_seconds=1800, max_bytes=32 * 1024 * 1024,
+                 token_budget=1500, max_context_tokens=4096):
+        self.max_sessions = max_sessions
+        self.idle_seconds = idle_seconds
+        self.max_bytes = max_bytes
+        self.token_budget = token_budget
+        self.max_context_tokens = max_context_tokens
+        self._lock = threading.Lock()
+        self._sessions = OrderedDict()  # least recently used first
+        self.evicted = 0
+
+    def get(self, session_id=None):
+        """Return (conversation, created) - unknown or missing ids start a new session."""
+        now = time.monotonic()
+        with self._lock:
+            self._evict_idle(now)
+            conversation = self._sessions.get(session_id) if session_id else None
+            created = conversation is None
+            if created:
+                conversation = Conversation(uuid.uuid4().hex)
+                self._sessions[conversation.session_id] = conversation
+            else:
+                self._sessions.move_to_end(session_id)
+            conversation.last_used = now
+            self._enforce_caps()
+            return conversation, created
+
+    def peek(self, session_id):
+        """The live conversation for session_id, or None - never creates or touches one."""
+        with self._lock:
+            return self._sessions.get(session_id) if session_id else None
+
+    def record(self, conversation, user_message, reply, model=None, ollama_context=None):
+        with conversation.lock:
+            conversation.record(user_message, reply, model, ollama_context,
+                                token_budget=self.token_budget,
+                                max_context_tokens=self.max_context_tokens)
+        with self._lock:
+            self._enforce_caps()
+
+    def _evict_idle(self, now):
+        while self._sessions:
+            session_id, oldest = next(iter(self._sessions.items()))
+            if now - oldest.last_used < self.idle_seconds:
+                break
+            del self._sessions[session_id]
+            self.evicted += 1
+
+    def _enforce_caps(self):
+        total = sum(c.size_bytes() for c in self._sessions.values())
+        while len(self._sessions) > 1 and (len(self._sessions) > self.max_sessions or total > self.max_bytes):
+            _, dropped = self._sessions.popitem(last=False)
+            total -= dropped.size_bytes()
+            self.evicted += 1
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                'sessions': len(self._sessions),
+                'bytes': sum(c.size_bytes() for c in self._sessions.values()),
+                'evicted': self.evicted,
+                'max_sessions': self.max_sessions,
+                'max_bytes': self.max_bytes,
+            }
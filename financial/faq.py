@@ -0,0 +1,103 @@
+"""
+Precomputed FAQ answers.
+
+`manage.py precompute_faqs` answers canonical questions off the request path;
+chat_api asks `faq_index.match()` first and only generates live when no
+stored question is similar enough. Answers are stamped with the corpus
+version and embedding model, so editing the CSV or switching providers
+simply stops them matching until they are recomputed.
+"""
+import logging
+import threading
+import time
+from dataclasses import dataclass
+
+from django.conf import settings
+
+from corpus import corpus_version
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class FAQMatch:
+    question: str
+    answer: str
+    score: float
+
+
+class FAQIndex:
+    """In-memory matrix of precomputed question embeddings, reloaded periodically."""
+
+    def __init__(self, threshold=None, reload_seconds=None):
+        self.threshold = settings.FAQ_MATCH_THRESHOLD if threshold is None else threshold
+        self.reload_seconds = settings.FAQ_RELOAD_SECONDS if reload_seconds is None else reload_seconds
+        self._lock = threading.Lock()
+        self._loaded_at = None
+        self._questions = []
+        self._answers = []
+        self._matrix = None
+
+    def _load(self):
+        import numpy as np
+        from embeddings import embedding_model_id, shared_embeddings
+        from .models import PrecomputedAnswer
+
+        rows = list(
+            PrecomputedAnswer.objects
+            .filter(corpus_version=corpus_version(),
+                    embedding_model=embedding_model_id(shared_embeddings()))
+            .values_list('question', 'answer', 'embedding')
+        )
+        self._questions = [r[0] for r in rows]
+        self._answers = [r[1] for r in rows]
+        if rows:
+            matrix = np.asarray([r[2] for r in rows], dtype=np.float32)
+            matrix /= np.clip(np.linalg.norm(matrix, axis=1, keepdims=True), 1e-9, None)
+            self._matrix = matrix
+        else:
+            self._matrix = None
+        self._loaded_at = time.monotonic()
+        logger.info('Loaded %d precomputed FAQ answers', len(rows))
+
+    def refresh(self, force=False):
+        with self._lock:
+            stale = self._loaded_at is None or time.monotonic() - self._loaded_at > self.reload_seconds
+            if force or stale:
+                self._load()
+
+    def has_answers(self):
+        """Whether any answers are loaded; without them match() never needs an embedding"""
+        try:
+            self.refresh()
+        except Exception as e:
+            logger.warning('FAQ reload failed: %s', str(e))
+        return self._matrix is not None
+
+    def match(self, question, vector=None):
+        """Return the closest FAQMatch at or above the threshold, else None.
+        Pass `vector` when the question has already been embedded."""
+        try:
+            self.refresh()
+            if self._matrix is None:
+                # Nothing precomputed: don't pay for a query embedding
+                return None
+
+            import numpy as np
+            from embeddings import shared_embeddings
+
+            if vector is None:
+                vector = shared_embeddings().embed_query(question)
+            query = np.array(vector, dtype=np.float32)
+            query /= max(float(np.linalg.norm(query)), 1e-9)
+            scores = self._matrix @ query
+            best = int(np.argmax(scores))
+            if scores[best] < self.threshold:
+                return None
+            return FAQMatch(self._questions[best], self._answers[best], float(scores[best]))
+        except Exception as e:
+            logger.warning('FAQ lookup failed: %s', str(e))
+            return None
+
+
+faq_index = FAQIndex()
@@ -0,0 +1,76 @@
+"""
+Build (or check) the prebuilt vector index artifact.
+
+Usage:
+  python manage.py build_index                       # embed the corpus -> finguide_index.fgix
+  python manage.py build_index --output /srv/idx.fgix
+  python manage.py build_index --check               # exit 1 if missing or stale
+
+Embeds every non-empty corpus row with the configured embedding provider
+and writes one artifact file (see index_artifact.py), stamped with the
+corpus hash, embedding-model id and chunking. Near-duplicate rows (above
+DEDUP_THRESHOLD, or --dedup-threshold) are embedded once. The Dockerfile runs this at image build
+time, so containers boot with the index already built instead of embedding
+the corpus on their first request.
+"""
+import time
+from pathlib import Path
+
+from django.core.management.base import BaseCommand, CommandError
+
+from corpus import DEDUP_THRESHOLD, chunking_id, corpus_version, get_corpus
+from index_artifact import DEFAULT_PATH, StaleArtifactError, load_artifact, write_artifact
+
+
+class Command(BaseCommand):
+    help = 'Embed the corpus into a versioned, memory-mappable index artifact'
+    # Don't import views (and with them the retriever we're about to replace)
+    requires_system_checks = []
+
+    def add_arguments(self, parser):
+        parser.add_argument('--output', default=str(DEFAULT_PATH), help='Artifact path')
+        parser.add_argument('--check', action='store_true',
+                            help='Only verify the artifact matches the current corpus and embeddings')
+        parser.add_argument('--batch-size', type=int, default=256, help='Rows embedded per call')
+        parser.add_argument('--dedup-threshold', type=float, default=DEDUP_THRESHOLD,
+                            help='Fold rows at least this similar into one chunk (0 disables)')
+
+    def handle(self, *args, **options):
+        from embeddings import embedding_model_id, shared_embeddings
+
+        path = Path(options['output'])
+        embeddings = shared_embeddings()
+        model_id = embedding_model_id(embeddings)
+        version = corpus_version()
+        chunking = chunking_id(options['dedup_threshold'])
+
+        if options['check']:
+            if not path.exists():
+                raise CommandError(f'{path} does not exist')
+            try:
+                artifact = load_artifact(path, version, model_id, chunking)
+            except StaleArtifactError as e:
+                raise CommandError(f'{path} is stale: {e}')
+            self.stdout.write(self.style.SUCCESS(
+                f"{path} is current ({artifact.header['count']} chunks, corpus {version}, {model_id})"))
+            return
+
+        corpus = get_corpus()
+        chunks = corpus.chunks(options['dedup_threshold'])
+        folded = sum(len(c.get('duplicates', ())) for c in chunks)
+        if folded:
+            self.stdout.write(f'🧹 Folded {folded} near-duplicate rows into '
+                              f'{sum(1 for c in chunks if "duplicates" in c)} canonical chunks')
+        self.stdout.write(f'📚 Embedding {len(chunks)} chunks with {model_id} (corpus {version}, {chunking})...')
+        started = time.monotonic()
+        vectors = []
+        batch_size = max(1, options['batch_size'])
+        for start in range(0, len(chunks), batch_size):
+            vectors.extend(embeddings.embed_documents([c['text'] for c in chunks[start:start + batch_size]]))
+            self.stdout.write(f'  {min(start + batch_size, len(chunks))}/{len(chunks)}', ending='\r')
+        self.stdout.write('')
+
+        write_artifact(path, vectors, chunks, version, model_id, chunking)
+        size_mb = path.stat().st_size / (1024 * 1024)
+        self.stdout.write(self.style.SUCCESS(
+            f'✅ Wrote {path} ({size_mb:.1f} MB) in {time.monotonic() - started:.1f}s'))
@@ -0,0 +1,104 @@
+"""
+Summarise the chat analytics log (ChatEvent).
+
+Usage:
+  python manage.py chat_stats                       # last 7 days
+  python manage.py chat_stats --days 30 --top 30
+  python manage.py chat_stats --min-count 5 --write-faqs faqs.txt
+
+Reports requests per answering branch with latency percentiles, how
+retrieval was served (prefetched, cached or computed), the most frequent
+questions, and cache-hit candidates. Those are questions asked at least
+--min-count times that still went to the LLM, ranked by the generation time
+they cost. Feed --write-faqs output to `precompute_faqs --questions`.
+"""
+from collections import Counter, defaultdict
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.db.models import Count
+from django.utils import timezone
+
+from financial.models import ChatEvent
+
+
+def percentile(values, p):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(p / 100 * (len(values) - 1))))]
+
+
+class Command(BaseCommand):
+    help = 'Top questions, latency percentiles and FAQ/cache candidates from the chat log'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=float, default=7, help='Look back this many days (0 = all)')
+        parser.add_argument('--top', type=int, default=20, help='Questions to list')
+        parser.add_argument('--min-count', type=int, default=3,
+                            help='Repeats before a question counts as a cache candidate')
+        parser.add_argument('--write-faqs', help='Write cache-candidate questions, one per line')
+
+    def handle(self, *args, **options):
+        events = ChatEvent.objects.all()
+        if options['days']:
+            events = events.filter(created_at__gte=timezone.now() - timedelta(days=options['days']))
+        total = events.count()
+        if not total:
+            self.stdout.write('No chat events recorded yet.')
+            return
+        span = f"last {options['days']:g} days" if options['days'] else 'all time'
+        self.stdout.write(self.style.MIGRATE_HEADING(f'{total} chat requests ({span})'))
+
+        latencies = defaultdict(list)
+        retrieval = Counter()
+        by_question = defaultdict(list)  # hash -> [latency of LLM-answered repeats]
+        for source, retrieved, latency, qhash in events.values_list(
+                'source', 'retrieval', 'latency_ms', 'question_hash').iterator():
+            latencies[source].append(latency)
+            if retrieved:
+                retrieval[retrieved] += 1
+            if source in ('llm', 'stream'):
+                by_question[qhash].append(latency)
+
+        self.stdout.write(f"\n  {'source':<16}{'count':>8}{'share':>8}{'p50 ms':>10}{'p90 ms':>10}{'p99 ms':>10}")
+        for source, values in sorted(latencies.items(), key=lambda item: -len(item[1])):
+            self.stdout.write(
+                f'  {source:<16}{len(values):>8}{len(values) / total:>8.1%}'
+                f'{percentile(values, 50):>10.0f}{percentile(values, 90):>10.0f}{percentile(values, 99):>10.0f}')
+
+        if retrieval:
+            retrieved = sum(retrieval.values())
+            self.stdout.write(self.style.MIGRATE_HEADING('\nRetrieval'))
+            for how, label in (('token', 'prefetched while typing'), ('query', 'cached query'),
+                               ('computed', 'computed on submit')):
+                self.stdout.write(f'  {label:<26}{retrieval[how]:>8}{retrieval[how] / retrieved:>8.1%}')
+
+        top = (events.values('question_hash').annotate(n=Count('id')).order_by('-n')[:options['top']])
+        examples = dict(ChatEvent.objects.filter(question_hash__in=[row['question_hash'] for row in top])
+                        .values_list('question_hash', 'question'))
+        self.stdout.write(self.style.MIGRATE_HEADING('\nTop questions'))
+        for row in top:
+            self.stdout.write(f"  {row['n']:>6}  {examples.get(row['question_hash'], '')[:90]}")
+
+        candidates = sorted(
+            ((qhash, len(values), sum(values)) for qhash, values in by_question.items()
+             if len(values) >= options['min_count']),
+            key=lambda item: -item[2],
+        )
+        candidate_questions = dict(ChatEvent.objects.filter(question_hash__in=[c[0] for c in candidates])
+                                   .values_list('question_hash', 'question'))
+        self.stdout.write(self.style.MIGRATE_HEADING(
+            f"\nCache candidates (asked {options['min_count']}+ times, answered by the LLM)"))
+        if not candidates:
+            self.stdout.write('  none')
+        for qhash, count, spent_ms in candidates[:options['top']]:
+            self.stdout.write(f'  {count:>6}x  {spent_ms / 1000:>8.1f}s generating  '
+                              f'{candidate_questions.get(qhash, "")[:70]}')
+
+        if options['write_faqs']:
+            with open(options['write_faqs'], 'w', encoding='utf-8') as f:
+                for qhash, _, _ in candidates:
+                    f.write(candidate_questions[qhash].replace('\n', ' ') + '\n')
+            self.stdout.write(self.style.SUCCESS(
+                f"\n✅ Wrote {len(candidates)} questions to {options['write_faqs']}"))
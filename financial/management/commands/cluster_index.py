@@ -0,0 +1,129 @@
+"""
+Build or update the clustering used for two-stage search.
+
+Usage:
+  python manage.py cluster_index                           # cluster finguide_index.fgix -> .fgix.ivf
+  python manage.py cluster_index --clusters 512 --iterations 30
+  python manage.py cluster_index --add new_passages.jsonl  # insert without re-clustering
+  python manage.py cluster_index --stats --nprobe 1,4,16   # recall vs brute force per nprobe
+
+Clusters the artifact's vectors with spherical k-means and writes the
+sidecar next to it (see cluster_index.py). The retriever loads it on boot
+and searches with RETRIEVAL_NPROBE. --add embeds new passages ({"text",
+optional "id"} per line, or plain lines) and inserts each into its nearest
+cluster. Re-run without --add when --stats shows the clusters have become
+unbalanced.
+"""
+import json
+import time
+from pathlib import Path
+
+import numpy as np
+from django.core.management.base import BaseCommand, CommandError
+
+from cluster_index import HierarchicalIndex, default_clusters, load_hierarchical, sidecar_path
+from corpus import DEDUP_THRESHOLD, chunking_id, corpus_version
+from index_artifact import DEFAULT_PATH, StaleArtifactError, load_artifact
+
+
+def read_passages(path):
+    passages = []
+    with open(path, encoding='utf-8') as f:
+        for number, line in enumerate(f, 1):
+            line = line.strip()
+            if not line:
+                continue
+            item = json.loads(line) if line.startswith('{') else {'text': line}
+            if item.get('text'):
+                passages.append({'id': str(item.get('id') or f'{Path(path).stem}-{number}'),
+                                 'text': item['text'], 'row_index': None})
+    return passages
+
+
+class Command(BaseCommand):
+    help = 'Cluster the index artifact for two-stage search, or insert passages into the clustering'
+    # Don't import views (and with them the retriever we're about to change)
+    requires_system_checks = []
+
+    def add_arguments(self, parser):
+        parser.add_argument('--artifact', default=str(DEFAULT_PATH), help='Artifact path')
+        parser.add_argument('--clusters', type=int, help='Number of clusters (default about 4*sqrt(N))')
+        parser.add_argument('--iterations', type=int, default=20, help='k-means iterations')
+        parser.add_argument('--add', help='Passages to insert (JSONL with "text", or one per line)')
+        parser.add_argument('--stats', action='store_true', help='Report cluster balance and recall only')
+        parser.add_argument('--nprobe', default='1,4,8,16', help='Comma-separated nprobe values for --stats')
+        parser.add_argument('--queries', type=int, default=200, help='Sample queries for the recall check')
+        parser.add_argument('--k', type=int, default=10, help='k for the recall check')
+
+    def handle(self, *args, **options):
+        from embeddings import embedding_model_id, shared_embeddings
+
+        path = Path(options['artifact'])
+        embeddings = shared_embeddings()
+        try:
+            artifact = load_artifact(path, corpus_version(), embedding_model_id(embeddings),
+                                     chunking_id(DEDUP_THRESHOLD))
+        except FileNotFoundError:
+            raise CommandError(f'{path} does not exist; run build_index first')
+        except StaleArtifactError as e:
+            raise CommandError(f'{path} is stale ({e}); run build_index first')
+
+        if options['stats'] or options['add']:
+            index = load_hierarchical(artifact)
+            if index is None:
+                raise CommandError(f'No clustering for {path}; run cluster_index without --add/--stats')
+        else:
+            clusters = options['clusters'] or default_clusters(len(artifact.vectors))
+            self.stdout.write(f'🧮 Clustering {len(artifact.vectors)} vectors into {clusters} clusters...')
+            started = time.monotonic()
+            index = HierarchicalIndex.build(artifact, clusters, options['iterations'])
+            index.save(sidecar_path(path))
+            self.stdout.write(self.style.SUCCESS(
+                f'✅ Wrote {sidecar_path(path)} in {time.monotonic() - started:.1f}s'))
+
+        if options['add']:
+            try:
+                passages = read_passages(options['add'])
+            except (OSError, ValueError) as e:
+                raise CommandError(f"Can't read {options['add']}: {e}")
+            if not passages:
+                raise CommandError(f"No passages in {options['add']}")
+            vectors = embeddings.embed_documents([p['text'] for p in passages])
+            index.add(vectors, passages)
+            index.save(sidecar_path(path))
+            self.stdout.write(self.style.SUCCESS(f'✅ Inserted {len(passages)} passages'))
+
+        self.report(index, options)
+
+    def report(self, index, options):
+        stats = index.stats()
+        self.stdout.write(
+            f"  {stats['passages']} passages ({stats['inserted']} inserted), {stats['clusters']} clusters, "
+            f"mean {stats['mean_cluster']:.0f} / max {stats['max_cluster']} per cluster "
+            f"(imbalance {stats['imbalance']})")
+        if stats['imbalance'] > 10:
+            self.stdout.write(self.style.WARNING('⚠️  Clusters are unbalanced; consider re-clustering'))
+
+        try:
+            nprobes = sorted({int(n) for n in options['nprobe'].split(',')})
+        except ValueError:
+            raise CommandError('--nprobe must be comma-separated integers')
+        # Perturbed copies of random passages stand in for queries
+        rng = np.random.default_rng(0)
+        rows = rng.choice(len(index), min(options['queries'], len(index)), replace=False)
+        queries = index.vectors_for(rows)
+        queries = queries + rng.normal(0, 0.05, queries.shape).astype(np.float32)
+        k = options['k']
+
+        started = time.perf_counter()
+        exact = [set(index.search(q, k, nprobe=len(index.centroids))[0]) for q in queries]
+        brute_ms = (time.perf_counter() - started) * 1000 / len(queries)
+        self.stdout.write(f"\n  {'nprobe':>8}{'recall@' + str(k):>12}{'scanned':>10}{'ms/query':>10}")
+        self.stdout.write(f"  {'all':>8}{1.0:>12.3f}{len(index):>10}{brute_ms:>10.2f}")
+        for nprobe in nprobes:
+            started = time.perf_counter()
+            found = [set(index.search(q, k, nprobe=nprobe)[0]) for q in queries]
+            elapsed_ms = (time.perf_counter() - started) * 1000 / len(queries)
+            recall = np.mean([len(a & b) / max(len(b), 1) for a, b in zip(found, exact)])
+            scanned = int(stats['mean_cluster'] * min(nprobe, stats['clusters']))
+            self.stdout.write(f'  {nprobe:>8}{recall:>12.3f}{scanned:>10}{elapsed_ms:>10.2f}')
@@ -0,0 +1,111 @@
+"""
+Compare retrieval backends on quality and latency.
+
+Usage:
+  python manage.py evaluate_retrieval --labels eval/questions.jsonl
+  python manage.py evaluate_retrieval --synthesize 300 --k 1,3,5,10
+  python manage.py evaluate_retrieval --backends keyword,artifact --save eval/current.json
+  python manage.py evaluate_retrieval --backends artifact,ivf --nprobe 1,4,16   # two-stage recall/latency
+  python manage.py evaluate_retrieval --labels q.jsonl --baseline eval/main.json   # exit 1 on regression
+
+Runs every selected backend (keyword search from simple_fallback, the
+prebuilt index artifact, the Chroma store) at each k and prints recall@k,
+MRR, nDCG@k, p50/p99 latency and memory as one table (see retrieval_eval.py).
+With --baseline it also compares against a saved run. It fails when a
+configuration loses on quality (nDCG or recall) or slows p50 by more than
+--latency-tolerance, so an index change only ships when it wins on both.
+"""
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+
+import retrieval_eval
+
+
+class Command(BaseCommand):
+    help = 'Evaluate retrieval backends: recall@k, MRR, nDCG, latency and memory'
+    # Backends are built on demand; don't import views (and the default retriever) first
+    requires_system_checks = []
+
+    def add_arguments(self, parser):
+        parser.add_argument('--labels', help='Labeled JSONL: {"question", "relevant": [rows]} per line')
+        parser.add_argument('--synthesize', type=int, default=200,
+                            help='Without --labels, generate this many known-item questions')
+        parser.add_argument('--seed', type=int, default=0, help='Seed for --synthesize')
+        parser.add_argument('--write-labels', help='Save the question set used (e.g. to hand-edit it)')
+        parser.add_argument('--backends', default=','.join(retrieval_eval.BACKENDS),
+                            help='Comma-separated backends (default: all registered)')
+        parser.add_argument('--k', default='1,3,5,10', help='Comma-separated k values to sweep')
+        parser.add_argument('--artifact', help='Index artifact for the artifact backend')
+        parser.add_argument('--nprobe', help='Comma-separated cluster counts to sweep for the ivf backend')
+        parser.add_argument('--save', help='Write the results as JSON (a future --baseline)')
+        parser.add_argument('--baseline', help='Compare against results saved with --save')
+        parser.add_argument('--latency-tolerance', type=float, default=0.10,
+                            help='Allowed p50 slowdown vs the baseline (fraction)')
+
+    def handle(self, *args, **options):
+        backends = [b.strip() for b in options['backends'].split(',') if b.strip()]
+        unknown = [b for b in backends if b not in retrieval_eval.BACKENDS]
+        if unknown:
+            raise CommandError(f"Unknown backend(s) {', '.join(unknown)}; "
+                               f"available: {', '.join(retrieval_eval.BACKENDS)}")
+        try:
+            ks = sorted({int(k) for k in options['k'].split(',')})
+            nprobes = sorted({int(n) for n in options['nprobe'].split(',')}) if options['nprobe'] else []
+        except ValueError:
+            raise CommandError('--k and --nprobe must be comma-separated integers')
+
+        if options['labels']:
+            try:
+                labels = retrieval_eval.load_labels(options['labels'])
+            except (OSError, ValueError, KeyError) as e:
+                raise CommandError(f"Can't read {options['labels']}: {e}")
+            source = options['labels']
+        else:
+            labels = retrieval_eval.synthesize(options['synthesize'], seed=options['seed'])
+            source = f'{len(labels)} synthesized known-item questions (seed {options["seed"]})'
+        if not labels:
+            raise CommandError('No questions to evaluate')
+        if options['write_labels']:
+            with open(options['write_labels'], 'w') as f:
+                for label in labels:
+                    f.write(json.dumps(label, ensure_ascii=False) + '\n')
+
+        self.stdout.write(f'📏 Evaluating {", ".join(backends)} at k={ks} on {source}\n')
+        variants = {'ivf': [{'nprobe': n} for n in nprobes]} if nprobes else None
+        results, skipped = retrieval_eval.run(labels, backends, ks, variants, artifact_path=options['artifact'])
+        for name, reason in skipped.items():
+            self.stdout.write(self.style.WARNING(f'⚠️  Skipped {name}: {reason}'))
+        if not results:
+            raise CommandError('No backend could be evaluated')
+
+        self.stdout.write(retrieval_eval.format_table(results))
+
+        if options['save']:
+            with open(options['save'], 'w') as f:
+                json.dump({'labels': source, 'results': results}, f, indent=2)
+            self.stdout.write(f"\n💾 Saved results to {options['save']}")
+
+        if options['baseline']:
+            self.compare(results, options['baseline'], options['latency_tolerance'])
+
+    def compare(self, results, path, tolerance):
+        try:
+            with open(path) as f:
+                baseline = json.load(f)['results']
+        except (OSError, ValueError, KeyError) as e:
+            raise CommandError(f"Can't read baseline {path}: {e}")
+
+        rows = retrieval_eval.compare(results, baseline, tolerance)
+        self.stdout.write(self.style.MIGRATE_HEADING(f'\nAgainst {path}'))
+        for result, base, wins in rows:
+            mark = '✅' if wins else '❌'
+            self.stdout.write(
+                f"  {mark} {result['backend']:<16} k={result['k']:<3}"
+                f" nDCG {result['ndcg'] - base['ndcg']:+.3f}"
+                f"  recall {result['recall'] - base['recall']:+.3f}"
+                f"  p50 {result['p50_ms'] - base['p50_ms']:+.2f} ms")
+        if not rows:
+            self.stdout.write('  (no configurations in common)')
+        if any(not wins for _, _, wins in rows):
+            raise CommandError('Retrieval regressed against the baseline')
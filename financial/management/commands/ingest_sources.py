@@ -0,0 +1,70 @@
+"""
+Ingest extra knowledge sources into per-collection index shards.
+
+Usage:
+  python manage.py ingest_sources                         # knowledge/ -> shards/
+  python manage.py ingest_sources --workers 4 --force
+  python manage.py ingest_sources --collections retirement,taxes
+  python manage.py ingest_sources --list
+
+Each subdirectory (or loose file) of KNOWLEDGE_DIR is a collection of CSV,
+.txt and .md files. Collections are parsed, chunked and embedded in parallel
+worker processes into SHARD_DIR/<collection>.fgix (see knowledge_sources.py).
+A collection whose files haven't changed since its shard was built is
+skipped, and shards whose sources are gone are removed. Restart the app to
+pick up new shards.
+"""
+from pathlib import Path
+
+from django.core.management.base import BaseCommand, CommandError
+
+from knowledge_sources import KNOWLEDGE_DIR, SHARD_DIR, discover, ingest, parse_collections
+
+
+class Command(BaseCommand):
+    help = 'Parse, chunk and embed knowledge sources into one index shard per collection'
+    # Don't import views (and with them the retriever)
+    requires_system_checks = []
+
+    def add_arguments(self, parser):
+        parser.add_argument('--source-dir', default=str(KNOWLEDGE_DIR), help='Knowledge source directory')
+        parser.add_argument('--output', default=str(SHARD_DIR), help='Shard directory')
+        parser.add_argument('--workers', type=int, help='Worker processes (default: CPU count)')
+        parser.add_argument('--collections', help='Only (re)build these collections (comma-separated)')
+        parser.add_argument('--force', action='store_true', help='Rebuild shards even if current')
+        parser.add_argument('--keep', action='store_true', help="Don't remove shards whose sources are gone")
+        parser.add_argument('--list', action='store_true', help='List collections and their files only')
+
+    def handle(self, *args, **options):
+        source_dir = Path(options['source_dir'])
+        if not source_dir.is_dir():
+            raise CommandError(f'{source_dir} does not exist')
+        collections = discover(source_dir)
+        if options['list']:
+            for name, files in collections.items():
+                self.stdout.write(f'  {name:<24}{len(files):>4} files')
+            return
+        if not collections:
+            self.stdout.write(f'No CSV, text or markdown sources under {source_dir}')
+
+        only = parse_collections(options['collections'])
+        if only and set(only) - set(collections):
+            raise CommandError(f"No sources for {', '.join(sorted(set(only) - set(collections)))}")
+
+        self.stdout.write(f'📚 Ingesting {len(only or collections)} collections from {source_dir}...')
+        results = ingest(source_dir, options['output'], options['workers'], options['force'], only,
+                         prune=not options['keep'], on_result=self.report)
+        failed = [r for r in results if r['status'] == 'failed']
+        if failed:
+            raise CommandError(f"{len(failed)} collection(s) failed: {', '.join(r['collection'] for r in failed)}")
+        self.stdout.write(self.style.SUCCESS(f"✅ Shards in {options['output']} are current"))
+
+    def report(self, result):
+        status = result['status']
+        if status == 'built':
+            self.stdout.write(f"  ✅ {result['collection']:<24}{result['files']:>4} files "
+                              f"{result['chunks']:>7} chunks  {result['seconds']:.1f}s")
+        elif status == 'failed':
+            self.stdout.write(self.style.ERROR(f"  ❌ {result['collection']:<24}{result['error']}"))
+        else:
+            self.stdout.write(f"  ·  {result['collection']:<24}{status}")
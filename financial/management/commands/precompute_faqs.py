@@ -0,0 +1,135 @@
+"""
+Answer canonical FAQs offline so chat_api can serve them without generating.
+
+Usage:
+  python manage.py precompute_faqs                     # derive questions from the CSV headings
+  python manage.py precompute_faqs --questions faqs.txt
+  python manage.py precompute_faqs --delay 5 --limit 200
+
+Run it from cron in off-peak hours; each question goes through the same
+retrieval + Ollama path as a live chat, one at a time, `--delay` seconds apart.
+"""
+import csv
+import json
+import os
+import re
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from corpus import CORPUS_PATH
+from financial.faq import corpus_version, faq_index
+from financial.models import PrecomputedAnswer
+
+_HEADING = re.compile(r"^[A-Z][\w'&/-]*(?: [\w'&/()-]+){0,6}$")
+
+
+def derive_questions(path):
+    """Turn short title-style lines of the knowledge base into canonical questions.
+
+    A heuristic seed list; pass a curated file with --questions for production.
+    """
+    questions = []
+    seen = set()
+    with open(path, newline='', encoding='utf-8') as f:
+        for row in csv.reader(f):
+            line = (row[0] if row else '').strip()
+            if not _HEADING.match(line) or ' - ' in line:
+                continue
+            words = line.split()
+            if len(words) < 2:
+                # Single words are mostly citation fragments ("NerdWallet", "Conclusion")
+                continue
+            # Headings are title case; wrapped sentence fragments mostly are not
+            capitalized = sum(1 for w in words if w[0].isupper())
+            if capitalized < max(1, len(words) - 1):
+                continue
+            key = line.lower()
+            if key not in seen:
+                seen.add(key)
+                questions.append(f"What should I know about {line}?")
+    return questions
+
+
+def load_questions(path):
+    questions = []
+    with open(path, encoding='utf-8') as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            if line.startswith('{'):
+                line = (json.loads(line).get('question') or '').strip()
+            if line:
+                questions.append(line)
+    return questions
+
+
+class Command(BaseCommand):
+    help = 'Precompute answers for canonical FAQ questions (retrieval + LLM, rate-limited)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--questions', help='Text file (one question per line) or JSONL with a "question" field')
+        parser.add_argument('--delay', type=float, default=2.0, help='Seconds to wait between generations')
+        parser.add_argument('--limit', type=int, default=0, help='Stop after this many new answers')
+        parser.add_argument('--force', action='store_true', help='Recompute answers that are already current')
+
+    def handle(self, *args, **options):
+        # Imported here so `manage.py help` does not initialise the AI stack
+        from embeddings import embedding_model_id, shared_embeddings
+        from financial.views import ollama_chat_direct, retrieve_context
+
+        if options['questions']:
+            if not os.path.exists(options['questions']):
+                raise CommandError(f"Questions file not found: {options['questions']}")
+            questions = load_questions(options['questions'])
+        else:
+            questions = derive_questions(CORPUS_PATH)
+
+        version = corpus_version()
+        embeddings = shared_embeddings()
+        model_id = embedding_model_id(embeddings)
+        self.stdout.write(f'📚 {len(questions)} canonical questions (corpus {version}, {model_id})')
+
+        done = skipped = failed = 0
+        consecutive_failures = 0
+        for question in questions:
+            if options['limit'] and done >= options['limit']:
+                break
+
+            current = PrecomputedAnswer.objects.filter(
+                question=question, corpus_version=version, embedding_model=model_id
+            ).exists()
+            if current and not options['force']:
+                skipped += 1
+                continue
+
+            started = time.monotonic()
+            answer = ollama_chat_direct(question, retrieve_context(question))
+            if answer.startswith('ERROR:'):
+                failed += 1
+                consecutive_failures += 1
+                self.stderr.write(f'⚠️  {question}: {answer}')
+                if consecutive_failures >= 3:
+                    self.stderr.write('❌ Ollama keeps failing; stopping this batch early')
+                    break
+            else:
+                consecutive_failures = 0
+                PrecomputedAnswer.objects.update_or_create(
+                    question=question,
+                    defaults={
+                        'answer': answer,
+                        'embedding': embeddings.embed_query(question),
+                        'embedding_model': model_id,
+                        'corpus_version': version,
+                    },
+                )
+                done += 1
+                self.stdout.write(f'✅ {question} ({time.monotonic() - started:.1f}s)')
+
+            time.sleep(options['delay'])
+
+        faq_index.refresh(force=True)
+        self.stdout.write(self.style.SUCCESS(
+            f'Done: {done} answered, {skipped} already current, {failed} failed'
+        ))
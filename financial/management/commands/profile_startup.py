@@ -0,0 +1,134 @@
+"""
+Report what a web worker spends its startup time and memory on.
+
+Usage:
+  python manage.py profile_startup
+  python manage.py profile_startup --top 30 --no-ai
+
+Boots a fresh interpreter under `python -X importtime` with AI_STACK_LOAD=lazy
+and reports two phases: a worker boot (django.setup() plus importing
+financial.views), then the first use of the AI stack (LangChain, Chroma,
+vector index). For each phase it lists the most expensive packages by
+import time and the RSS afterwards. It also lists the per-component
+init times recorded by financial.startup.timed().
+"""
+import json
+import os
+import subprocess
+import sys
+from collections import defaultdict
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+MARKER = '@@profile@@'
+
+PROBE = r'''
+import json, os, sys, time
+
+def rss_mb():
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith('VmRSS:'):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        return None
+
+MARKER = sys.argv[1]
+result = {}
+sys.stderr.write(MARKER + 'phase boot\n')
+started = time.perf_counter()
+import django
+django.setup()
+result['setup'] = time.perf_counter() - started
+started = time.perf_counter()
+import financial.views
+result['views'] = time.perf_counter() - started
+result['boot_rss'] = rss_mb()
+if sys.argv[2] == '1':
+    sys.stderr.write(MARKER + 'phase ai\n')
+    from financial.startup import ai_stack
+    started = time.perf_counter()
+    ai_stack.load()
+    result['ai'] = time.perf_counter() - started
+    result['ai_rss'] = rss_mb()
+from financial.startup import component_timings
+result['components'] = component_timings
+sys.stdout.write(MARKER + json.dumps(result) + '\n')
+'''
+
+
+def parse_importtime(stderr):
+    """{phase: {top-level package: seconds}} from -X importtime output
+
+    Sums each module's own (self) import time under its top-level package,
+    so e.g. everything chromadb pulls in internally counts as chromadb.
+    """
+    phases = defaultdict(lambda: defaultdict(float))
+    phase = 'boot'
+    for line in stderr.splitlines():
+        if line.startswith(MARKER + 'phase '):
+            phase = line[len(MARKER + 'phase '):].strip()
+            continue
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        try:
+            self_us, _, name = line[len('import time:'):].split('|')
+            seconds = int(self_us) / 1e6
+        except ValueError:
+            continue
+        phases[phase][name.strip().split('.')[0]] += seconds
+    return phases
+
+
+class Command(BaseCommand):
+    help = 'Profile worker startup: import cost per package and init cost per component'
+    # Profiling happens in a fresh subprocess; don't import the app here first
+    requires_system_checks = []
+
+    def add_arguments(self, parser):
+        parser.add_argument('--top', type=int, default=20, help='Packages to list per phase')
+        parser.add_argument('--no-ai', action='store_true', help='Only profile the worker boot')
+
+    def handle(self, *args, **options):
+        env = dict(os.environ)
+        env.update({
+            'DJANGO_SETTINGS_MODULE': os.environ.get('DJANGO_SETTINGS_MODULE', 'financial_site.settings'),
+            'AI_STACK_LOAD': 'lazy',
+            # Background threads would skew the measurements
+            'OLLAMA_WARMUP': 'false',
+            'MEMORY_WATCHDOG': 'false',
+        })
+        proc = subprocess.run(
+            [sys.executable, '-X', 'importtime', '-c', PROBE, MARKER, '0' if options['no_ai'] else '1'],
+            cwd=settings.BASE_DIR, env=env, capture_output=True, text=True,
+        )
+        result = None
+        for line in proc.stdout.splitlines():
+            if line.startswith(MARKER):
+                result = json.loads(line[len(MARKER):])
+        if proc.returncode != 0 or result is None:
+            raise CommandError(f'Startup probe failed:\n{proc.stderr[-2000:]}')
+
+        phases = parse_importtime(proc.stderr)
+        rss = lambda mb: f'{mb:.0f} MB' if mb is not None else 'n/a'
+
+        self.stdout.write(self.style.MIGRATE_HEADING('Worker boot'))
+        self.stdout.write(f"  django.setup()           {result['setup']:7.2f}s")
+        self.stdout.write(f"  import financial.views   {result['views']:7.2f}s   RSS {rss(result['boot_rss'])}")
+        if 'ai' in result:
+            self.stdout.write(f"  AI stack (first use)     {result['ai']:7.2f}s   RSS {rss(result['ai_rss'])}")
+
+        titles = {'boot': 'Import cost by package during boot', 'ai': 'Import cost by package on first AI use'}
+        for phase in ('boot', 'ai'):
+            if phase not in phases:
+                continue
+            self.stdout.write(self.style.MIGRATE_HEADING(f'\n{titles[phase]}'))
+            ranked = sorted(phases[phase].items(), key=lambda item: item[1], reverse=True)
+            for name, seconds in ranked[:options['top']]:
+                self.stdout.write(f'  {seconds * 1000:9.1f} ms  {name}')
+
+        self.stdout.write(self.style.MIGRATE_HEADING('\nComponent initialisation'))
+        for component, seconds in sorted(result['components'].items(), key=lambda item: item[1], reverse=True):
+            self.stdout.write(f'  {seconds * 1000:9.1f} ms  {component}')
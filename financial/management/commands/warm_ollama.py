@@ -0,0 +1,61 @@
+"""
+Preload the configured Ollama models before the web server takes traffic.
+
+Usage:
+  python manage.py warm_ollama
+  python manage.py warm_ollama --timeout 120 --no-pull
+  python manage.py warm_ollama --state /tmp/financial_tools/warmup.json
+  python manage.py warm_ollama --keep-warm        # ping idle models until stopped
+
+Waits for /api/tags on every backend, pulls missing models, and loads the
+small/large chat models and the embedding model with keep_alive set.
+start_concurrent.py runs this once before starting gunicorn and passes
+--state, the file (OLLAMA_WARMUP_STATE) from which every worker reads
+/api/ready/. With OLLAMA_KEEP_WARM_SECONDS it also supervises one
+--keep-warm process; from outside the workers it can't tell which backends
+served traffic, so it pings every backend each interval.
+"""
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from ollama_pool import configure as configure_ollama_pool
+from ollama_warmup import Warmer
+
+
+class Command(BaseCommand):
+    help = 'Pull (if missing) and preload the configured Ollama models'
+    # System checks import the URLconf (and with it the views' retriever); not needed here
+    requires_system_checks = []
+
+    def add_arguments(self, parser):
+        parser.add_argument('--timeout', type=float, default=60,
+                            help='Seconds to wait for each backend\'s /api/tags')
+        parser.add_argument('--no-pull', action='store_true', help='Do not pull missing models')
+        parser.add_argument('--state', default=settings.OLLAMA_WARMUP_STATE,
+                            help='Publish the warm-up state to this file for the web workers')
+        parser.add_argument('--keep-warm', action='store_true',
+                            help='Skip warm-up; ping the models every OLLAMA_KEEP_WARM_SECONDS until stopped')
+
+    def handle(self, *args, **options):
+        pool = configure_ollama_pool(settings.OLLAMA_API_BASE)
+        warmer = Warmer(
+            pool,
+            [settings.OLLAMA_SMALL_MODEL, settings.OLLAMA_LARGE_MODEL],
+            embed_model=settings.EMBED_MODEL if settings.EMBED_PROVIDER == 'ollama' else None,
+            keep_alive=settings.OLLAMA_KEEP_ALIVE,
+            keep_warm_seconds=settings.OLLAMA_KEEP_WARM_SECONDS,
+            pull_missing=not options['no_pull'],
+            state_path=options['state'] or None,
+        )
+        if options['keep_warm']:
+            if warmer.keep_warm_seconds <= 0:
+                raise CommandError('OLLAMA_KEEP_WARM_SECONDS is not set')
+            self.stdout.write(f"Keeping {', '.join(warmer.models)} warm every {warmer.keep_warm_seconds:g}s")
+            warmer.keep_warm()
+        self.stdout.write(f"Warming {', '.join(warmer.models)} on {len(pool.backends)} backend(s)...")
+        ok = warmer.warm(tags_timeout=options['timeout'])
+        for url, error in warmer.errors.items():
+            self.stderr.write(f"  {url}: {error}")
+        if not ok:
+            raise CommandError('Warm-up failed on every backend')
+        self.stdout.write(self.style.SUCCESS(f"Models resident (keep_alive={warmer.keep_alive})"))
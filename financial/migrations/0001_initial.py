@@ -0,0 +1,30 @@
+# Generated by Django 5.2.18 on 2026-10-19 10:56
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PrecomputedAnswer',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('question', models.CharField(max_length=500, unique=True)),
+                ('answer', models.TextField()),
+                ('embedding', models.JSONField()),
+                ('embedding_model', models.CharField(max_length=200)),
+                ('corpus_version', models.CharField(db_index=True, max_length=64)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'ordering': ['question'],
+            },
+        ),
+    ]
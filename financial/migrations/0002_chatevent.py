@@ -0,0 +1,33 @@
+# Generated by Django 5.2.18 on 2026-10-19 11:31
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('financial', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ChatEvent',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created_at', models.DateTimeField(db_index=True)),
+                ('question', models.TextField()),
+                ('question_hash', models.CharField(db_index=True, max_length=16)),
+                ('source', models.CharField(db_index=True, max_length=32)),
+                ('model', models.CharField(blank=True, max_length=200)),
+                ('tier', models.CharField(blank=True, max_length=16)),
+                ('retrieval', models.CharField(blank=True, max_length=16)),
+                ('follow_up', models.BooleanField(default=False)),
+                ('latency_ms', models.FloatField()),
+                ('status_code', models.PositiveSmallIntegerField()),
+                ('response_bytes', models.PositiveIntegerField(default=0)),
+            ],
+            options={
+                'ordering': ['-created_at'],
+            },
+        ),
+    ]
@@ -1,3 +1,45 @@
 from django.db import models
 
-# Create your models here.
+
+class PrecomputedAnswer(models.Model):
+    """Canonical FAQ answered offline by `manage.py precompute_faqs`."""
+
+    question = models.CharField(max_length=500, unique=True)
+    answer = models.TextField()
+    # Question embedding, matched against incoming questions by cosine similarity
+    embedding = models.JSONField()
+    embedding_model = models.CharField(max_length=200)
+    corpus_version = models.CharField(max_length=64, db_index=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        ordering = ['question']
+
+    def __str__(self):
+        return self.question
+
+
+class ChatEvent(models.Model):
+    """One chat_api request, written in batches by financial.analytics."""
+
+    created_at = models.DateTimeField(db_index=True)
+    question = models.TextField()
+    # Hash of the normalised question, for grouping repeats
+    question_hash = models.CharField(max_length=16, db_index=True)
+    # Which branch answered: faq, llm, stream, retrieval_only, no_llm, busy, llm_error, error
+    source = models.CharField(max_length=32, db_index=True)
+    model = models.CharField(max_length=200, blank=True)
+    tier = models.CharField(max_length=16, blank=True)
+    # How the context was obtained: computed, token (prefetched) or query (cached)
+    retrieval = models.CharField(max_length=16, blank=True)
+    follow_up = models.BooleanField(default=False)
+    latency_ms = models.FloatField()
+    status_code = models.PositiveSmallIntegerField()
+    response_bytes = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        ordering = ['-created_at']
+
+    def __str__(self):
+        return f'{self.created_at:%Y-%m-%d %H:%M} [{self.source}] {self.question[:60]}'
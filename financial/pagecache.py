@@ -0,0 +1,123 @@
+"""
+In-process cache for pages whose HTML never changes between requests.
+
+Views decorated with @cached_page (home, chatbot, budget, calculator) are
+rendered once per worker. PageCacheMiddleware sits near the top of the
+stack, ahead of sessions, CSRF and auth, and answers later GET/HEAD
+requests for those paths from memory: a gzip copy when the client accepts
+it, with ETag/Last-Modified so that revalidations get a 304 without a body.
+A cached hit never touches the session store or a template, but the Host
+header is still validated (ALLOWED_HOSTS) first. Entries are keyed by the
+full path, query string included, and at most MAX_PAGES are kept.
+
+A rendered response is only stored when it is a plain 200 that sets no
+cookies and doesn't vary on Cookie. A page that starts using the session
+or CSRF tokens therefore drops out of the cache automatically. With DEBUG
+on, entries are dropped when a template file changes.
+"""
+import gzip
+import hashlib
+import threading
+import time
+from pathlib import Path
+
+from django.conf import settings
+from django.http import HttpResponse, HttpResponseNotModified
+from django.utils.cache import patch_vary_headers
+from django.utils.http import http_date, parse_etags, parse_http_date_safe
+
+MAX_PAGES = 256
+
+# Headers the rest of the middleware stack added that a replayed page must keep
+_SKIP_HEADERS = {'content-length', 'content-encoding', 'set-cookie', 'vary', 'etag',
+                 'last-modified', 'cache-control', 'expires'}
+
+
+def cached_page(view):
+    """Mark a view whose output is the same for every request."""
+    view.cached_page = True
+    return view
+
+
+def _templates_mtime():
+    latest = 0.0
+    for engine in settings.TEMPLATES:
+        for directory in engine.get('DIRS', []):
+            for path in Path(directory).rglob('*.html'):
+                latest = max(latest, path.stat().st_mtime)
+    return latest
+
+
+class _Page:
+    def __init__(self, response):
+        self.body = response.content
+        self.gzipped = gzip.compress(self.body, 6)
+        if len(self.gzipped) >= len(self.body):
+            self.gzipped = None
+        self.etag = '"%s"' % hashlib.sha256(self.body).hexdigest()[:20]
+        self.stored_at = int(time.time())
+        self.last_modified = http_date(self.stored_at)
+        self.headers = [(k, v) for k, v in response.items() if k.lower() not in _SKIP_HEADERS]
+        self.templates_mtime = _templates_mtime() if settings.DEBUG else None
+
+    def not_modified(self, request):
+        if_none_match = request.META.get('HTTP_IF_NONE_MATCH')
+        if if_none_match:
+            tags = parse_etags(if_none_match)
+            return '*' in tags or self.etag in tags or f'W/{self.etag}' in tags
+        since = parse_http_date_safe(request.META.get('HTTP_IF_MODIFIED_SINCE', ''))
+        return since is not None and self.stored_at <= since
+
+
+class PageCacheMiddleware:
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self._pages = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+
+    def __call__(self, request):
+        if settings.PAGE_CACHE and request.method in ('GET', 'HEAD'):
+            # CommonMiddleware has not run yet: reject disallowed hosts (400) here
+            request.get_host()
+            page = self._pages.get(request.get_full_path())
+            if page is not None and page.templates_mtime is not None \
+                    and page.templates_mtime != _templates_mtime():
+                page = None
+            if page is not None:
+                self.hits += 1
+                return self._serve(request, page)
+
+        response = self.get_response(request)
+
+        match = getattr(request, 'resolver_match', None)
+        if (settings.PAGE_CACHE and match is not None and getattr(match.func, 'cached_page', False)
+                and request.method == 'GET' and response.status_code == 200
+                and not response.streaming and not response.cookies
+                and 'cookie' not in response.get('Vary', '').lower()):
+            page = _Page(response)
+            with self._lock:
+                self._pages[request.get_full_path()] = page
+                while len(self._pages) > MAX_PAGES:
+                    # Arbitrary query strings must not grow the cache without bound
+                    del self._pages[next(iter(self._pages))]
+            return self._serve(request, page)
+        return response
+
+    def _serve(self, request, page):
+        if page.not_modified(request):
+            response = HttpResponseNotModified()
+        else:
+            use_gzip = page.gzipped is not None and 'gzip' in request.META.get('HTTP_ACCEPT_ENCODING', '')
+            response = HttpResponse(b'' if request.method == 'HEAD' else
+                                    page.gzipped if use_gzip else page.body)
+            for name, value in page.headers:
+                response[name] = value
+            if use_gzip:
+                response['Content-Encoding'] = 'gzip'
+            response['Content-Length'] = str(len(page.gzipped if use_gzip else page.body))
+        response['ETag'] = page.etag
+        response['Last-Modified'] = page.last_modified
+        response['Cache-Control'] = f'public, max-age={settings.PAGE_CACHE_MAX_AGE}'
+        patch_vary_headers(response, ('Accept-Encoding',))
+        return response
@@ -0,0 +1,69 @@
+"""
+Speculative retrieval while the user is typing.
+
+The chat page posts the half-typed question to /api/chat/prefetch/ after a
+pause in typing. That request runs retrieval (the query embedding and the
+vector search) and stores the context here under a short-lived token. When
+the message is submitted with that token and its text still matches what was
+retrieved, chat_api reuses the stored context instead of retrieving again.
+Otherwise it retrieves as usual. Entries are also found by query text, so an
+identical question asked again within the TTL skips retrieval too.
+
+The cache is per process, like the conversation store: a token minted by
+another worker simply misses.
+"""
+import secrets
+import threading
+import time
+from collections import OrderedDict
+
+from .singleflight import normalize_text
+
+
+class PrefetchCache:
+    def __init__(self, max_entries=512, ttl=120.0):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._by_query = OrderedDict()  # normalized query -> (token, context, stored_at)
+        self._tokens = {}  # token -> normalized query
+        self.stats = {'prefetched': 0, 'token_hits': 0, 'query_hits': 0, 'misses': 0}
+
+    def put(self, query, context, prefetched=False):
+        """Store retrieved context for `query` and return its token."""
+        key = normalize_text(query)
+        token = secrets.token_urlsafe(12)
+        with self._lock:
+            old = self._by_query.pop(key, None)
+            if old:
+                self._tokens.pop(old[0], None)
+            self._by_query[key] = (token, context, time.monotonic())
+            self._tokens[token] = key
+            while len(self._by_query) > self.max_entries:
+                _, (dropped, _, _) = self._by_query.popitem(last=False)
+                self._tokens.pop(dropped, None)
+            if prefetched:
+                self.stats['prefetched'] += 1
+        return token
+
+    def get(self, query, token=None):
+        """(context, how) - how is 'token', 'query' or None on a miss."""
+        key = normalize_text(query)
+        with self._lock:
+            entry = self._by_query.get(key)
+            if entry and time.monotonic() - entry[2] > self.ttl:
+                del self._by_query[key]
+                self._tokens.pop(entry[0], None)
+                entry = None
+            if entry is None:
+                self.stats['misses'] += 1
+                return None, None
+            self._by_query.move_to_end(key)
+            # The token only counts if it was minted for this exact text
+            how = 'token' if token and self._tokens.get(token) == key else 'query'
+            self.stats[how + '_hits'] += 1
+            return entry[1], how
+
+    def snapshot(self):
+        with self._lock:
+            return dict(self.stats, entries=len(self._by_query), ttl=self.ttl)
@@ -0,0 +1,191 @@
+"""
+Balance-over-time series for the growth calculators.
+
+calculate_compound_interest and calculate_investment_growth return the
+balance at the end only. With "series" in the request they also return
+the balance at every period (monthly, quarterly or yearly). Several
+scenarios are computed together as one matrix: a row per scenario, a
+column per period.
+
+Balances come from the closed-form future value at each period, not a
+running loop. Contributions are made at the end of each month, and
+compounding is n times a year or continuous. The last point equals the
+calculator's end value.
+
+Series are columnar (`month` since the start, `balance`, `invested`). A chart does
+not need a point per month of a 50-year projection, so `points` shrinks
+each series to at most that many points. It uses Largest-Triangle-
+Three-Buckets (LTTB), which keeps the shape of the curve.
+
+numpy is imported on first use so that importing the views doesn't load it.
+"""
+import math
+
+PERIODS = {'monthly': 12, 'quarterly': 4, 'yearly': 1}
+# Series are mostly numbers; drop the spaces JsonResponse puts after separators
+COMPACT_JSON = {'separators': (',', ':')}
+MAX_YEARS = 100
+MAX_SCENARIOS = 10
+MIN_POINTS = 3
+# Scenario fields a request may override, besides 'label'
+SCENARIO_FIELDS = ('principal', 'contribution', 'rate', 'years', 'compounding')
+
+
+def finite_number(value, name):
+    """float(value), refusing inf and nan (which would serialise as invalid JSON)"""
+    number = float(value)
+    if not math.isfinite(number):
+        raise ValueError(f'{name} must be a finite number')
+    return number
+
+
+def compounding_frequency(value, default=12):
+    """Compounding periods per year from a request field, or 'continuous'"""
+    if value is None or value == '':
+        return default
+    if str(value).lower() == 'continuous':
+        return 'continuous'
+    periods = int(value)
+    if periods <= 0:
+        raise ValueError('compounding frequency must be positive')
+    return periods
+
+
+def growth_factor(rate, years, compounding):
+    """What 1 grows to after `years` at annual `rate` (a decimal)"""
+    import numpy as np
+
+    if compounding == 'continuous':
+        return np.exp(rate * years)
+    return (1 + rate / compounding) ** (compounding * years)
+
+
+def future_value(principal, contribution, rate, months, compounding):
+    """Balance after `months` with `contribution` added at the end of each
+    month. Arguments broadcast, so arrays give a grid of balances."""
+    import numpy as np
+
+    growth = growth_factor(rate, months / 12, compounding)
+    monthly = growth_factor(rate, 1 / 12, compounding)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        annuity = np.where(monthly == 1, months, (growth - 1) / (monthly - 1))
+    return principal * growth + contribution * annuity
+
+
+def lttb(x, y, points):
+    """Indices of at most `points` samples of (x, y) picked by Largest-
+    Triangle-Three-Buckets. The first and last samples are always kept."""
+    import numpy as np
+
+    n = len(x)
+    if points >= n or points < MIN_POINTS:
+        return np.arange(n)
+    # Bucket edges over the interior samples 1 .. n-2
+    edges = np.linspace(1, n - 1, points - 1).astype(int)
+    chosen = np.empty(points, dtype=int)
+    chosen[0], chosen[-1] = 0, n - 1
+    previous = 0
+    for bucket in range(points - 2):
+        start, end = edges[bucket], edges[bucket + 1]
+        # The next bucket's average (or the last point) is the third vertex
+        next_end = edges[bucket + 2] if bucket + 2 < len(edges) else n
+        ax, ay = x[previous], y[previous]
+        cx, cy = x[edges[bucket + 1]:next_end].mean(), y[edges[bucket + 1]:next_end].mean()
+        area = np.abs((ax - cx) * (y[start:end] - ay) - (ax - x[start:end]) * (cy - ay))
+        previous = start + int(np.argmax(area))
+        chosen[bucket + 1] = previous
+    return chosen
+
+
+def project(scenarios, period='yearly', points=None):
+    """Per-period balances for each scenario.
+
+    Every scenario is a dict with principal, contribution (per month),
+    rate (percent a year), years, compounding (periods a year or
+    'continuous') and an optional label. Returns one columnar dict per
+    scenario.
+    """
+    import numpy as np
+
+    if period not in PERIODS:
+        raise ValueError(f"period must be one of {', '.join(PERIODS)}")
+    if not scenarios or len(scenarios) > MAX_SCENARIOS:
+        raise ValueError(f'between 1 and {MAX_SCENARIOS} scenarios are allowed')
+    if points is not None and points < MIN_POINTS:
+        raise ValueError(f'points must be at least {MIN_POINTS}')
+    for scenario in scenarios:
+        for key in ('principal', 'contribution', 'rate', 'years'):
+            finite_number(scenario[key], key)
+        if not 0 < scenario['years'] <= MAX_YEARS:
+            raise ValueError(f'years must be between 0 and {MAX_YEARS}')
+
+    step = 12 // PERIODS[period]
+    longest = max(s['years'] for s in scenarios)
+    months = np.arange(0, math.ceil(longest * 12 / step) + 1) * step
+    # Column vectors (one row per scenario) broadcast against the months row
+    columns = {key: np.array([[s[key]] for s in scenarios], dtype=float)
+               for key in ('principal', 'contribution', 'rate')}
+    rate = columns['rate'] / 100
+    balances = np.empty((len(scenarios), len(months)))
+    with np.errstate(over='ignore', invalid='ignore'):
+        for compounding in {s['compounding'] for s in scenarios}:
+            rows = [i for i, s in enumerate(scenarios) if s['compounding'] == compounding]
+            balances[rows] = future_value(columns['principal'][rows], columns['contribution'][rows],
+                                          rate[rows], months, compounding)
+    if not np.isfinite(balances).all():
+        raise ValueError('balance overflows; use a smaller rate or fewer years')
+
+    results = []
+    for i, scenario in enumerate(scenarios):
+        # Each scenario ends at its own horizon, which need not be a period boundary
+        end = scenario['years'] * 12
+        end = int(end) if float(end).is_integer() else end
+        within = months[months < end]
+        scenario_months = np.append(within, end)
+        balance = np.append(balances[i, :len(within)],
+                            future_value(scenario['principal'], scenario['contribution'], rate[i, 0],
+                                         end, scenario['compounding']))
+        invested = scenario['principal'] + scenario['contribution'] * scenario_months
+        keep = lttb(scenario_months, balance, points) if points else np.arange(len(balance))
+        results.append({
+            'label': scenario.get('label') or f"{scenario['rate']:g}%",
+            'points': len(keep),
+            'periods': len(balance),
+            'month': np.round(scenario_months[keep], 2).tolist(),
+            'balance': np.round(balance[keep], 2).tolist(),
+            'invested': np.round(invested[keep], 2).tolist(),
+        })
+    return results
+
+
+def scenarios_from_request(data, base):
+    """`base` (the calculator's own inputs) plus the request's overrides in
+    data['scenarios'], with compounding parsed"""
+    overrides = data.get('scenarios') or [{}]
+    if not isinstance(overrides, list) or not all(isinstance(o, dict) for o in overrides):
+        raise ValueError('scenarios must be a list of objects')
+    scenarios = []
+    for override in overrides:
+        unknown = set(override) - set(SCENARIO_FIELDS) - {'label'}
+        if unknown:
+            raise ValueError(f"unknown scenario fields: {', '.join(sorted(unknown))}")
+        scenario = dict(base)
+        for key in ('principal', 'contribution', 'rate', 'years'):
+            if key in override:
+                scenario[key] = finite_number(override[key], key)
+        if 'compounding' in override:
+            scenario['compounding'] = compounding_frequency(override['compounding'])
+        scenario['label'] = str(override['label']) if override.get('label') else None
+        scenarios.append(scenario)
+    return scenarios
+
+
+def series_response(data, base):
+    """The 'series' part of a calculator response, for a request that asked for one"""
+    options = data.get('series')
+    options = options if isinstance(options, dict) else {}
+    period = options.get('period', data.get('period', 'yearly'))
+    points = options.get('points', data.get('points'))
+    scenarios = project(scenarios_from_request(data, base), period,
+                        int(points) if points is not None else None)
+    return {'period': period, 'scenarios': scenarios}
@@ -0,0 +1,221 @@
+"""
+Per-client token-bucket rate limiting.
+
+Every client IP address gets one bucket of RATE_LIMIT_BURST tokens,
+refilled at RATE_LIMIT_PER_MINUTE tokens a minute. Sessions are not used as
+the key: a client could mint a fresh bucket per request by sending a new
+random sessionid cookie. Behind a reverse proxy listed in
+RATE_LIMIT_TRUSTED_PROXIES the client address is taken from X-Forwarded-For.
+Each throttled endpoint spends tokens according to its class, so one LLM
+generation costs as much as many calculator calls:
+
+  llm         chat_api, chatbot_api        RATE_LIMIT_COST_LLM (10)
+  retrieval   chat_prefetch                RATE_LIMIT_COST_RETRIEVAL (1)
+  calculator  calculate_* endpoints        RATE_LIMIT_COST_CALCULATOR (1)
+
+Typing-time prefetch requests spend from a second bucket per address
+(RATE_LIMIT_PREFETCH_BURST, RATE_LIMIT_PREFETCH_PER_MINUTE), so typing a
+long message never uses up the budget for sending it. Pages and health
+checks are not throttled. Buckets are kept in a small
+SQLite file (RATE_LIMIT_DB) so all gunicorn workers share them, or in
+process memory with RATE_LIMIT_STORE=memory. Responses carry RateLimit-Limit,
+RateLimit-Remaining and RateLimit-Reset headers. A throttled request gets a
+429 with Retry-After. If the store fails, requests are let through: a
+broken limiter should not take the site down.
+"""
+import logging
+import sqlite3
+import threading
+import time
+
+from django.conf import settings
+from django.http import JsonResponse
+
+logger = logging.getLogger(__name__)
+
+ENDPOINT_CLASSES = {
+    'chat_api': 'llm',
+    'chatbot_api': 'llm',
+    'chatbot_api_alias': 'llm',
+    'chat_prefetch': 'retrieval',
+    'calculate_budget': 'calculator',
+    'compound_interest': 'calculator',
+    'calculate_loan': 'calculator',
+    'investment_growth': 'calculator',
+}
+
+
+class MemoryBuckets:
+    """Buckets in this process only (one worker, or tests)."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._buckets = {}  # key -> (tokens, updated)
+
+    def take(self, key, cost, capacity, rate, now):
+        with self._lock:
+            tokens, updated = self._buckets.get(key, (capacity, now))
+            tokens = min(capacity, tokens + (now - updated) * rate)
+            allowed = tokens >= cost
+            if allowed:
+                tokens -= cost
+            self._buckets[key] = (tokens, now)
+            if len(self._buckets) > 50000:
+                self._prune(bucket_kind(key), capacity, rate, now)
+            return allowed, tokens
+
+    def _prune(self, kind, capacity, rate, now):
+        full_after = capacity / rate
+        for key, (_, updated) in list(self._buckets.items()):
+            if now - updated > full_after and key.startswith(kind):
+                del self._buckets[key]
+
+
+class SQLiteBuckets:
+    """Buckets in a SQLite file shared by every worker on the host."""
+
+    PRUNE_EVERY = 1000
+
+    def __init__(self, path):
+        self.path = str(path)
+        self._local = threading.local()
+        self._calls = 0
+        conn = self._connect()
+        conn.execute('CREATE TABLE IF NOT EXISTS buckets '
+                     '(key TEXT PRIMARY KEY, tokens REAL NOT NULL, updated REAL NOT NULL)')
+
+    def _connect(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=1.0, isolation_level=None)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=OFF')  # losing a few refills on a crash is fine
+            self._local.conn = conn
+        return conn
+
+    def take(self, key, cost, capacity, rate, now):
+        conn = self._connect()
+        # IMMEDIATE takes the write lock up front, so read-modify-write is atomic across workers
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            row = conn.execute('SELECT tokens, updated FROM buckets WHERE key = ?', (key,)).fetchone()
+            tokens, updated = row if row else (capacity, now)
+            tokens = min(capacity, tokens + max(0.0, now - updated) * rate)
+            allowed = tokens >= cost
+            if allowed:
+                tokens -= cost
+            conn.execute('INSERT OR REPLACE INTO buckets (key, tokens, updated) VALUES (?, ?, ?)',
+                         (key, tokens, now))
+            self._calls += 1
+            if self._calls % self.PRUNE_EVERY == 0:
+                # Buckets idle long enough to be full again carry no state (each
+                # kind of bucket has its own capacity and rate)
+                conn.execute('DELETE FROM buckets WHERE updated < ? AND key LIKE ?',
+                             (now - capacity / rate, bucket_kind(key) + '%'))
+            conn.execute('COMMIT')
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+        return allowed, tokens
+
+
+def client_ip(request):
+    """The peer address, or behind trusted proxies the last X-Forwarded-For
+    hop they did not add (earlier entries are whatever the client sent)"""
+    ip = request.META.get('REMOTE_ADDR', '')
+    trusted = settings.RATE_LIMIT_TRUSTED_PROXIES
+    if ip not in trusted:
+        return ip
+    hops = [hop.strip() for hop in request.META.get('HTTP_X_FORWARDED_FOR', '').split(',') if hop.strip()]
+    for hop in reversed(hops):
+        if hop not in trusted:
+            return hop
+    return hops[0] if hops else ip
+
+
+def client_key(request):
+    return f'ip:{client_ip(request)}'
+
+
+def bucket_kind(key):
+    """'ip:' or 'prefetch:' - the prefix shared by buckets with the same limits"""
+    return key.split(':', 1)[0] + ':'
+
+
+def bucket_for(request, endpoint_class):
+    """(key, capacity, refill per second) of the bucket this request spends from"""
+    if endpoint_class == 'retrieval':
+        # chat_prefetch fires on every pause in typing; its own bucket keeps
+        # typing from spending the budget for actually sending messages
+        return (f'prefetch:{client_ip(request)}', float(settings.RATE_LIMIT_PREFETCH_BURST),
+                settings.RATE_LIMIT_PREFETCH_PER_MINUTE / 60.0)
+    return client_key(request), float(settings.RATE_LIMIT_BURST), settings.RATE_LIMIT_PER_MINUTE / 60.0
+
+
+def endpoint_cost(url_name):
+    endpoint_class = ENDPOINT_CLASSES.get(url_name)
+    if endpoint_class is None:
+        return None, 0
+    return endpoint_class, settings.RATE_LIMIT_COSTS[endpoint_class]
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_store():
+    global _store
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                if settings.RATE_LIMIT_STORE == 'memory':
+                    _store = MemoryBuckets()
+                else:
+                    _store = SQLiteBuckets(settings.RATE_LIMIT_DB)
+    return _store
+
+
+class RateLimitMiddleware:
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        response = self.get_response(request)
+        for name, value in getattr(request, 'rate_limit_headers', {}).items():
+            response[name] = value
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        if not settings.RATE_LIMIT_ENABLED or request.resolver_match is None:
+            return None
+        endpoint_class, cost = endpoint_cost(request.resolver_match.url_name)
+        if not cost:
+            return None
+
+        key, capacity, rate = bucket_for(request, endpoint_class)
+        try:
+            allowed, remaining = get_store().take(key, cost, capacity, rate, time.time())
+        except Exception as e:
+            logger.warning('Rate limiter unavailable, allowing request: %s', str(e))
+            return None
+
+        headers = {
+            'RateLimit-Limit': str(int(capacity)),
+            'RateLimit-Remaining': str(int(remaining)),
+            # Seconds until the bucket is full again
+            'RateLimit-Reset': str(int((capacity - remaining) / rate + 0.999)),
+        }
+        if allowed:
+            request.rate_limit_headers = headers
+            return None
+
+        retry_after = int((cost - remaining) / rate + 0.999)
+        response = JsonResponse({
+            'error': 'Too many requests. Please wait a moment and try again.',
+            'endpoint_class': endpoint_class,
+            'retry_after': retry_after,
+        }, status=429)
+        for name, value in headers.items():
+            response[name] = value
+        response['Retry-After'] = str(retry_after)
+        return response
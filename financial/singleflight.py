@@ -0,0 +1,142 @@
+"""
+Single-flight coalescing for identical in-flight chat generations.
+
+When many users send the same question at once, only the first request (the
+leader) calls Ollama; the others wait for its result, or in streaming mode
+replay and follow its token stream. Nothing is cached once the leader
+finishes - this only collapses concurrent duplicates.
+"""
+import hashlib
+import logging
+import re
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+_WHITESPACE = re.compile(r'\s+')
+
+
+class CoalesceTimeout(Exception):
+    """Raised to a follower when the leader does not finish in time."""
+
+
+def normalize_text(text):
+    return _WHITESPACE.sub(' ', (text or '').strip()).casefold()
+
+
+def request_key(question, context='', model=''):
+    """Key identical prompts the same way: question + retrieved context + model."""
+    raw = '\x1f'.join([normalize_text(question), normalize_text(context), model or ''])
+    return hashlib.sha256(raw.encode('utf-8')).hexdigest()
+
+
+class _Flight:
+    def __init__(self):
+        self.cond = threading.Condition()
+        self.done = False
+        self.result = None
+        self.error = None
+        self.chunks = []
+        self.followers = 0
+
+
+class SingleFlight:
+    """Thread-safe request coalescer keyed on a prompt hash."""
+
+    def __init__(self, timeout=100.0):
+        self.timeout = timeout
+        self._lock = threading.Lock()
+        self._flights = {}
+
+    def _join(self, key):
+        """Return (flight, is_leader) for key, registering a new flight if needed."""
+        with self._lock:
+            flight = self._flights.get(key)
+            if flight is not None:
+                flight.followers += 1
+                return flight, False
+            flight = _Flight()
+            self._flights[key] = flight
+            return flight, True
+
+    def _finish(self, key, flight, result=None, error=None):
+        with self._lock:
+            if self._flights.get(key) is flight:
+                del self._flights[key]
+        with flight.cond:
+            flight.result = result
+            flight.error = error
+            flight.done = True
+            flight.cond.notify_all()
+        if flight.followers:
+            logger.info('Coalesced %d duplicate request(s) onto one generation', flight.followers)
+
+    def do(self, key, fn, timeout=None):
+        """Run fn() once per key; concurrent callers with the same key share its result.
+
+        Followers re-raise the leader's exception, and raise CoalesceTimeout if
+        the leader has not finished within `timeout` seconds.
+        """
+        flight, is_leader = self._join(key)
+
+        if is_leader:
+            try:
+                result = fn()
+            except BaseException as exc:
+                self._finish(key, flight, error=exc)
+                raise
+            self._finish(key, flight, result=result)
+            return result
+
+        timeout = self.timeout if timeout is None else timeout
+        with flight.cond:
+            if not flight.cond.wait_for(lambda: flight.done, timeout=timeout):
+                raise CoalesceTimeout(f'Leader request did not finish within {timeout}s')
+        if flight.error is not None:
+            raise flight.error
+        return flight.result
+
+    def stream(self, key, make_iter, timeout=None):
+        """Yield chunks of make_iter() once per key, fanned out to every subscriber.
+
+        The generation runs in a background thread so a leader whose client
+        disconnects does not stall the followers. Late subscribers first replay
+        the chunks produced so far. `timeout` bounds the wait for each new chunk.
+        """
+        flight, is_leader = self._join(key)
+
+        if is_leader:
+            def pump():
+                try:
+                    for chunk in make_iter():
+                        with flight.cond:
+                            flight.chunks.append(chunk)
+                            flight.cond.notify_all()
+                except BaseException as exc:
+                    self._finish(key, flight, error=exc)
+                    return
+                self._finish(key, flight, result=''.join(flight.chunks))
+
+            threading.Thread(target=pump, name='singleflight-stream', daemon=True).start()
+
+        timeout = self.timeout if timeout is None else timeout
+        position = 0
+        while True:
+            with flight.cond:
+                deadline = time.monotonic() + timeout
+                while position >= len(flight.chunks) and not flight.done:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        raise CoalesceTimeout(f'No tokens from leader within {timeout}s')
+                    flight.cond.wait(remaining)
+                pending = flight.chunks[position:]
+                finished = flight.done
+                error = flight.error
+            for chunk in pending:
+                yield chunk
+            position += len(pending)
+            if finished and position >= len(flight.chunks):
+                if error is not None:
+                    raise error
+                return
@@ -0,0 +1,163 @@
+"""
+Startup timing and the lazily loaded AI stack.
+
+Importing LangChain, langchain_ollama and Chroma and opening the vector
+index takes seconds and a large share of a worker's memory, yet home,
+budget and the calculators need none of it. `ai_stack` defers that work
+until the first chat request, or runs it in a background thread right
+after startup, depending on AI_STACK_LOAD:
+
+  eager       load in start_serving(), before the server takes requests
+  background  start loading in a thread from start_serving()
+  lazy        start loading in a thread on first use
+
+Only the server entry points call start_serving(), so tests and management
+commands that import financial.views load the stack on first use at most.
+
+Loading always happens in its own thread. A request waits for it at most
+what is left of its deadline (get_retriever(timeout)), then answers with
+keyword search while the load continues.
+
+`timed()` records how long each component took to initialise;
+`manage.py profile_startup` reports these alongside per-module import cost.
+"""
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+# component -> seconds spent initialising it in this process
+component_timings = {}
+
+
+@contextmanager
+def timed(component):
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        component_timings[component] = time.perf_counter() - started
+
+
+class AIStack:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._ready = threading.Event()
+        self._loaded = False
+        self._loading = False
+        self._loader_pid = None
+        self.retriever = None
+        self.llm = None
+
+    def load(self):
+        """Load the vector retriever and LLM client and wait until done (once per process)."""
+        self.wait()
+        return self
+
+    def wait(self, timeout=None):
+        """Start loading if needed and wait up to `timeout` seconds (None:
+        until done). True once loaded."""
+        self.start_background()
+        return self._ready.wait(timeout)
+
+    def start_background(self):
+        with self._lock:
+            # A load running in the parent does not continue in a forked child
+            if self._loaded or (self._loading and self._loader_pid == os.getpid()):
+                return
+            self._loading = True
+            self._loader_pid = os.getpid()
+        threading.Thread(target=self._load, name='ai-stack-loader', daemon=True).start()
+
+    def _load(self):
+        """Import and initialise the vector retriever and LLM client"""
+        from django.conf import settings
+        from ollama_pool import get_pool
+
+        # Try to import vector retriever (requires embeddings)
+        try:
+            with timed('vector retriever'):
+                if settings.RETRIEVAL_SOCKET:
+                    import retrieval_service
+                    self.retriever = retrieval_service.connect(
+                        settings.RETRIEVAL_SOCKET, settings.RETRIEVAL_POOL_SIZE,
+                        settings.RETRIEVAL_SERVICE_TIMEOUT, settings.RETRIEVAL_SERVICE_FALLBACK)
+                else:
+                    from vector_enhanced import get_retriever
+                    self.retriever = get_retriever()
+            logger.info('Vector retriever initialized successfully')
+        except Exception as e:
+            self.retriever = None
+            logger.warning('Vector retriever initialization failed: %s', str(e))
+
+        # Initialize LLM (used by the LangChain chat_api)
+        try:
+            # Ensure we're using localhost without any proxy
+            os.environ['NO_PROXY'] = 'localhost,127.0.0.1'
+            os.environ['no_proxy'] = 'localhost,127.0.0.1'
+
+            with timed('LLM client'):
+                from langchain_ollama import OllamaLLM
+
+                # Use shorter timeout for memory-constrained environments
+                self.llm = OllamaLLM(
+                    model=settings.OLLAMA_MODEL or "llama3.2:latest",
+                    base_url=get_pool().backends[0].url,
+                    timeout=60,  # Reduced from 30 to give more time but not too long
+                    num_predict=256,  # Limit response length to reduce memory usage
+                    keep_alive=settings.OLLAMA_KEEP_ALIVE,
+                )
+            logger.info('LLM initialized successfully with model: %s', settings.OLLAMA_MODEL)
+        except Exception as e:
+            self.llm = None
+            logger.warning('LLM initialization failed: %s', str(e))
+
+        with self._lock:
+            self._loaded = True
+            self._loading = False
+        self._ready.set()
+
+    def get_retriever(self, timeout=None):
+        """The retriever, or None if it failed or isn't loaded within `timeout`"""
+        return self.retriever if self.wait(timeout) else None
+
+    def get_llm(self, timeout=None):
+        return self.llm if self.wait(timeout) else None
+
+    def search_vectors(self, vectors, collections=None):
+        """Documents for each already-embedded query, from the daemon or in-process"""
+        retriever = self.get_retriever()
+        if hasattr(retriever, 'search_vectors'):
+            return retriever.search_vectors(vectors, collections=collections)
+        from vector_enhanced import search_vectors
+        return search_vectors(vectors, collections=collections)
+
+    def state(self):
+        """Non-blocking status for health checks"""
+        if self._loaded:
+            return 'loaded'
+        return 'loading' if self._loading else 'not loaded'
+
+
+ai_stack = AIStack()
+
+
+def start_serving():
+    """Start loading the AI stack (per AI_STACK_LOAD) and the background
+    threads of a process that serves requests (the WSGI/ASGI entry points),
+    and of every worker forked from it"""
+    from django.conf import settings
+
+    from financial.views import start_background_threads
+
+    if settings.AI_STACK_LOAD == 'eager':
+        ai_stack.load()
+    elif settings.AI_STACK_LOAD == 'background':
+        ai_stack.start_background()
+    start_background_threads()
+    # Threads don't survive fork; gunicorn --preload workers start their own,
+    # but warm-up ran (or is running) in the process they were forked from
+    os.register_at_fork(after_in_child=lambda: start_background_threads(warm=False))
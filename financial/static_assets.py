@@ -0,0 +1,133 @@
+"""
+Fingerprinted, precompressed static files.
+
+`manage.py collectstatic` (run in the Dockerfile) copies static/ into
+STATIC_ROOT through CompressedManifestStorage. That storage names each file
+by a hash of its content (css/style.3f1c0a9b2d4e.css) and writes .gz and,
+when the brotli package is installed, .br copies of text assets next to it.
+Templates pick up the hashed names through {% static %}.
+
+StaticAssetMiddleware serves STATIC_URL from STATIC_ROOT without touching
+the rest of the stack. It picks the .br or .gz copy the client accepts, and
+marks hashed files `immutable` for a year, since their content can never
+change under that name. Unhashed names get a short max-age. Files that
+haven't been collected fall through to the usual DEBUG static view.
+"""
+import gzip
+import mimetypes
+import os
+import re
+from pathlib import Path
+
+from django.conf import settings
+from django.contrib.staticfiles.storage import ManifestStaticFilesStorage
+from django.http import FileResponse, HttpResponse, HttpResponseNotModified
+from django.utils.http import http_date, parse_etags
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+COMPRESSIBLE = {'.css', '.js', '.mjs', '.svg', '.html', '.txt', '.json', '.map', '.xml'}
+# name.<12 hex>.ext, as written by ManifestStaticFilesStorage
+HASHED_NAME = re.compile(r'\.[0-9a-f]{12}\.[^./]+$')
+IMMUTABLE = 'public, max-age=31536000, immutable'
+
+
+class CompressedManifestStorage(ManifestStaticFilesStorage):
+    # Templates must keep rendering if collectstatic hasn't run (or missed a file)
+    manifest_strict = False
+
+    def url(self, name, force=False):
+        try:
+            return super().url(name, force)
+        except ValueError:
+            return super(ManifestStaticFilesStorage, self).url(name)
+
+    def post_process(self, paths, dry_run=False, **options):
+        processed = []
+        for name, hashed_name, done in super().post_process(paths, dry_run, **options):
+            if done and not dry_run:
+                processed.append(name)
+                if hashed_name:
+                    processed.append(hashed_name)
+            yield name, hashed_name, done
+        if not dry_run:
+            for name in processed:
+                self._compress(name)
+
+    def _compress(self, name):
+        path = Path(self.path(name))
+        if path.suffix.lower() not in COMPRESSIBLE or not path.exists():
+            return
+        data = path.read_bytes()
+        variants = [('.gz', gzip.compress(data, 9, mtime=0))]
+        if brotli is not None:
+            variants.append(('.br', brotli.compress(data)))
+        for suffix, compressed in variants:
+            # Not worth a second request path if it barely shrinks
+            if len(compressed) < len(data) * 0.95:
+                Path(str(path) + suffix).write_bytes(compressed)
+
+
+class StaticAssetMiddleware:
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.prefix = '/' + settings.STATIC_URL.strip('/') + '/'
+        self.root = Path(settings.STATIC_ROOT).resolve() if settings.STATIC_ROOT else None
+        self._stats = {}  # path -> (size, mtime) or None; collected files don't change
+
+    def __call__(self, request):
+        if (self.root is not None and request.path.startswith(self.prefix)
+                and request.method in ('GET', 'HEAD')):
+            response = self._serve(request, request.path[len(self.prefix):])
+            if response is not None:
+                return response
+        return self.get_response(request)
+
+    def _stat(self, path):
+        if path not in self._stats or settings.DEBUG:
+            try:
+                st = path.stat()
+                self._stats[path] = (st.st_size, st.st_mtime) if path.is_file() else None
+            except OSError:
+                self._stats[path] = None
+        return self._stats[path]
+
+    def _serve(self, request, name):
+        path = (self.root / name).resolve()
+        if self.root not in path.parents:
+            return None
+        stat = self._stat(path)
+        if stat is None:
+            return None
+
+        etag = '"%x-%x"' % (int(stat[1]), stat[0])
+        cache_control = IMMUTABLE if HASHED_NAME.search(name) else f'public, max-age={settings.STATIC_MAX_AGE}'
+        if etag in parse_etags(request.META.get('HTTP_IF_NONE_MATCH', '')):
+            response = HttpResponseNotModified()
+            response['ETag'] = etag
+            response['Cache-Control'] = cache_control
+            return response
+
+        accepts = request.META.get('HTTP_ACCEPT_ENCODING', '')
+        serve_path, encoding = path, None
+        for suffix, coding in (('.br', 'br'), ('.gz', 'gzip')):
+            if coding in accepts and self._stat(Path(str(path) + suffix)):
+                serve_path, encoding = Path(str(path) + suffix), coding
+                break
+
+        content_type = mimetypes.guess_type(str(path))[0] or 'application/octet-stream'
+        if request.method == 'HEAD':
+            response = HttpResponse(content_type=content_type)
+        else:
+            response = FileResponse(open(serve_path, 'rb'), content_type=content_type)
+        if encoding:
+            response['Content-Encoding'] = encoding
+        response['Content-Length'] = str(os.path.getsize(serve_path))
+        response['Vary'] = 'Accept-Encoding'
+        response['ETag'] = etag
+        response['Last-Modified'] = http_date(stat[1])
+        response['Cache-Control'] = cache_control
+        return response
@@ -1,3 +1,1383 @@
-from django.test import TestCase
+import json
+import math
+import os
+import secrets
+import select
+import socket
+import sys
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from io import StringIO
+from types import SimpleNamespace
+from unittest import mock
 
-# Create your tests here.
+import numpy as np
+from django.core.management import call_command
+from django.test import Client, SimpleTestCase, TestCase, override_settings
+
+import cluster_index
+import corpus
+import dedup
+import embeddings
+import index_artifact
+import retrieval_eval
+import retrieval_service
+import start_concurrent
+from circuit_breaker import CLOSED, HALF_OPEN, OPEN, CircuitBreaker, CircuitOpenError
+from deadline import Deadline, DeadlineExceeded, GenerationRate, call_timeout, deadline_scope
+from knowledge_sources import parse_collections, split_text
+from model_router import ModelRouter, Tier, retrieval_confidence
+from ollama_pool import Backend, OllamaPool
+from retrieval_service import RetrievalClient
+from start_concurrent import ConcurrentServer, ManagedProcess
+
+from . import ratelimit
+from .conversations import Conversation, ConversationStore
+from .faq import FAQIndex, corpus_version
+from .management.commands.precompute_faqs import derive_questions
+from .models import PrecomputedAnswer
+from .prefetch import PrefetchCache
+from .projections import lttb, project, scenarios_from_request
+from .singleflight import CoalesceTimeout, SingleFlight, request_key
+from .startup import AIStack, start_serving
+
+
+class EmbeddingProviderTests(SimpleTestCase):
+    def test_provider_selection(self):
+        self.assertIsInstance(embeddings.get_embeddings('ollama'), embeddings.OllamaPoolEmbeddings)
+        with mock.patch.object(embeddings.LocalEmbeddings, '_load_onnx'), \
+                mock.patch.object(embeddings.LocalEmbeddings, '_load_sentence_transformers'):
+            self.assertIsInstance(embeddings.get_embeddings('LOCAL'), embeddings.LocalEmbeddings)
+        with self.assertRaisesRegex(ValueError, "Unknown EMBED_PROVIDER 'openai'"):
+            embeddings.get_embeddings('openai')
+
+    def test_local_backend_follows_the_model_path(self):
+        with tempfile.TemporaryDirectory() as tmp, \
+                mock.patch.object(embeddings.LocalEmbeddings, '_load_onnx') as load_onnx, \
+                mock.patch.object(embeddings.LocalEmbeddings, '_load_sentence_transformers') as load_st:
+            # A directory with model.onnx runs on ONNX Runtime, anything else on sentence-transformers
+            open(os.path.join(tmp, 'model.onnx'), 'wb').close()
+            onnx = embeddings.LocalEmbeddings(tmp)
+            named = embeddings.LocalEmbeddings('sentence-transformers/all-MiniLM-L6-v2')
+        self.assertEqual((onnx.backend, named.backend), ('onnx', 'sentence-transformers'))
+        self.assertEqual((load_onnx.call_count, load_st.call_count), (1, 1))
+        self.assertEqual(onnx.model_id, f'onnx:{os.path.basename(tmp)}')
+        self.assertEqual(embeddings.embedding_model_id(named), 'sentence-transformers:all-MiniLM-L6-v2')
+        self.assertEqual(embeddings.embedding_model_id(embeddings.OllamaPoolEmbeddings('nomic-embed-text')),
+                         'ollama:nomic-embed-text')
+
+    def test_missing_runtime_says_what_to_install(self):
+        with tempfile.TemporaryDirectory() as tmp, mock.patch.dict(sys.modules, {'onnxruntime': None}):
+            open(os.path.join(tmp, 'model.onnx'), 'wb').close()
+            with self.assertRaisesRegex(ImportError, 'requirements-local.txt'):
+                embeddings.LocalEmbeddings(tmp)
+
+    def test_documents_are_embedded_in_batches(self):
+        with mock.patch.object(embeddings.LocalEmbeddings, '_load_sentence_transformers'):
+            local = embeddings.LocalEmbeddings('model', batch_size=2)
+        batches = []
+        local._embed_batch = lambda texts: batches.append(texts) or [[len(t)] for t in texts]
+        self.assertEqual(local.embed_documents(['a', 'bb', 'ccc', 'dddd', 'e']), [[1], [2], [3], [4], [1]])
+        self.assertEqual(batches, [['a', 'bb'], ['ccc', 'dddd'], ['e']])
+        self.assertEqual(local.embed_query('xyz'), [3])
+
+        pool = mock.Mock()
+        pool.post.side_effect = lambda path, payload, timeout: mock.Mock(
+            json=lambda: {'embeddings': [[len(t)] for t in payload['input']]})
+        with mock.patch('ollama_pool.get_pool', return_value=pool):
+            remote = embeddings.OllamaPoolEmbeddings('nomic-embed-text', batch_size=3)
+            self.assertEqual(remote.embed_documents(['a', 'bb', 'ccc', 'dddd']), [[1], [2], [3], [4]])
+        self.assertEqual([c.args[1]['input'] for c in pool.post.call_args_list], [['a', 'bb', 'ccc'], ['dddd']])
+        self.assertEqual(pool.post.call_args.args[0], '/api/embed')
+
+
+class SingleFlightTests(SimpleTestCase):
+    def run_concurrently(self, count, target):
+        results = [None] * count
+        errors = [None] * count
+
+        def run(i):
+            try:
+                results[i] = target()
+            except Exception as e:
+                errors[i] = e
+
+        threads = [threading.Thread(target=run, args=(i,)) for i in range(count)]
+        for thread in threads:
+            thread.start()
+        return threads, results, errors
+
+    def test_concurrent_callers_share_one_call(self):
+        flights = SingleFlight()
+        calls = []
+        release = threading.Event()
+
+        def generate():
+            calls.append(1)
+            release.wait(5)
+            return 'answer'
+
+        threads, results, _ = self.run_concurrently(5, lambda: flights.do('k', generate))
+        time.sleep(0.1)
+        release.set()
+        for thread in threads:
+            thread.join(5)
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(results, ['answer'] * 5)
+        # Nothing is kept once the leader finishes
+        self.assertEqual(flights.do('k', lambda: 'fresh'), 'fresh')
+
+    def test_followers_get_the_leaders_error(self):
+        flights = SingleFlight()
+        release = threading.Event()
+
+        def fail():
+            release.wait(5)
+            raise RuntimeError('ollama down')
+
+        threads, _, errors = self.run_concurrently(3, lambda: flights.do('k', fail))
+        time.sleep(0.1)
+        release.set()
+        for thread in threads:
+            thread.join(5)
+        self.assertTrue(all(isinstance(e, RuntimeError) for e in errors))
+
+    def test_follower_times_out_on_a_slow_leader(self):
+        flights = SingleFlight()
+        release = threading.Event()
+        leader = threading.Thread(target=flights.do, args=('k', lambda: release.wait(5)))
+        leader.start()
+        time.sleep(0.05)
+        with self.assertRaises(CoalesceTimeout):
+            flights.do('k', lambda: 'unused', timeout=0.05)
+        release.set()
+        leader.join(5)
+
+    def test_stream_replays_to_late_subscribers(self):
+        flights = SingleFlight()
+        release = threading.Event()
+
+        def tokens():
+            yield 'Save '
+            release.wait(5)
+            yield 'early.'
+
+        first = flights.stream('k', tokens)
+        self.assertEqual(next(first), 'Save ')
+        # Joins (and replays what was sent so far) on first iteration
+        late = flights.stream('k', lambda: iter(['not used']))
+        self.assertEqual(next(late), 'Save ')
+        release.set()
+        self.assertEqual(''.join(first), 'early.')
+        self.assertEqual(''.join(late), 'early.')
+
+    def test_request_key_ignores_case_and_spacing(self):
+        self.assertEqual(request_key('What is  a Roth IRA?', 'ctx', 'm'),
+                         request_key(' what is a roth ira? ', 'ctx', 'm'))
+        self.assertNotEqual(request_key('q', 'ctx', 'small'), request_key('q', 'ctx', 'large'))
+
+
+class FakeEmbeddings:
+    """Fixed vectors per text; anything unknown embeds to `default`"""
+    model_id = 'fake:test'
+
+    def __init__(self, vectors, default=(0.0, 0.0, 1.0)):
+        self.vectors = vectors
+        self.default = list(default)
+        self.queries = []
+
+    def embed_query(self, text):
+        self.queries.append(text)
+        return list(self.vectors.get(text, self.default))
+
+
+class FAQTests(TestCase):
+    def setUp(self):
+        self.embeddings = FakeEmbeddings({
+            'How do I start a budget?': [1.0, 0.0, 0.0],
+            'how to begin budgeting': [0.95, 0.31, 0.0],
+            'What is a Roth IRA?': [0.0, 1.0, 0.0],
+        })
+        patcher = mock.patch('embeddings.shared_embeddings', return_value=self.embeddings)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def add(self, question, answer, **fields):
+        defaults = {'embedding': self.embeddings.vectors[question], 'embedding_model': 'fake:test',
+                    'corpus_version': corpus_version()}
+        defaults.update(fields)
+        PrecomputedAnswer.objects.create(question=question, answer=answer, **defaults)
+
+    def test_closest_answer_above_the_threshold(self):
+        self.add('How do I start a budget?', 'List your income and expenses.')
+        self.add('What is a Roth IRA?', 'A retirement account taxed up front.')
+        index = FAQIndex(threshold=0.9)
+        match = index.match('how to begin budgeting')
+        self.assertEqual(match.answer, 'List your income and expenses.')
+        self.assertAlmostEqual(match.score, 0.95, places=2)
+        self.assertIsNone(index.match('something else entirely'))
+        # An embedding the caller already has is used as is
+        self.assertEqual(index.match('ignored', vector=[0.0, 2.0, 0.0]).question, 'What is a Roth IRA?')
+        self.assertEqual(self.embeddings.queries, ['how to begin budgeting', 'something else entirely'])
+
+    def test_answers_for_another_corpus_or_model_are_ignored(self):
+        self.add('How do I start a budget?', 'old', corpus_version='0' * 16)
+        self.add('What is a Roth IRA?', 'other model', embedding_model='ollama:nomic-embed-text')
+        index = FAQIndex(threshold=0.5)
+        self.assertFalse(index.has_answers())
+        self.assertIsNone(index.match('How do I start a budget?'))
+        # Nothing to match against, so no query embedding is computed
+        self.assertEqual(self.embeddings.queries, [])
+
+    def test_reload_picks_up_new_answers(self):
+        index = FAQIndex(threshold=0.9, reload_seconds=3600)
+        self.assertFalse(index.has_answers())
+        self.add('How do I start a budget?', 'List your income and expenses.')
+        self.assertFalse(index.has_answers())
+        index.refresh(force=True)
+        self.assertTrue(index.has_answers())
+
+    def test_precompute_command_stores_answers_once(self):
+        with tempfile.NamedTemporaryFile('w', suffix='.txt', delete=False) as f:
+            f.write('How do I start a budget?\n\n{"question": "What is a Roth IRA?"}\n')
+        self.addCleanup(os.unlink, f.name)
+        with mock.patch('financial.views.retrieve_context', return_value='context'), \
+                mock.patch('financial.views.ollama_chat_direct', side_effect=lambda q, c: f'answer to {q}'):
+            call_command('precompute_faqs', questions=f.name, delay=0, stdout=StringIO())
+            self.assertEqual(PrecomputedAnswer.objects.count(), 2)
+            answer = PrecomputedAnswer.objects.get(question='What is a Roth IRA?')
+            self.assertEqual((answer.answer, answer.embedding, answer.embedding_model),
+                             ('answer to What is a Roth IRA?', [0.0, 1.0, 0.0], 'fake:test'))
+            out = StringIO()
+            call_command('precompute_faqs', questions=f.name, delay=0, stdout=out)
+            self.assertIn('0 answered, 2 already current', out.getvalue())
+
+    def test_precompute_stops_when_ollama_keeps_failing(self):
+        with tempfile.NamedTemporaryFile('w', suffix='.txt', delete=False) as f:
+            f.write(''.join(f'Question {i}?\n' for i in range(6)))
+        self.addCleanup(os.unlink, f.name)
+        generate = mock.Mock(return_value='ERROR: Ollama is not running')
+        with mock.patch('financial.views.retrieve_context', return_value=''), \
+                mock.patch('financial.views.ollama_chat_direct', generate):
+            call_command('precompute_faqs', questions=f.name, delay=0, stdout=StringIO(), stderr=StringIO())
+        self.assertEqual(generate.call_count, 3)
+        self.assertFalse(PrecomputedAnswer.objects.exists())
+
+    def test_questions_derived_from_title_lines(self):
+        with tempfile.NamedTemporaryFile('w', suffix='.csv', delete=False, newline='') as f:
+            f.write('Text\nEmergency Fund Basics\nthis line is a wrapped sentence fragment\n'
+                    'NerdWallet\nEmergency Fund Basics\nRetirement - Overview\nPaying Off Debt\n')
+        self.addCleanup(os.unlink, f.name)
+        self.assertEqual(derive_questions(f.name), ['What should I know about Emergency Fund Basics?',
+                                                    'What should I know about Paying Off Debt?'])
+
+
+class CircuitBreakerTests(SimpleTestCase):
+    def breaker(self, healthy=True):
+        self.healthy = healthy
+        return CircuitBreaker('test', failure_threshold=2, reset_timeout=0.05, probe=lambda: self.healthy)
+
+    def wait_for_state(self, breaker, state):
+        deadline = time.monotonic() + 2
+        while breaker.state != state and time.monotonic() < deadline:
+            time.sleep(0.01)
+        return breaker.state
+
+    def test_opens_after_consecutive_failures(self):
+        breaker = self.breaker()
+        breaker.record_failure('timeout')
+        breaker.record_success()
+        breaker.record_failure('timeout')
+        self.assertEqual(breaker.state, CLOSED)
+        breaker.record_failure('timeout')
+        self.assertEqual(breaker.state, OPEN)
+        self.assertTrue(breaker.is_open())
+        self.assertFalse(breaker.allow())
+        with self.assertRaises(CircuitOpenError):
+            breaker.call(lambda: 'never called')
+        self.assertEqual(breaker.snapshot()['times_opened'], 1)
+
+    def test_probe_half_opens_and_one_trial_closes(self):
+        breaker = self.breaker()
+        breaker.record_failure()
+        breaker.record_failure()
+        self.assertEqual(self.wait_for_state(breaker, HALF_OPEN), HALF_OPEN)
+        self.assertTrue(breaker.allow())
+        # Only one trial call at a time while half-open
+        self.assertFalse(breaker.allow())
+        self.assertTrue(breaker.is_open())
+        breaker.record_success()
+        self.assertEqual(breaker.state, CLOSED)
+        self.assertEqual(breaker.snapshot()['consecutive_failures'], 0)
+
+    def test_failed_trial_reopens(self):
+        breaker = self.breaker()
+        breaker.record_failure()
+        breaker.record_failure()
+        self.wait_for_state(breaker, HALF_OPEN)
+        self.assertRaises(ValueError, breaker.call, lambda: int('x'))
+        self.assertEqual(breaker.state, OPEN)
+        self.assertEqual(breaker.snapshot()['times_opened'], 2)
+
+    def test_stays_open_while_the_probe_fails(self):
+        breaker = self.breaker(healthy=False)
+        breaker.record_failure()
+        breaker.record_failure()
+        time.sleep(0.2)
+        self.assertEqual(breaker.state, OPEN)
+        self.assertIsNotNone(breaker.snapshot()['last_probe_at'])
+        self.healthy = True
+        self.assertEqual(self.wait_for_state(breaker, HALF_OPEN), HALF_OPEN)
+
+
+class StubOllama:
+    """Local HTTP server standing in for one Ollama backend"""
+
+    def __init__(self):
+        self.healthy = True
+        self.delay = 0.0
+        self.gate = None
+        self.hits = 0
+        self.disconnected = threading.Event()
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, *args):
+                pass
+
+            def do_GET(self):
+                self.reply(200 if stub.healthy else 500, {'models': []})
+
+            def do_POST(self):
+                self.rfile.read(int(self.headers.get('Content-Length', 0)))
+                stub.hits += 1
+                if not stub.healthy:
+                    return self.reply(500, {'error': 'unhealthy'})
+                if stub.gate is not None:
+                    stub.gate.wait(5)
+                if stub.delay and not self.wait_or_disconnect(stub.delay):
+                    stub.disconnected.set()
+                    return
+                self.reply(200, {'response': stub.url})
+
+            def wait_or_disconnect(self, seconds):
+                """Sleep like a long generation; False if the client hangs up first"""
+                until = time.monotonic() + seconds
+                while time.monotonic() < until:
+                    readable, _, _ = select.select([self.connection], [], [], 0.02)
+                    if readable and not self.connection.recv(1, socket.MSG_PEEK):
+                        return False
+                return True
+
+            def reply(self, status, body):
+                data = json.dumps(body).encode()
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.server.daemon_threads = True
+        self.url = f'http://127.0.0.1:{self.server.server_port}'
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def close(self):
+        if self.gate is not None:
+            self.gate.set()
+        self.server.shutdown()
+        self.server.server_close()
+
+
+class OllamaPoolTests(SimpleTestCase):
+    def start_stubs(self, count):
+        stubs = [StubOllama() for _ in range(count)]
+        for stub in stubs:
+            self.addCleanup(stub.close)
+        return stubs
+
+    def backend(self, stub, weight=1):
+        backend = Backend(stub.url, weight)
+        backend.breaker.failure_threshold = 2
+        backend.breaker.reset_timeout = 0.1
+        return backend
+
+    def test_least_outstanding_respects_weights(self):
+        heavy, light = self.start_stubs(2)
+        gate = threading.Event()
+        heavy.gate = light.gate = gate
+        pool = OllamaPool([self.backend(heavy, weight=2), self.backend(light)], hedge_after=0)
+        callers = [threading.Thread(target=pool.post, args=('/api/generate', {'model': 'm'}))
+                   for _ in range(6)]
+        for caller in callers:
+            caller.start()
+        deadline = time.monotonic() + 5
+        while heavy.hits + light.hits < 6 and time.monotonic() < deadline:
+            time.sleep(0.01)
+        # Six requests in flight split by outstanding-per-weight
+        self.assertEqual((heavy.hits, light.hits), (4, 2))
+        self.assertEqual([b.outstanding for b in pool.backends], [4, 2])
+        gate.set()
+        for caller in callers:
+            caller.join(5)
+        self.assertEqual([b.outstanding for b in pool.backends], [0, 0])
+
+    def test_failing_backend_is_ejected_and_readmitted(self):
+        flaky, steady = self.start_stubs(2)
+        flaky.healthy = False
+        pool = OllamaPool([self.backend(flaky), self.backend(steady)], hedge_after=0)
+        for _ in range(50):
+            pool.post('/api/generate', {'model': 'm'})
+            if pool.backends[0].breaker.state == 'open':
+                break
+        self.assertEqual(pool.backends[0].breaker.state, 'open')
+
+        hits = flaky.hits
+        for _ in range(10):
+            self.assertEqual(pool.post('/api/generate', {'model': 'm'}).json()['response'], steady.url)
+        self.assertEqual(flaky.hits, hits)
+
+        # The /api/tags probe sees it recover, then one trial request closes the breaker
+        flaky.healthy = True
+        deadline = time.monotonic() + 5
+        while pool.backends[0].breaker.state != 'half_open' and time.monotonic() < deadline:
+            time.sleep(0.02)
+        self.assertEqual(pool.backends[0].breaker.state, 'half_open')
+        for _ in range(50):
+            pool.post('/api/generate', {'model': 'm'})
+            if flaky.hits > hits:
+                break
+        self.assertEqual(pool.backends[0].breaker.state, 'closed')
+
+    def test_hedge_cancels_the_slow_request(self):
+        slow, fast = self.start_stubs(2)
+        slow.delay = 5.0
+        # The weight makes the slow backend the primary choice
+        pool = OllamaPool([self.backend(slow, weight=10), self.backend(fast)], hedge_after=0.1)
+        started = time.monotonic()
+        resp = pool.post('/api/generate', {'model': 'm'})
+        self.assertEqual(resp.json()['response'], fast.url)
+        self.assertLess(time.monotonic() - started, 2)
+
+        # The slow backend sees the client hang up instead of generating for 5s
+        self.assertTrue(slow.disconnected.wait(2))
+        deadline = time.monotonic() + 2
+        while pool.backends[0].outstanding and time.monotonic() < deadline:
+            time.sleep(0.01)
+        self.assertEqual(pool.backends[0].outstanding, 0)
+        # Being cancelled is not a failure of that backend
+        self.assertEqual(pool.backends[0].breaker.snapshot()['consecutive_failures'], 0)
+        self.assertEqual(pool.backends[0].breaker.state, 'closed')
+
+
+class ModelRouterTests(SimpleTestCase):
+    small = Tier('small', 'llama3.2:1b', 256)
+    large = Tier('large', 'llama3.2:latest', 512)
+
+    def pool(self, *backends):
+        """Backends as (models, outstanding, latency_ewma, breaker open)"""
+        return SimpleNamespace(backends=[
+            SimpleNamespace(outstanding=outstanding, latency_ewma=latency,
+                            serves=lambda model, models=models: not models or model in models,
+                            breaker=SimpleNamespace(is_open=lambda is_open=is_open: is_open))
+            for models, outstanding, latency, is_open in backends])
+
+    def test_simple_grounded_question_goes_small(self):
+        router = ModelRouter(self.small, self.large)
+        decision = router.route('What is an index fund?', 'An index fund tracks a market index.')
+        self.assertEqual((decision.tier, decision.model, decision.num_predict), ('small', 'llama3.2:1b', 256))
+        self.assertIn('definitional intent', decision.reasons)
+
+    def test_open_ended_question_goes_large(self):
+        router = ModelRouter(self.small, self.large)
+        decision = router.route('Should I compare a Roth and a traditional IRA for my retirement strategy?', '')
+        self.assertEqual(decision.tier, 'large')
+        self.assertIn('complex intent', decision.reasons)
+        self.assertIn('weak retrieval match', decision.reasons)
+
+    def test_busy_large_tier_downgrades(self):
+        question = 'Which is better for my retirement, paying off debt or investing?'
+        busy = self.pool(({'llama3.2:latest'}, 3, 10.0, False), ({'llama3.2:1b'}, 0, 1.0, False))
+        router = ModelRouter(self.small, self.large, pool=busy, latency_budget=20)
+        decision = router.route(question)
+        self.assertEqual((decision.tier, decision.queue_wait), ('small', 30.0))
+        self.assertEqual(router.snapshot()['decisions'], {'small': 1, 'downgraded': 1})
+
+        idle = self.pool(({'llama3.2:latest'}, 3, 10.0, False), ({'llama3.2:latest'}, 1, 5.0, False))
+        self.assertEqual(ModelRouter(self.small, self.large, pool=idle, latency_budget=20).route(question).tier,
+                         'large')
+
+    def test_no_healthy_large_backend(self):
+        down = self.pool(({'llama3.2:latest'}, 0, 1.0, True))
+        router = ModelRouter(self.small, self.large, pool=down)
+        self.assertEqual(router.route('Compare ETFs versus mutual funds for my portfolio').tier, 'small')
+        self.assertIsNone(router.snapshot()['large_queue_wait'])
+
+    def test_retrieval_confidence(self):
+        self.assertEqual(retrieval_confidence('What is compound interest?', ''), 0.0)
+        self.assertEqual(retrieval_confidence('compound interest rates', 'Compound interest grows'), 2 / 3)
+
+
+class ConversationTests(SimpleTestCase):
+    def test_context_reused_only_for_same_model(self):
+        conversation = Conversation('s1')
+        conversation.record('What is an ETF?', 'An exchange-traded fund.', 'llama3.2:1b', [1, 2, 3])
+        self.assertEqual(conversation.reusable_context('llama3.2:1b'), [1, 2, 3])
+        self.assertIsNone(conversation.reusable_context('llama3.2:latest'))
+        self.assertIn('User: What is an ETF?', conversation.history_text())
+        self.assertIn('Assistant: An exchange-traded fund.', conversation.history_text())
+
+    def test_context_dropped_when_too_long_or_summarised(self):
+        conversation = Conversation('s1')
+        conversation.record('q', 'a', 'm', list(range(10)), max_context_tokens=5)
+        self.assertIsNone(conversation.reusable_context('m'))
+
+        conversation = Conversation('s2')
+        for i in range(4):
+            conversation.record(f'Question {i}. ' + 'x' * 200, f'Answer {i}. ' + 'y' * 200,
+                                'm', [i], token_budget=150)
+        self.assertIsNone(conversation.reusable_context('m'))
+        self.assertIn('asked "Question 0."', conversation.summary)
+        self.assertLessEqual(len(conversation.turns), 2)
+        self.assertTrue(conversation.history_text().startswith('Earlier in this conversation:'))
+
+    def test_store_evicts_idle_and_least_recently_used(self):
+        store = ConversationStore(max_sessions=2, idle_seconds=60)
+        first, created = store.get()
+        self.assertTrue(created)
+        self.assertEqual(store.get(first.session_id), (first, False))
+        second, _ = store.get('unknown-id')
+        self.assertNotEqual(second.session_id, 'unknown-id')
+
+        store.get(first.session_id)
+        store.get()  # over max_sessions: the least recently used session goes
+        self.assertIsNone(store.peek(second.session_id))
+        self.assertIs(store.peek(first.session_id), first)
+
+        first.last_used -= 120
+        store.get()
+        self.assertIsNone(store.peek(first.session_id))
+        self.assertEqual(store.snapshot()['evicted'], 2)
+
+    def test_store_byte_cap(self):
+        store = ConversationStore(max_bytes=1000)
+        old, _ = store.get()
+        store.record(old, 'q' * 600, 'a')
+        new, _ = store.get()
+        store.record(new, 'q' * 600, 'a')
+        self.assertIsNone(store.peek(old.session_id))
+        self.assertIs(store.peek(new.session_id), new)
+
+    def test_follow_up_sends_only_the_new_turn_with_context(self):
+        from . import views
+
+        replies = iter([{'response': 'First reply', 'context': [7, 8, 9]},
+                        {'response': 'Second reply', 'context': [7, 8, 9, 10]}])
+        post = mock.Mock(side_effect=lambda *args, **kwargs: SimpleNamespace(
+            status_code=200, json=lambda body=next(replies): body, text=''))
+        conversation = Conversation('s1')
+        with mock.patch.object(views, 'ollama_pool', SimpleNamespace(backends=[object()], post=post)):
+            reply, context = views.ollama_generate('What is an ETF?', '', 'm', 100, conversation)
+            conversation.record('What is an ETF?', reply, 'm', context)
+            views.ollama_generate('And the fees?', '', 'm', 100, conversation)
+
+        first, second = (call.args[1] for call in post.call_args_list)
+        self.assertNotIn('context', first)
+        self.assertEqual(second['context'], [7, 8, 9])
+        self.assertNotIn(views.SYSTEM_PROMPT, second['prompt'])
+        self.assertNotIn('What is an ETF?', second['prompt'])
+        self.assertIn('And the fees?', second['prompt'])
+
+
+class SupervisorBackoffTests(SimpleTestCase):
+    def managed(self):
+        managed = ManagedProcess('Stub', ['true'], os.devnull)
+        managed.process = SimpleNamespace(pid=-1, returncode=1, poll=lambda: 1)
+        managed.started_at = time.monotonic() - 10
+        managed.signal = mock.Mock()
+        return managed
+
+    @mock.patch.object(start_concurrent, 'BACKOFF_MAX', 8.0)
+    def test_delay_doubles_up_to_the_cap(self):
+        managed = self.managed()
+        delays = [managed.schedule_restart() for _ in range(5)]
+        self.assertEqual(delays, [1.0, 2.0, 4.0, 8.0, 8.0])
+        self.assertGreater(managed.next_start, time.monotonic() + 7)
+
+    def test_stable_run_resets_backoff(self):
+        managed = self.managed()
+        for _ in range(3):
+            managed.schedule_restart()
+        managed.started_at = time.monotonic() - start_concurrent.STABLE_AFTER - 1
+        self.assertEqual(managed.schedule_restart(ran=False), 8.0)
+        self.assertEqual(managed.schedule_restart(), 1.0)
+
+    def test_failed_start_backs_off(self):
+        server = ConcurrentServer(with_ollama=False, workers=1)
+        managed = self.managed()
+        start = mock.Mock(side_effect=OSError('Popen failed'))
+        with mock.patch('sys.stdout', new_callable=StringIO):
+            server._restart_if_due(managed, start)  # notices the exit, waits out the first delay
+            start.assert_not_called()
+            managed.next_start = managed.started_at + 1  # the delay has passed
+            server._restart_if_due(managed, start)
+            server._restart_if_due(managed, start)
+        start.assert_called_once()
+        self.assertEqual(managed.failures, 2)
+        self.assertGreater(managed.next_start, time.monotonic())
+
+    def test_warm_up_runs_off_the_monitor_thread(self):
+        server = ConcurrentServer(with_ollama=False, workers=1)
+        managed = self.managed()
+        managed.next_start = managed.started_at + 1
+        release, warmed = threading.Event(), threading.Event()
+
+        def start():
+            managed.started_at = time.monotonic()
+
+        def when_started():
+            release.wait(5)
+            warmed.set()
+
+        server._restart_if_due(managed, start, when_started)  # returns while warm-up is still blocked
+        self.assertFalse(warmed.is_set())
+        release.set()
+        self.assertTrue(warmed.wait(5))
+
+
+class CorpusTests(SimpleTestCase):
+    rows = [
+        ['Compound Interest', 'Interest earned on interest; compounding grows savings.'],
+        ['Index Funds', 'A low-cost fund that tracks an index.'],
+        ['', ''],
+        ['Interest Rates', 'Rates set by the central bank. Intermediate bonds: interest-rate risk.'],
+        ['Budgeting', 'Track spending; aaa appears here as aaaa.'],
+    ]
+
+    @staticmethod
+    def substring_scan(rows, words):
+        """The scan count_matches replaced: every (overlapping) occurrence in every cell"""
+        scores = {}
+        for i, row in enumerate(rows):
+            for cell in row:
+                cell = cell.lower()
+                for word in words:
+                    pos = cell.find(word)
+                    while pos != -1:
+                        scores[i] = scores.get(i, 0) + 1
+                        pos = cell.find(word, pos + 1)
+        return scores
+
+    def test_count_matches_agrees_with_substring_scan(self):
+        kb = corpus.Corpus(['Title', 'Body'], self.rows)
+        for words in (['interest'], ['inter', 'fund'], ['compound interest', 'rate'],
+                      ['aa'], ['interest-rate', 'index'], ['missing'], ['s']):
+            with self.subTest(words=words):
+                self.assertEqual(kb.count_matches(words), self.substring_scan(self.rows, words))
+
+    def test_cells_round_trip(self):
+        kb = corpus.Corpus(['Title', 'Body'], [['Short'], *self.rows[1:2]])
+        self.assertEqual(len(kb), 2)
+        self.assertEqual(kb.values(0), ['Short', ''])
+        self.assertEqual(kb.document_text(1), 'Title: Index Funds\nBody: A low-cost fund that tracks an index.')
+        self.assertEqual(list(kb.rows_with_token('FUNDS')), [1])
+        self.assertEqual(kb.tokens_containing('fund'), ['fund', 'funds'])
+
+
+class AIStackTests(SimpleTestCase):
+    def test_slow_load_does_not_block_past_the_timeout(self):
+        release = threading.Event()
+
+        def slow_retriever():
+            release.wait(5)
+            return 'retriever'
+
+        stack = AIStack()
+        # Importing the real vector_enhanced builds the index
+        with mock.patch.dict(sys.modules, {'vector_enhanced': SimpleNamespace(get_retriever=slow_retriever)}):
+            started = time.monotonic()
+            self.assertIsNone(stack.get_retriever(timeout=0.1))
+            self.assertLess(time.monotonic() - started, 1)
+            self.assertEqual(stack.state(), 'loading')
+            # Waiting again doesn't start a second load
+            self.assertIsNone(stack.get_retriever(timeout=0.05))
+            release.set()
+            self.assertEqual(stack.get_retriever(timeout=5), 'retriever')
+        self.assertEqual(stack.state(), 'loaded')
+
+    def test_only_the_server_entry_point_starts_loading(self):
+        stack = mock.Mock()
+        with mock.patch('financial.startup.ai_stack', stack), \
+                mock.patch('financial.views.start_background_threads') as start_threads, \
+                mock.patch('os.register_at_fork'):
+            for mode in ('lazy', 'background', 'eager'):
+                with self.settings(AI_STACK_LOAD=mode):
+                    start_serving()
+        stack.start_background.assert_called_once_with()
+        stack.load.assert_called_once_with()
+        self.assertEqual(start_threads.call_count, 3)
+
+
+class IndexArtifactTests(SimpleTestCase):
+    chunks = [{'id': str(i), 'row_index': i, 'text': f'row {i}'} for i in range(3)]
+    vectors = [[1.0, 0.0], [0.0, 2.0], [1.0, 1.0]]
+
+    def write(self, **overrides):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        path = os.path.join(tmp.name, 'index.fgix')
+        options = {'corpus_version': 'abc123', 'embedding_model': 'ollama:nomic-embed-text', **overrides}
+        index_artifact.write_artifact(path, self.vectors, self.chunks, **options)
+        return path
+
+    def test_round_trip_and_search(self):
+        artifact = index_artifact.load_artifact(self.write(), 'abc123', 'ollama:nomic-embed-text')
+        self.assertEqual((artifact.corpus_version, artifact.embedding_model), ('abc123', 'ollama:nomic-embed-text'))
+        self.assertTrue(np.allclose(np.linalg.norm(artifact.vectors, axis=1), 1.0))
+        top, scores = artifact.search([0.0, 1.0], k=2)
+        self.assertEqual(list(top), [1, 2])
+        self.assertAlmostEqual(float(scores[0]), 1.0, places=5)
+        self.assertEqual(artifact.search_many([[1.0, 0.0], [0.0, 1.0]], k=1).tolist(), [[0], [1]])
+
+    def test_stale_artifact_is_refused(self):
+        path = self.write()
+        with self.assertRaisesMessage(index_artifact.StaleArtifactError, 'current corpus is def456'):
+            index_artifact.load_artifact(path, corpus_version='def456')
+        with self.assertRaisesMessage(index_artifact.StaleArtifactError, 'current embeddings are local:minilm'):
+            index_artifact.load_artifact(path, embedding_model='local:minilm')
+        with mock.patch.object(index_artifact, 'FORMAT_VERSION', 2), \
+                self.assertRaisesMessage(index_artifact.StaleArtifactError, 'expected 2'):
+            index_artifact.load_artifact(path)
+
+    def test_not_an_artifact(self):
+        with tempfile.NamedTemporaryFile(suffix='.fgix') as f:
+            f.write(b'not an index')
+            f.flush()
+            with self.assertRaises(ValueError):
+                index_artifact.load_artifact(f.name)
+
+    def test_vector_count_must_match_chunks(self):
+        with self.assertRaises(ValueError):
+            index_artifact.write_artifact(os.devnull, self.vectors[:2], self.chunks, 'abc123', 'm')
+
+
+class BatchModeTests(SimpleTestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        # app.py loads the retriever and LLM at import; stand them in
+        stubs = {
+            'vector_enhanced': SimpleNamespace(retriever=mock.Mock()),
+            'langchain_ollama': SimpleNamespace(OllamaLLM=mock.MagicMock()),
+            'langchain_core.prompts': SimpleNamespace(ChatPromptTemplate=mock.MagicMock()),
+        }
+        with mock.patch.dict(sys.modules, stubs), mock.patch('sys.stdout', new_callable=StringIO):
+            import app
+        cls.app = app
+
+    def test_read_questions_ids(self):
+        lines = ['{"id": 0, "question": "Zero?"}', '{"id": "", "question": "Empty?"}',
+                 '{"request_id": "r7", "title": "Budget", "body": "How?"}', '', 'Plain question?']
+        self.assertEqual(list(self.app.read_questions(lines)),
+                         [('0', 'Zero?'), ('', 'Empty?'), ('r7', 'Budget\n\nHow?'), ('5', 'Plain question?')])
+
+    def test_retried_errors_are_replaced(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        path = os.path.join(tmp.name, 'answers.jsonl')
+        with open(path, 'w') as f:
+            f.write('{"id": "1", "answer": "ok"}\n{"id": "2", "error": "timed out"}\n{"id": "3", "answ')
+        self.assertEqual(self.app.completed_ids(path), {'1', '2'})
+        self.assertEqual(self.app.completed_ids(path, retry_errors=True), {'1'})
+
+        self.app.drop_records(path, {'2', '3'})
+        with open(path) as f:
+            self.assertEqual(f.read(), '{"id": "1", "answer": "ok"}\n')
+
+
+class RetrievalEvalTests(SimpleTestCase):
+    def test_score_ranking(self):
+        self.assertEqual(retrieval_eval.score_ranking([3, 1, 2], [1, 2], k=3)[:2], (1.0, 0.5))
+        # Repeated rows count once, and only the top k are scored
+        recall, rr, ndcg = retrieval_eval.score_ranking([5, 5, 5, 1], [1, 2], k=2)
+        self.assertEqual((recall, rr), (0.5, 0.5))
+        self.assertAlmostEqual(ndcg, (1 / math.log2(3)) / (1 + 1 / math.log2(3)))
+        self.assertEqual(retrieval_eval.score_ranking([1, 2], [1, 2], k=5), (1.0, 1.0, 1.0))
+        self.assertEqual(retrieval_eval.score_ranking([7, 8], [1], k=2), (0.0, 0.0, 0.0))
+
+    def test_percentile(self):
+        values = list(range(1, 101))
+        self.assertEqual(retrieval_eval.percentile(values, 50), 50)
+        self.assertEqual(retrieval_eval.percentile(values, 99), 99)
+        self.assertEqual(retrieval_eval.percentile([4.0], 99), 4.0)
+
+    def test_evaluate_maps_duplicates_to_canonical_rows(self):
+        labels = [{'question': 'a', 'relevant': [1]}, {'question': 'b', 'relevant': [9]}]
+        rankings = {'a': [2, 1], 'b': [4, 0]}
+        result = retrieval_eval.evaluate(lambda query, k: rankings[query], labels, k=2, canonical={9: 4})
+        self.assertEqual((result['queries'], result['recall'], result['mrr']), (2, 1.0, 0.75))
+
+    def test_run_sweeps_variants_and_skips_unavailable_backends(self):
+        def stub(nprobe=1, **options):
+            return lambda query, k: [nprobe]
+
+        def unavailable(**options):
+            raise retrieval_eval.BackendUnavailable('no artifact')
+
+        labels = [{'question': 'q', 'relevant': [4]}]
+        kb = SimpleNamespace(canonical_rows=lambda threshold: {})
+        with mock.patch.dict(retrieval_eval.BACKENDS, {'stub': stub, 'missing': unavailable}), \
+                mock.patch.object(retrieval_eval, 'get_corpus', return_value=kb):
+            results, skipped = retrieval_eval.run(labels, ['stub', 'missing'], [1, 5],
+                                                  variants={'stub': [{'nprobe': 1}, {'nprobe': 4}]})
+        self.assertEqual(skipped, {'missing': 'no artifact'})
+        self.assertEqual([(r['backend'], r['k'], r['recall']) for r in results],
+                         [('stub/nprobe=1', 1, 0.0), ('stub/nprobe=1', 5, 0.0),
+                          ('stub/nprobe=4', 1, 1.0), ('stub/nprobe=4', 5, 1.0)])
+        self.assertIn('stub/nprobe=4', retrieval_eval.format_table(results))
+
+    def test_compare_against_baseline(self):
+        base = {'backend': 'keyword', 'k': 5, 'ndcg': 0.5, 'recall': 0.6, 'p50_ms': 20.0}
+        same = dict(base, p50_ms=21.5)
+        worse = dict(base, ndcg=0.4)
+        slower = dict(base, p50_ms=25.0)
+        other = dict(base, k=10)
+        wins = [w for _, _, w in retrieval_eval.compare([same, worse, slower, other], [base])]
+        self.assertEqual(wins, [True, False, False])
+
+
+class PrefetchTests(SimpleTestCase):
+    def test_token_and_query_hits(self):
+        cache = PrefetchCache()
+        token = cache.put('What is  an ETF?', 'ETF context', prefetched=True)
+        self.assertEqual(cache.get('what is an etf?', token), ('ETF context', 'token'))
+        # A token minted for other text only counts as a query hit
+        other = cache.put('What is a bond?', 'bond context')
+        self.assertEqual(cache.get('What is an ETF?', other), ('ETF context', 'query'))
+        self.assertEqual(cache.get('What is a stock?', token), (None, None))
+        self.assertEqual(cache.snapshot()['token_hits'], 1)
+        self.assertEqual(cache.snapshot()['prefetched'], 1)
+
+    def test_expiry_and_capacity(self):
+        cache = PrefetchCache(max_entries=2, ttl=60)
+        with mock.patch('time.monotonic', return_value=1000.0):
+            first = cache.put('first question', 'a')
+            cache.put('second question', 'b')
+            cache.get('first question')  # most recently used now
+            cache.put('third question', 'c')
+        self.assertEqual(cache.get('second question'), (None, None))
+        self.assertEqual(cache.snapshot()['entries'], 2)
+        with mock.patch('time.monotonic', return_value=1061.0):
+            self.assertEqual(cache.get('first question', first), (None, None))
+
+    @override_settings(CHAT_PREFETCH=True, RATE_LIMIT_ENABLED=False)
+    def test_submit_reuses_the_prefetched_context(self):
+        from . import views
+
+        retrieve = mock.Mock(return_value='Roth IRA context')
+        sessions = views.conversations.snapshot()['sessions']
+        with mock.patch.object(views, 'retrieve_context', retrieve), \
+                mock.patch.object(views, 'prefetch_cache', PrefetchCache()):
+            response = Client(HTTP_HOST='localhost').post(
+                '/api/chat/prefetch/', {'message': 'How does a Roth IRA work'}, content_type='application/json')
+            token = response.json()['token']
+            self.assertTrue(token)
+            self.assertEqual(views.cached_context('How does a Roth IRA work', token),
+                             ('Roth IRA context', 'token'))
+            self.assertEqual(views.cached_context('how does a  Roth IRA work'), ('Roth IRA context', 'query'))
+        retrieve.assert_called_once()
+        self.assertEqual(views.conversations.snapshot()['sessions'], sessions)
+
+
+@override_settings(RATE_LIMIT_ENABLED=True, RATE_LIMIT_BURST=3, RATE_LIMIT_PER_MINUTE=0.001)
+class RateLimitTests(SimpleTestCase):
+    url = '/api/calculate-compound-interest/'
+    body = {'principal': 1000, 'rate': 5, 'time': 10}
+
+    def setUp(self):
+        patcher = mock.patch.object(ratelimit, '_store', ratelimit.MemoryBuckets())
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.client = Client(HTTP_HOST='localhost')
+
+    def statuses(self, count, rotate_session=False, **extra):
+        codes = []
+        for _ in range(count):
+            if rotate_session:
+                self.client.cookies['sessionid'] = secrets.token_hex(16)
+            codes.append(self.client.post(self.url, self.body, content_type='application/json', **extra).status_code)
+        return codes
+
+    def test_burst_then_throttled(self):
+        self.assertEqual(self.statuses(5), [200, 200, 200, 429, 429])
+
+    def test_rotating_session_cookies_share_one_bucket(self):
+        self.assertEqual(self.statuses(5, rotate_session=True), [200, 200, 200, 429, 429])
+
+    def test_forwarded_for_only_from_trusted_proxy(self):
+        # Untrusted peer: a spoofed X-Forwarded-For doesn't buy new buckets
+        codes = [self.statuses(1, HTTP_X_FORWARDED_FOR=f'10.0.0.{i}')[0] for i in range(5)]
+        self.assertEqual(codes, [200, 200, 200, 429, 429])
+        with self.settings(RATE_LIMIT_TRUSTED_PROXIES={'127.0.0.1'}):
+            # Behind the proxy each client address gets its own bucket; the
+            # client-supplied first hop is ignored
+            self.assertEqual(self.statuses(3, HTTP_X_FORWARDED_FOR='1.1.1.1, 10.0.0.9'), [200, 200, 200])
+            self.assertEqual(self.statuses(1, HTTP_X_FORWARDED_FOR='2.2.2.2, 10.0.0.9'), [429])
+            self.assertEqual(self.statuses(1, HTTP_X_FORWARDED_FOR='10.0.0.10'), [200])
+
+    @override_settings(RATE_LIMIT_PREFETCH_BURST=2, CHAT_PREFETCH=False)
+    def test_prefetch_has_its_own_bucket(self):
+        prefetch = [self.client.post('/api/chat/prefetch/', {'message': 'How do I'},
+                                     content_type='application/json').status_code for _ in range(4)]
+        self.assertEqual(prefetch, [200, 200, 429, 429])
+        self.assertEqual(self.statuses(4), [200, 200, 200, 429])
+
+    def test_pruning_keeps_other_kinds_of_bucket(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        store = ratelimit.SQLiteBuckets(os.path.join(tmp.name, 'buckets.sqlite3'))
+        store.PRUNE_EVERY = 1
+        store.take('ip:1.2.3.4', 5, 10, 0.01, now=0)
+        # Long enough for a fast prefetch bucket to refill, not a chat bucket
+        store.take('prefetch:5.6.7.8', 1, 10, 1.0, now=100)
+        self.assertEqual(store.take('ip:1.2.3.4', 5, 10, 0.01, now=100), (True, 1.0))
+
+
+class TokenBucketTests(SimpleTestCase):
+    def stores(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        return [ratelimit.MemoryBuckets(), ratelimit.SQLiteBuckets(os.path.join(tmp.name, 'buckets.sqlite3'))]
+
+    def test_refill_math(self):
+        for store in self.stores():
+            with self.subTest(store=type(store).__name__):
+                # 10 tokens, refilled at 1 a second
+                self.assertEqual(store.take('a', 4, 10, 1.0, 100.0), (True, 6))
+                self.assertEqual(store.take('a', 4, 10, 1.0, 100.0), (True, 2))
+                self.assertEqual(store.take('a', 4, 10, 1.0, 100.0), (False, 2))
+                # 1.5 seconds later: 2 + 1.5 tokens
+                self.assertEqual(store.take('a', 3, 10, 1.0, 101.5), (True, 0.5))
+                # Refill stops at the capacity
+                self.assertEqual(store.take('a', 1, 10, 1.0, 1000.0), (True, 9))
+
+    def test_denied_request_spends_nothing(self):
+        for store in self.stores():
+            with self.subTest(store=type(store).__name__):
+                store.take('a', 9, 10, 0.5, 0.0)
+                self.assertEqual(store.take('a', 10, 10, 0.5, 2.0), (False, 2))
+                self.assertEqual(store.take('a', 2, 10, 0.5, 2.0), (True, 0))
+
+    def test_clients_have_separate_buckets(self):
+        for store in self.stores():
+            with self.subTest(store=type(store).__name__):
+                store.take('a', 10, 10, 1.0, 0.0)
+                self.assertEqual(store.take('b', 10, 10, 1.0, 0.0), (True, 0))
+
+
+@override_settings(PAGE_CACHE=True, STORAGES={
+    'default': {'BACKEND': 'django.core.files.storage.FileSystemStorage'},
+    'staticfiles': {'BACKEND': 'django.contrib.staticfiles.storage.StaticFilesStorage'},
+})
+class PageCacheTests(SimpleTestCase):
+    def setUp(self):
+        from . import views
+
+        # A fresh client builds a fresh middleware stack, so each test starts with an empty cache
+        self.client = Client(HTTP_HOST='localhost')
+        patcher = mock.patch.object(views, 'render', wraps=views.render)
+        self.render = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_repeat_requests_are_served_from_memory(self):
+        first = self.client.get('/')
+        second = self.client.get('/', HTTP_ACCEPT_ENCODING='gzip')
+        self.assertEqual(self.render.call_count, 1)
+        self.assertEqual(first['ETag'], second['ETag'])
+        self.assertEqual(second['Content-Encoding'], 'gzip')
+        self.assertIn('Accept-Encoding', second['Vary'])
+
+    def test_revalidation_gets_304(self):
+        etag = self.client.get('/').headers['ETag']
+        response = self.client.get('/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response.content, b'')
+        self.assertEqual(self.client.get('/', HTTP_IF_NONE_MATCH='"stale"').status_code, 200)
+
+    def test_cache_hit_still_checks_the_host(self):
+        self.client.get('/')
+        self.assertEqual(self.client.get('/', HTTP_HOST='attacker.example').status_code, 400)
+
+    def test_query_string_is_part_of_the_key(self):
+        self.client.get('/')
+        self.client.get('/?utm_source=mail')
+        self.client.get('/?utm_source=mail')
+        self.assertEqual(self.render.call_count, 2)
+
+
+class DedupMMRTests(SimpleTestCase):
+    def test_near_duplicates_cluster(self):
+        base = 'an emergency fund should cover three to six months of essential living expenses for most households'
+        texts = [base, 'Paying off high-interest credit card debt first saves the most money over time',
+                 base.replace('households', 'families'), base.upper(), '', 'Index funds track a market index cheaply']
+        self.assertEqual(dedup.near_duplicate_clusters(texts, threshold=0.8), [[0, 2, 3]])
+        self.assertEqual(dedup.near_duplicate_clusters(texts, threshold=0.99), [[0, 3]])
+        self.assertEqual(dedup.jaccard(dedup.shingles('a b c d'), dedup.shingles('b c d e')), 1 / 3)
+
+    def test_corpus_folds_duplicates_into_the_longest_row(self):
+        rows = [['Save three to six months of expenses in an emergency fund account'],
+                ['Index funds track a market index at low cost'],
+                ['Save three to six months of expenses in an emergency fund account today']]
+        kb = corpus.Corpus(['Text'], rows)
+        self.assertEqual(kb.duplicates(0.7), {2: [0]})
+        self.assertEqual(kb.canonical_rows(0.7), {0: 2})
+        chunks = kb.chunks(dedup_threshold=0.7)
+        self.assertEqual([c['row_index'] for c in chunks], [1, 2])
+        self.assertEqual(chunks[1]['duplicates'], [0])
+        self.assertEqual(corpus.chunking_id(0.7), 'rows+dedup0.7')
+        self.assertEqual(corpus.chunking_id(0), 'rows')
+
+    def test_mmr_skips_redundant_results(self):
+        vectors = np.array([[1.0, 0.0], [0.99, 0.14], [0.6, 0.8]], dtype=np.float32)
+        vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+        candidates, scores = np.arange(3), np.array([0.95, 0.94, 0.7])
+        self.assertEqual(index_artifact.mmr_select(candidates, scores, vectors, 2).tolist(), [0, 2])
+        self.assertEqual(index_artifact.mmr_select(candidates, scores, vectors, 2, lambda_mult=1).tolist(), [0, 1])
+        self.assertEqual(len(index_artifact.mmr_select(np.arange(0), scores[:0], vectors[:0], 2)), 0)
+
+    def test_artifact_with_other_chunking_is_stale(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        path = os.path.join(tmp.name, 'index.fgix')
+        index_artifact.write_artifact(path, [[1.0, 0.0]], [{'id': '0', 'row_index': 0, 'text': 'x'}],
+                                      'abc123', 'm', chunking='rows')
+        with self.assertRaisesMessage(index_artifact.StaleArtifactError, 'current chunking is rows+dedup0.8'):
+            index_artifact.load_artifact(path, chunking='rows+dedup0.8')
+
+
+class ClusterIndexTests(SimpleTestCase):
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        rng = np.random.RandomState(0)
+        # Two well-separated groups of passages
+        vectors = np.vstack([rng.normal([5, 0, 0, 0], 0.3, (20, 4)), rng.normal([0, 5, 0, 0], 0.3, (20, 4))])
+        chunks = [{'id': str(i), 'row_index': i, 'text': f'row {i}'} for i in range(len(vectors))]
+        self.path = os.path.join(tmp.name, 'index.fgix')
+        index_artifact.write_artifact(self.path, vectors, chunks, 'abc123', 'm')
+        self.artifact = index_artifact.load_artifact(self.path)
+        self.index = cluster_index.HierarchicalIndex.build(self.artifact, n_clusters=2, nprobe=1)
+
+    def test_search_matches_brute_force(self):
+        self.assertEqual(sorted(self.index.counts.tolist()), [20, 20])
+        for query in ([1, 0.1, 0, 0], [0.1, 1, 0, 0]):
+            ids, scores = self.index.search(query, k=5)
+            exact_ids, exact_scores = self.artifact.search(query, k=5)
+            self.assertEqual(ids.tolist(), exact_ids.tolist())
+            self.assertTrue(np.allclose(scores, exact_scores))
+            self.assertEqual(len(self.index.candidates(np.asarray(query, dtype=np.float32))), 20)
+
+    def test_insert_joins_nearest_cluster_and_is_searchable(self):
+        label = self.index.add([[0, 1, 1, 0]], [{'id': 'new', 'row_index': None, 'text': 'inserted'}])[0]
+        self.assertEqual(self.index.counts[label], 21)
+        self.assertEqual(len(self.index), 41)
+        ids, _ = self.index.search([0, 1, 1, 0], k=1)
+        self.assertEqual(ids.tolist(), [40])
+        self.assertEqual(self.index.chunks[40]['text'], 'inserted')
+        self.assertTrue(np.allclose(np.linalg.norm(self.index.centroids, axis=1), 1.0, atol=1e-5))
+        self.assertEqual(self.index.vectors_for([0, 40]).shape, (2, 4))
+        with self.assertRaises(ValueError):
+            self.index.add([[1, 0, 0, 0]], [])
+
+    def test_sidecar_round_trip_and_staleness(self):
+        self.index.add([[0, 1, 1, 0]], [{'id': 'new', 'row_index': None, 'text': 'inserted'}])
+        self.index.save(cluster_index.sidecar_path(self.path))
+        loaded = cluster_index.load_hierarchical(self.artifact, nprobe=2)
+        self.assertEqual(len(loaded), 41)
+        self.assertEqual(loaded.chunks[40]['text'], 'inserted')
+        self.assertEqual(loaded.search([0, 1, 1, 0], k=1)[0].tolist(), [40])
+
+        rebuilt = index_artifact.IndexArtifact(self.artifact.path, dict(self.artifact.header, corpus_version='def456'),
+                                               self.artifact.vectors)
+        self.assertIsNone(cluster_index.load_hierarchical(rebuilt))
+
+
+class KnowledgeSourceTests(SimpleTestCase):
+    def test_split_text_prefixes_each_chunk_with_its_heading(self):
+        text = '# Budget\n\nTrack spending.\n\nCut fees.\n\n## Saving ##\n\nPay yourself first.'
+        self.assertEqual(split_text(text), ['Budget\nTrack spending.\n\nCut fees.', 'Saving\nPay yourself first.'])
+
+    def test_split_text_packs_paragraphs_up_to_the_limit(self):
+        self.assertEqual(split_text('aaaa\n\nbbbb\n\ncccc', max_chars=10), ['aaaa\n\nbbbb', 'cccc'])
+        self.assertEqual(split_text('\n\n  \n\n'), [])
+
+    def test_split_text_cuts_long_paragraphs_at_sentence_ends(self):
+        chunks = split_text('Spend less. Save more. Invest early. Repeat often.', max_chars=25)
+        self.assertEqual(chunks, ['Spend less. Save more.', 'Invest early.', 'Repeat often.'])
+        self.assertTrue(all(len(chunk) <= 25 for chunk in chunks))
+
+    def test_parse_collections(self):
+        self.assertIsNone(parse_collections(None))
+        self.assertIsNone(parse_collections(''))
+        self.assertIsNone(parse_collections(' , '))
+        self.assertEqual(parse_collections('Tax, retirement,,tax'), ['retirement', 'tax'])
+        self.assertEqual(parse_collections(['Retirement Plans', 'tax']), ['retirement-plans', 'tax'])
+
+
+class DeadlineTests(SimpleTestCase):
+    def test_remaining_excludes_the_reserve(self):
+        deadline = Deadline(10, reserve=2)
+        self.assertAlmostEqual(deadline.remaining(), 8, delta=0.1)
+        # The reserve is at most half the budget
+        self.assertEqual(Deadline(4, reserve=10).reserve, 2)
+
+    def test_timeout_is_capped_by_what_remains(self):
+        deadline = Deadline(5)
+        self.assertEqual(deadline.timeout(1), 1)
+        self.assertAlmostEqual(deadline.timeout(60), 5, delta=0.1)
+        self.assertAlmostEqual(deadline.timeout(), 5, delta=0.1)
+
+    def test_check_raises_once_spent(self):
+        deadline = Deadline(0.05)
+        deadline.check('retrieval')
+        with self.assertRaises(DeadlineExceeded):
+            deadline.check('generation', minimum=1)
+        time.sleep(0.06)
+        self.assertTrue(deadline.expired())
+        with self.assertRaisesRegex(DeadlineExceeded, 'llm slot'):
+            deadline.timeout(5, 'llm slot')
+
+    def test_child_never_outlives_its_parent(self):
+        parent = Deadline(10, reserve=2)
+        self.assertAlmostEqual(parent.child(3).remaining(), 3, delta=0.1)
+        self.assertAlmostEqual(parent.child(60).remaining(), 8, delta=0.1)
+
+    def test_num_predict_fits_the_remaining_time(self):
+        deadline = Deadline(10)
+        # (10s - 1s overhead) x 20 tokens/s, within what was asked for
+        self.assertAlmostEqual(deadline.num_predict(1000, (20, 1)), 180, delta=5)
+        self.assertEqual(deadline.num_predict(100, (20, 1)), 100)
+        self.assertEqual(deadline.num_predict(1000, (20, 30)), 32)
+
+    def test_call_timeout_uses_the_scoped_deadline(self):
+        self.assertEqual(call_timeout(30), 30)
+        with deadline_scope(Deadline(2)):
+            self.assertAlmostEqual(call_timeout(30), 2, delta=0.1)
+            with deadline_scope(Deadline(0.5)):
+                self.assertAlmostEqual(call_timeout(30), 0.5, delta=0.1)
+            self.assertAlmostEqual(call_timeout(30), 2, delta=0.1)
+        self.assertEqual(call_timeout(30), 30)
+
+    @override_settings(OLLAMA_GENERATE_TIMEOUT=90)
+    def test_generation_call_gets_the_remaining_budget(self):
+        from . import views
+
+        post = mock.Mock(return_value=SimpleNamespace(status_code=200, json=lambda: {'response': 'ok'}))
+        with mock.patch.object(views, 'ollama_pool', SimpleNamespace(backends=[object()], post=post)):
+            views.ollama_generate('What is an ETF?', '', 'm')
+            self.assertEqual(post.call_args.kwargs['timeout'], 90)
+            with deadline_scope(Deadline(3)):
+                views.ollama_generate('What is an ETF?', '', 'm')
+                self.assertAlmostEqual(post.call_args.kwargs['timeout'], 3, delta=0.1)
+                views.ollama_chat('What is an ETF?')
+                self.assertAlmostEqual(post.call_args.kwargs['timeout'], 3, delta=0.1)
+
+    def test_generation_rate_learns_from_ollama_timings(self):
+        rates = GenerationRate(default_tokens_per_second=8, default_overhead=1, alpha=0.5)
+        self.assertEqual(rates.get('m'), (8.0, 1.0))
+        rates.observe('m', {'eval_count': 100, 'eval_duration': 5e9, 'total_duration': 7e9})
+        self.assertEqual(rates.get('m'), (20.0, 2.0))
+        rates.observe('m', {'eval_count': 40, 'eval_duration': 1e9, 'total_duration': 1e9})
+        self.assertEqual(rates.get('m'), (30.0, 1.0))
+        # Incomplete bodies (errors, cached replies) are ignored
+        rates.observe('m', {'eval_count': 0})
+        self.assertEqual(rates.get('m'), (30.0, 1.0))
+
+
+class RetrievalClientTests(SimpleTestCase):
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.path = os.path.join(tmp.name, 'retrieval.sock')
+        self.fallback_loads = 0
+        self.fallback_ready = threading.Event()
+
+    def fallback(self):
+        self.fallback_loads += 1
+        self.fallback_ready.wait(5)
+        return SimpleNamespace(invoke=lambda query, **kwargs: [f'in-process: {query}'])
+
+    def test_slow_daemon_times_out_without_loading_the_fallback(self):
+        server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        server.bind(self.path)
+        server.listen()
+        self.addCleanup(server.close)
+        client = RetrievalClient(self.path, timeout=0.1, fallback=self.fallback)
+        with self.assertRaises(TimeoutError):
+            client.invoke('what is an index fund')
+        time.sleep(0.05)
+        self.assertEqual(self.fallback_loads, 0)
+
+    def test_missing_daemon_loads_the_fallback_in_the_background(self):
+        client = RetrievalClient(self.path, timeout=0.1, fallback=self.fallback)
+        started = time.monotonic()
+        # Not loaded yet: the caller gets the error (and uses keyword search)
+        with self.assertRaises(FileNotFoundError):
+            client.invoke('what is an index fund')
+        self.assertLess(time.monotonic() - started, 1)
+        self.fallback_ready.set()
+        deadline = time.monotonic() + 5
+        while client.snapshot()['fallback_loaded'] is False and time.monotonic() < deadline:
+            time.sleep(0.01)
+        self.assertEqual(client.invoke('what is an index fund'), ['in-process: what is an index fund'])
+        self.assertEqual(self.fallback_loads, 1)
+
+    def test_long_query_is_cut_to_fit_the_frame(self):
+        message = retrieval_service.encode_search(['é' * 70000], 5)
+        body = message[retrieval_service.REQUEST.size:]
+        queries, _ = retrieval_service.decode_search(1, body)
+        self.assertEqual(len(queries[0].encode('utf-8')), retrieval_service.MAX_QUERY_BYTES)
+        with self.assertRaises(ValueError):
+            retrieval_service._str16('x' * 70000)
+
+
+class RetrievalProtocolTests(SimpleTestCase):
+    def body(self, message, op):
+        magic, version, got_op, k, count, length = retrieval_service.REQUEST.unpack_from(message)
+        self.assertEqual((magic, version, got_op), (retrieval_service.MAGIC, retrieval_service.VERSION, op))
+        body = message[retrieval_service.REQUEST.size:]
+        self.assertEqual(len(body), length)
+        return k, count, body
+
+    def test_search_round_trip(self):
+        queries = ['What is a Roth IRA?', 'épargne à 5 %', '']
+        message = retrieval_service.encode_search(queries, 7, ['retirement', 'tax'])
+        k, count, body = self.body(message, retrieval_service.OP_SEARCH)
+        self.assertEqual((k, count), (7, 3))
+        self.assertEqual(retrieval_service.decode_search(count, body), (queries, ['retirement', 'tax']))
+        _, count, body = self.body(retrieval_service.encode_search(['q'], 5), retrieval_service.OP_SEARCH)
+        self.assertEqual(retrieval_service.decode_search(count, body), (['q'], None))
+
+    def test_vector_search_round_trip(self):
+        vectors = [[0.5, -1.0, 2.25], [0.0, 0.125, -3.5]]
+        message = retrieval_service.encode_vector_search(vectors, 4, ['tax'])
+        _, count, body = self.body(message, retrieval_service.OP_SEARCH_VECTORS)
+        self.assertEqual(retrieval_service.decode_vector_search(count, body), (vectors, ['tax']))
+
+    def test_hits_round_trip(self):
+        from langchain_core.documents import Document
+
+        results = [
+            [Document(page_content='Pay yourself first.', id='12', metadata={'row_index': 12}),
+             Document(page_content='ünïcode ' * 10000, metadata={'source': 'a.md', 'score': 0.5})],
+            [],
+        ]
+        decoded = retrieval_service.decode_hits(2, retrieval_service.encode_hits(results))
+        self.assertEqual([[(d.id, d.page_content, d.metadata) for d in docs] for docs in decoded],
+                         [[(d.id, d.page_content, d.metadata) for d in docs] for docs in results])
+
+    def test_truncated_body_is_a_protocol_error(self):
+        _, count, body = self.body(retrieval_service.encode_search(['budget'], 5), retrieval_service.OP_SEARCH)
+        with self.assertRaises(retrieval_service.ProtocolError):
+            retrieval_service.decode_search(count, body[:-1])
+        with self.assertRaises(retrieval_service.ProtocolError):
+            retrieval_service.decode_hits(1, b'\x01\x00')
+
+
+class ProjectionTests(SimpleTestCase):
+    def scenario(self, **overrides):
+        scenario = {'principal': 1000.0, 'contribution': 100.0, 'rate': 6.0, 'years': 10.0, 'compounding': 12}
+        scenario.update(overrides)
+        return scenario
+
+    def test_lttb_keeps_the_ends_and_the_peaks(self):
+        import numpy as np
+
+        x = np.arange(100, dtype=float)
+        y = np.zeros(100)
+        y[37] = 50.0
+        y[81] = -20.0
+        keep = lttb(x, y, 10)
+        self.assertEqual(len(keep), 10)
+        self.assertEqual((keep[0], keep[-1]), (0, 99))
+        self.assertTrue(all(a < b for a, b in zip(keep, keep[1:])))
+        self.assertIn(37, keep)
+        self.assertIn(81, keep)
+        # Nothing to drop, or too few points asked for
+        self.assertEqual(list(lttb(x[:5], y[:5], 10)), [0, 1, 2, 3, 4])
+        self.assertEqual(len(lttb(x, y, 2)), 100)
+
+    def test_series_ends_at_the_closed_form_value(self):
+        [series] = project([self.scenario()], 'yearly')
+        self.assertEqual(series['periods'], 11)
+        self.assertEqual(series['month'][:3], [0, 12, 24])
+        monthly = 0.06 / 12
+        expected = 1000 * (1 + monthly) ** 120 + 100 * ((1 + monthly) ** 120 - 1) / monthly
+        self.assertAlmostEqual(series['balance'][-1], expected, places=1)
+        self.assertEqual(series['balance'][0], 1000)
+        self.assertEqual(series['invested'][-1], 1000 + 100 * 120)
+
+    def test_period_by_period(self):
+        [monthly] = project([self.scenario(years=2)], 'monthly')
+        [quarterly] = project([self.scenario(years=2)], 'quarterly')
+        self.assertEqual(monthly['periods'], 25)
+        self.assertEqual(quarterly['month'], [0, 3, 6, 9, 12, 15, 18, 21, 24])
+        self.assertEqual(quarterly['balance'], monthly['balance'][::3])
+        self.assertTrue(all(a < b for a, b in zip(monthly['balance'], monthly['balance'][1:])))
+
+    def test_zero_rate_and_continuous_compounding(self):
+        [flat] = project([self.scenario(rate=0.0)])
+        self.assertEqual(flat['balance'], flat['invested'])
+        [continuous] = project([self.scenario(contribution=0.0, compounding='continuous')])
+        self.assertAlmostEqual(continuous['balance'][-1], 1000 * math.exp(0.6), places=1)
+
+    def test_scenarios_end_at_their_own_horizon(self):
+        short, long = project([self.scenario(years=2.5, label='short'), self.scenario(years=5)])
+        self.assertEqual(short['label'], 'short')
+        self.assertEqual(long['label'], '6%')
+        self.assertEqual(short['month'], [0, 12, 24, 30])
+        self.assertEqual(long['month'][-1], 60)
+
+    def test_points_downsamples(self):
+        [series] = project([self.scenario(years=50)], 'monthly', points=20)
+        self.assertEqual((series['points'], series['periods']), (20, 601))
+        self.assertEqual((series['month'][0], series['month'][-1]), (0, 600))
+
+    def test_invalid_requests(self):
+        for args in (([self.scenario()], 'weekly'), ([], 'yearly'), ([self.scenario(years=0)], 'yearly'),
+                     ([self.scenario(years=101)], 'yearly'), ([self.scenario()], 'yearly', 2)):
+            with self.subTest(args=args[1:]), self.assertRaises(ValueError):
+                project(*args)
+
+    @override_settings(RATE_LIMIT_ENABLED=False)
+    def test_calculator_series_matches_its_end_value(self):
+        response = Client(HTTP_HOST='localhost').post(
+            '/api/calculate-compound-interest/',
+            {'principal': 1000, 'rate': 5, 'time': 10, 'series': {'period': 'yearly'}},
+            content_type='application/json')
+        data = response.json()
+        self.assertEqual(data['series']['scenarios'][0]['balance'][-1], data['final_amount'])
+
+    def test_non_finite_numbers_are_rejected(self):
+        with self.assertRaisesMessage(ValueError, 'rate must be a finite number'):
+            scenarios_from_request({'scenarios': [{'rate': 'nan'}]}, self.scenario())
+        with self.assertRaises(ValueError):
+            project([self.scenario(principal=float('inf'))])
+        with self.assertRaisesMessage(ValueError, 'balance overflows'):
+            project([self.scenario(rate=1e6, years=100)])
+
+    @override_settings(RATE_LIMIT_ENABLED=False)
+    def test_calculators_answer_400_for_non_finite_input(self):
+        client = Client(HTTP_HOST='localhost')
+        for url, body in (
+                ('/api/calculate-compound-interest/', {'principal': 'inf', 'rate': 5, 'time': 10}),
+                ('/api/calculate-compound-interest/', {'principal': 1000, 'rate': 1e6, 'time': 100}),
+                ('/api/calculate-compound-interest/', {'principal': 1000, 'rate': 5, 'time': 10, 'series': True,
+                                                       'scenarios': [{'rate': 'Infinity'}]}),
+                ('/api/calculate-investment-growth/', {'initial': 'nan', 'annual_return': 7, 'years': 10})):
+            with self.subTest(body=body):
+                response = client.post(url, body, content_type='application/json')
+                self.assertEqual(response.status_code, 400)
+                self.assertIn('Invalid input', json.loads(response.content)['error'])
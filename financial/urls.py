@@ -7,6 +7,9 @@ urlpatterns = [
     path('', views.home, name='home'),
     path('chatbot/', views.chatbot, name='chatbot'),
     path('api/chat/', views.chat_api, name='chat_api'),
+    path('api/chat/prefetch/', views.chat_prefetch, name='chat_prefetch'),
+    path('api/health/', views.health, name='health'),
+    path('api/ready/', views.ready, name='ready'),
     # Ollama-backed chatbot endpoint (expects POST JSON {"message": "..."})
     path('api/chatbot/', views.chatbot_api, name='chatbot_api'),
     # Compatibility alias used by some guides / earlier frontend code
@@ -1,14 +1,38 @@
 import requests
 from django.shortcuts import render
-from django.http import JsonResponse
+from django.http import JsonResponse, StreamingHttpResponse
 from django.views.decorators.csrf import csrf_exempt
+import functools
 import json
-import pandas as pd
+import math
+import os
 import logging
+import time
 import subprocess
 from django.conf import settings
-from langchain_ollama import OllamaLLM
-from langchain_core.prompts import ChatPromptTemplate
+
+from circuit_breaker import CircuitOpenError
+from deadline import Deadline, DeadlineExceeded, GenerationRate, call_timeout, current as current_deadline, deadline_scope
+from memory_watchdog import MemoryWatchdog, SlotLimiter, SlotUnavailable
+from model_router import ModelRouter, Tier
+from ollama_pool import configure as configure_ollama_pool
+from ollama_warmup import READY, Warmer, read_state
+
+from .conversations import ConversationStore
+from .analytics import EventLogger
+from .faq import faq_index
+from .pagecache import cached_page
+from .prefetch import PrefetchCache
+from .projections import COMPACT_JSON, compounding_frequency, finite_number, series_response
+from .singleflight import SingleFlight, CoalesceTimeout, request_key
+from .startup import ai_stack, timed
+
+logger = logging.getLogger(__name__)
+
+# Shared Ollama backend pool (OLLAMA_API_BASE may list several servers);
+# built before the retriever so query embeddings use the same routing
+with timed('ollama pool'):
+    ollama_pool = configure_ollama_pool(settings.OLLAMA_API_BASE)
 
 # Import simple fallback for when Ollama is unavailable
 try:
@@ -18,38 +42,6 @@ except ImportError:
     SIMPLE_FALLBACK_AVAILABLE = False
     simple_search = None
 
-# Try to import vector retriever (requires Ollama embeddings)
-try:
-    from vector_enhanced import get_retriever
-    retriever = get_retriever()
-    logger_temp = logging.getLogger(__name__)
-    logger_temp.info('Vector retriever initialized successfully')
-except Exception as e:
-    retriever = None
-    logger_temp = logging.getLogger(__name__)
-    logger_temp.warning('Vector retriever initialization failed: %s', str(e))
-
-logger = logging.getLogger(__name__)
-
-# Initialize LLM (used by the LangChain chat_api)
-try:
-    # Ensure we're using localhost without any proxy
-    import os
-    os.environ['NO_PROXY'] = 'localhost,127.0.0.1'
-    os.environ['no_proxy'] = 'localhost,127.0.0.1'
-    
-    # Use shorter timeout for memory-constrained environments
-    model = OllamaLLM(
-        model=settings.OLLAMA_MODEL or "llama3.2:latest", 
-        base_url=settings.OLLAMA_API_BASE,
-        timeout=60,  # Reduced from 30 to give more time but not too long
-        num_predict=256  # Limit response length to reduce memory usage
-    )
-    logger.info('LLM initialized successfully with model: %s', settings.OLLAMA_MODEL)
-except Exception as e:
-    model = None
-    logger.warning('LLM initialization failed: %s', str(e))
-
 # System prompt for financial assistant
 SYSTEM_PROMPT = """You are a warm, friendly, and knowledgeable financial advisor AI. 
 Your goal is to help people understand personal finance and make better financial decisions.
@@ -68,45 +60,294 @@ Guidelines for your responses:
 
 When answering questions, use the financial knowledge provided to ground your responses."""
 
+# Collapses identical concurrent questions onto a single Ollama generation
+chat_flights = SingleFlight(timeout=settings.CHAT_COALESCE_TIMEOUT)
+
+# Observed tokens/second per model, for fitting num_predict to the deadline
+generation_rates = GenerationRate(settings.CHAT_TOKENS_PER_SECOND)
+
+# Retrieval results computed while the user types, reused when they submit;
+# a submit that races its own prefetch joins it instead of retrieving twice
+prefetch_cache = PrefetchCache(max_entries=settings.CHAT_PREFETCH_MAX_ENTRIES,
+                               ttl=settings.CHAT_PREFETCH_TTL)
+retrieval_flights = SingleFlight(timeout=settings.CHAT_COALESCE_TIMEOUT)
+
+# Chat analytics: events are queued and bulk-inserted by a background thread
+chat_events = EventLogger(
+    batch_size=settings.CHAT_ANALYTICS_BATCH_SIZE,
+    flush_ms=settings.CHAT_ANALYTICS_FLUSH_MS,
+    max_queue=settings.CHAT_ANALYTICS_MAX_QUEUE,
+    spill_path=settings.CHAT_ANALYTICS_SPILL_PATH,
+)
+
+# Multi-turn sessions (bounded history + reusable Ollama token context)
+conversations = ConversationStore(
+    max_sessions=settings.CHAT_MAX_SESSIONS,
+    idle_seconds=settings.CHAT_SESSION_IDLE_SECONDS,
+    max_bytes=settings.CHAT_SESSION_MAX_BYTES,
+    token_budget=settings.CHAT_HISTORY_TOKEN_BUDGET,
+    max_context_tokens=settings.CHAT_MAX_CONTEXT_TOKENS,
+)
+
+# Picks the small or large model tier per question
+model_router = ModelRouter(
+    small=Tier('small', settings.OLLAMA_SMALL_MODEL, settings.SMALL_NUM_PREDICT),
+    large=Tier('large', settings.OLLAMA_LARGE_MODEL, settings.LARGE_NUM_PREDICT),
+    pool=ollama_pool,
+    latency_budget=settings.LARGE_TIER_LATENCY_BUDGET,
+)
+
+# Preloads both tiers (and the embedding model) so the first chat does not pay
+# model-load time; readiness is reported only once this finishes
+warmer = Warmer(
+    ollama_pool,
+    [settings.OLLAMA_SMALL_MODEL, settings.OLLAMA_LARGE_MODEL],
+    embed_model=settings.EMBED_MODEL if settings.EMBED_PROVIDER == 'ollama' else None,
+    keep_alive=settings.OLLAMA_KEEP_ALIVE,
+    keep_warm_seconds=settings.OLLAMA_KEEP_WARM_SECONDS,
+)
+WARMUP_ENABLED = settings.OLLAMA_WARMUP and os.environ.get('USE_OLLAMA', 'true').lower() == 'true'
+
+# Steps generation down (shorter replies, fewer concurrent calls, retrieval
+# only) as available memory runs out, instead of getting OOM-killed
+llm_slots = SlotLimiter(settings.LLM_MAX_CONCURRENCY, wait=settings.LLM_SLOT_WAIT)
+memory_watchdog = MemoryWatchdog(
+    llm_slots,
+    elevated_mb=settings.MEMORY_ELEVATED_MB,
+    high_mb=settings.MEMORY_HIGH_MB,
+    critical_mb=settings.MEMORY_CRITICAL_MB,
+    hysteresis_mb=settings.MEMORY_HYSTERESIS_MB,
+    interval=settings.MEMORY_WATCHDOG_INTERVAL,
+)
+
+
+def start_background_threads(warm=True):
+    """Start this process's analytics writer and memory watchdog, and (with
+    `warm`, unless a supervisor warms the models for every worker) warm-up.
+
+    Called from the server entry point (financial.startup.start_serving) and
+    again in each forked worker, never at import: management commands load
+    the URLconf too.
+    """
+    if settings.CHAT_ANALYTICS:
+        chat_events.ensure_started()
+    if settings.MEMORY_WATCHDOG:
+        memory_watchdog.ensure_started()
+    if warm and WARMUP_ENABLED and not settings.OLLAMA_WARMUP_STATE:
+        warmer.ensure_started()
+
 
+def warmup_snapshot():
+    """The supervisor's published warm-up state, or this process's own"""
+    if settings.OLLAMA_WARMUP_STATE:
+        return read_state(settings.OLLAMA_WARMUP_STATE)
+    warmer.ensure_started()
+    return warmer.snapshot()
+
+
+def requested_collections(data):
+    """The request's 'collections' filter (None searches everything); ValueError if unknown."""
+    from knowledge_sources import available_collections, parse_collections
+
+    collections = parse_collections(data.get('collections'))
+    if collections:
+        available = available_collections()
+        unknown = sorted(set(collections) - set(available))
+        if unknown:
+            raise ValueError(f"Unknown collection(s) {', '.join(unknown)}; available: {', '.join(available)}")
+    return collections
+
+
+def scoped_query(query, collections):
+    """Prefetch/coalescing key: the same question filtered differently retrieves differently"""
+    return f"{query} [in:{','.join(collections)}]" if collections else query
+
+
+def embed_question(text):
+    """The query embedding for `text`, or None if embedding failed"""
+    try:
+        from embeddings import shared_embeddings
+        return shared_embeddings().embed_query(text)
+    except Exception as e:
+        logger.info('Query embedding failed: %s', str(e))
+        return None
+
+
+def retrieve_context(user_message, collections=None, vector=None):
+    """Retrieve grounding context: vector retriever first, keyword search as fallback.
+    `vector` is user_message's embedding, when the caller already has it."""
+    from knowledge_sources import DEFAULT_COLLECTION
+
+    context = ""
+    # Wait for the AI stack to load no longer than the request can afford;
+    # keyword search answers until it is ready
+    deadline = current_deadline()
+    retriever = ai_stack.get_retriever(None if deadline is None else deadline.remaining())
+    if retriever and collections and not getattr(retriever, 'collections', None):
+        # Without knowledge shards the vector index holds the main corpus alone
+        retriever = retriever if collections == [DEFAULT_COLLECTION] else None
+    if retriever:
+        try:
+            if vector is not None:
+                docs = ai_stack.search_vectors([vector], collections)[0]
+            elif collections:
+                docs = retriever.invoke(user_message, collections=collections)
+            else:
+                docs = retriever.invoke(user_message)
+            context = "\n".join([doc.page_content for doc in docs])
+        except Exception as e:
+            # e.g. CircuitOpenError from Ollama embeddings during an outage
+            logger.info('Vector retrieval unavailable, using keyword search: %s', str(e))
+            context = ""
+    if not context and SIMPLE_FALLBACK_AVAILABLE:
+        # Use simple keyword search as fallback
+        try:
+            context = simple_search(user_message, top_k=2, collections=collections)
+        except Exception as e:
+            logger.warning('Simple fallback search failed: %s', str(e))
+            context = ""
+    return context
+
+
+def retrieval_query_for(conversation, user_message):
+    """Follow-ups like "what about for kids?" retrieve better with the previous question"""
+    if conversation is not None and conversation.turns:
+        return f"{conversation.turns[-2][1]} {user_message}"
+    return user_message
+
+
+def bounded_retrieval(retrieval_query, collections=None, vector=None):
+    """retrieve_context with at most CHAT_RETRIEVAL_TIMEOUT of the request's budget"""
+    deadline = current_deadline()
+    if deadline is None:
+        return retrieve_context(retrieval_query, collections, vector)
+    with deadline_scope(deadline.child(settings.CHAT_RETRIEVAL_TIMEOUT)):
+        return retrieve_context(retrieval_query, collections, vector)
+
+
+def cached_context(retrieval_query, token=None, collections=None, vector=None):
+    """(context, how): prefetched/cached context when the text matches, else retrieve now."""
+    key = scoped_query(retrieval_query, collections)
+    if settings.CHAT_PREFETCH:
+        context, how = prefetch_cache.get(key, token)
+        if how:
+            return context, how
+    context = retrieval_flights.do(request_key(key),
+                                   lambda: bounded_retrieval(retrieval_query, collections, vector),
+                                   timeout=call_timeout(settings.CHAT_COALESCE_TIMEOUT, 'retrieval'))
+    if settings.CHAT_PREFETCH and context:
+        prefetch_cache.put(key, context)
+    return context, 'computed'
+
+
+@cached_page
 def home(request):
     return render(request, 'financial/home.html')
 
 
+@cached_page
 def chatbot(request):
     return render(request, 'financial/chatbot.html')
 
 
+def logged_chat(view):
+    """Record each answered chat request as a ChatEvent (write-behind, see
+    financial/analytics.py). The view fills in request.chat_event as it goes."""
+    @functools.wraps(view)
+    def wrapper(request, *args, **kwargs):
+        started = time.monotonic()
+        request.chat_event = event = {}
+        response = view(request, *args, **kwargs)
+        if settings.CHAT_ANALYTICS and event.get('question'):
+            chat_events.record(
+                latency_ms=round((time.monotonic() - started) * 1000, 1),
+                status_code=response.status_code,
+                response_bytes=0 if response.streaming else len(response.content),
+                **event,
+            )
+        return response
+    return wrapper
+
+
+def request_deadline(request):
+    """CHAT_DEADLINE, or the client's X-Request-Timeout, at most CHAT_DEADLINE_MAX seconds."""
+    seconds = settings.CHAT_DEADLINE
+    try:
+        seconds = float(request.headers.get('X-Request-Timeout') or seconds)
+    except ValueError:
+        pass
+    return Deadline(min(max(seconds, 1.0), settings.CHAT_DEADLINE_MAX), settings.CHAT_DEADLINE_RESERVE)
+
+
+def deadline_bound(view):
+    """Run the view under a per-request Deadline (request.deadline): every
+    Ollama call it makes is capped at what is left of the budget."""
+    @functools.wraps(view)
+    def wrapper(request, *args, **kwargs):
+        request.deadline = request_deadline(request)
+        with deadline_scope(request.deadline):
+            return view(request, *args, **kwargs)
+    return wrapper
+
+
+def deadline_reply(context, event):
+    """Best answer once the budget is spent: retrieved context, else a retry hint."""
+    event['source'] = 'deadline'
+    if context:
+        message = ("⏱️ I couldn't finish a full answer in time.\n\n" +
+                   "📚 Here's relevant information from our financial knowledge base:\n\n" +
+                   context[:600])
+    else:
+        message = "⏱️ I couldn't finish an answer in time. Please try again, or ask a shorter question."
+    return JsonResponse({'response': message, 'timed_out': True})
+
+
 @csrf_exempt
+@logged_chat
+@deadline_bound
 def chat_api(request):
     """LangChain-backed chat endpoint (POST JSON with 'message')."""
     if request.method != 'POST':
         return JsonResponse({'error': 'Method not allowed'}, status=405)
 
+    event = request.chat_event
+    deadline = request.deadline
+    context = ''
     try:
         data = json.loads(request.body)
         user_message = data.get('message', '').strip()
 
         if not user_message:
             return JsonResponse({'error': 'Empty message'}, status=400)
-
-        # Retrieve context if retriever available
-        context = ""
-        if retriever:
-            try:
-                docs = retriever.invoke(user_message)
-                context = "\n".join([doc.page_content for doc in docs])
-            except Exception:
-                context = ""
-        elif SIMPLE_FALLBACK_AVAILABLE:
-            # Use simple keyword search as fallback
-            try:
-                context = simple_search(user_message, top_k=2)
-            except Exception as e:
-                logger.warning('Simple fallback search failed: %s', str(e))
-                context = ""
+        try:
+            collections = requested_collections(data)
+        except ValueError as e:
+            return JsonResponse({'error': str(e)}, status=400)
+
+        conversation, _ = conversations.get(data.get('session_id'))
+        follow_up = bool(conversation.turns)
+        event.update(question=user_message, follow_up=follow_up, source='error')
+
+        # Serve a precomputed FAQ answer when the question is close enough
+        # (first turns only - follow-ups depend on what was said before - and
+        # unfiltered ones, since a collections filter asks for those sources)
+        faq_match = query_vector = None
+        if not follow_up and not collections and faq_index.has_answers():
+            # A first turn retrieves with the question itself, so embed it once for both
+            query_vector = embed_question(user_message)
+            faq_match = faq_index.match(user_message, query_vector)
+        if faq_match:
+            event['source'] = 'faq'
+            conversations.record(conversation, user_message, faq_match.answer)
+            return JsonResponse({'response': faq_match.answer, 'source': 'faq',
+                                 'session_id': conversation.session_id})
+
+        context, retrieval = cached_context(retrieval_query_for(conversation, user_message),
+                                            data.get('prefetch_token'), collections, query_vector)
+        event['retrieval'] = retrieval
 
         # Create prompt template
+        from langchain_core.prompts import ChatPromptTemplate
         prompt = ChatPromptTemplate.from_messages([
             ("system", SYSTEM_PROMPT),
             ("human", """Based on the following financial context, answer the user's question.
@@ -116,7 +357,10 @@ Financial Context:
 User Question: {question}""")
         ])
 
-        if model is None:
+        # Generation goes through ollama_pool, so a stack that is still loading
+        # doesn't hold the request up; only a finished load without an LLM does
+        if ai_stack.state() == 'loaded' and ai_stack.llm is None:
+            event['source'] = 'no_llm'
             # Provide helpful fallback when Ollama is not available
             fallback_msg = (
                 "I apologize, but the AI service is currently unavailable. "
@@ -132,14 +376,16 @@ User Question: {question}""")
             
             return JsonResponse({'response': fallback_msg})
 
-        # Check if we should skip Ollama due to resource constraints
+        # Check if we should skip Ollama due to resource constraints, or because
+        # the circuit breaker has seen it failing (answer in milliseconds instead)
         USE_OLLAMA = os.environ.get('USE_OLLAMA', 'true').lower() == 'true'
         
-        if not USE_OLLAMA:
+        if not USE_OLLAMA or ollama_pool.is_open() or memory_watchdog.retrieval_only():
+            event['source'] = 'retrieval_only'
             # Fallback mode - use only database context
             if context:
                 # Context already formatted by simple_search if using fallback
-                if SIMPLE_FALLBACK_AVAILABLE and not retriever:
+                if SIMPLE_FALLBACK_AVAILABLE and not ai_stack.retriever:
                     return JsonResponse({'response': context})
                 else:
                     fallback_msg = (
@@ -152,10 +398,52 @@ User Question: {question}""")
             else:
                 return JsonResponse({'response': 'I can help with financial questions. Try asking about budgeting, investing, savings, or debt management!'})
 
+        route = model_router.route(user_message, context)
+        num_predict = memory_watchdog.num_predict(route.num_predict)
+        if num_predict != route.num_predict:
+            route.reasons.append(f'num_predict {route.num_predict}->{num_predict} (memory pressure)')
+            route.num_predict = num_predict
+        # Ask for no more tokens than the model can produce in the time left
+        rate = generation_rates.get(route.model)
+        deadline.check('generation', minimum=rate[1])
+        num_predict = deadline.num_predict(route.num_predict, rate)
+        if num_predict != route.num_predict:
+            route.reasons.append(f'num_predict {route.num_predict}->{num_predict} '
+                                 f'({deadline.remaining():.0f}s left)')
+            route.num_predict = num_predict
+        flight_key = request_key(user_message, context, route.model)
+        event.update(model=route.model, tier=route.tier, source='stream' if data.get('stream') else 'llm')
+
+        if data.get('stream'):
+            response = StreamingHttpResponse(
+                _stream_reply(flight_key, user_message, context, route, conversation, deadline),
+                content_type='text/plain; charset=utf-8'
+            )
+            response['X-Model-Tier'] = route.tier
+            response['X-Session-Id'] = conversation.session_id
+            response['X-Retrieval'] = retrieval
+            return response
+
         try:
-            # Use direct Ollama API call with streaming to reduce memory
-            ollama_response = ollama_chat_direct(user_message, context)
+            if follow_up:
+                # Continue this session's Ollama context so the shared prefix isn't re-evaluated
+                with llm_slots.slot(timeout=deadline.timeout(settings.LLM_SLOT_WAIT, 'llm slot')):
+                    ollama_response, ollama_context = ollama_generate(
+                        user_message, context, route.model, route.num_predict, conversation
+                    )
+            else:
+                # Use direct Ollama API call; identical in-flight first questions share one generation
+                def generate():
+                    with llm_slots.slot(timeout=deadline.timeout(settings.LLM_SLOT_WAIT, 'llm slot')):
+                        return ollama_generate(user_message, context, route.model, route.num_predict)
+
+                ollama_response, ollama_context = chat_flights.do(
+                    flight_key, generate, timeout=deadline.timeout(settings.CHAT_COALESCE_TIMEOUT, 'coalesce'))
+            if ollama_response.startswith('ERROR:') and deadline.expired():
+                logger.warning('Generation ran out of time: %s', ollama_response)
+                return deadline_reply(context, event)
             if ollama_response.startswith('ERROR:'):
+                event['source'] = 'llm_error'
                 # If Ollama fails, use context-based fallback
                 if context:
                     fallback_msg = (
@@ -171,8 +459,31 @@ User Question: {question}""")
                         'details': ollama_response
                     }, status=503)
             
-            return JsonResponse({'response': ollama_response})
+            conversations.record(conversation, user_message, ollama_response,
+                                 route.model, ollama_context)
+            response = JsonResponse({'response': ollama_response,
+                                     'session_id': conversation.session_id})
+            response['X-Model-Tier'] = route.tier
+            response['X-Retrieval'] = retrieval
+            return response
+        except DeadlineExceeded as e:
+            logger.warning('Chat request ran out of time: %s', str(e))
+            return deadline_reply(context, event)
+        except (CoalesceTimeout, SlotUnavailable) as wait_error:
+            event['source'] = 'busy'
+            logger.warning('Coalesced chat request gave up waiting: %s', str(wait_error))
+            if context:
+                return JsonResponse({'response': (
+                    "⚠️ The AI service is busy right now.\n\n" +
+                    "📚 Here's relevant information from our financial knowledge base:\n\n" +
+                    context[:600]
+                )})
+            return JsonResponse({
+                'error': 'AI service temporarily unavailable',
+                'details': 'Request timed out - server may be overloaded'
+            }, status=503)
         except Exception as llm_error:
+            event['source'] = 'llm_error'
             logger.error('LLM invocation error: %s', str(llm_error))
             # Provide context-based fallback if LLM fails
             if context:
@@ -184,7 +495,11 @@ User Question: {question}""")
                 return JsonResponse({'response': fallback_msg})
             raise
             
+    except DeadlineExceeded as e:
+        logger.warning('Chat request ran out of time: %s', str(e))
+        return deadline_reply(context, event)
     except Exception as e:
+        event['source'] = 'error'
         logger.exception('chat_api error')
         error_msg = str(e)
         if 'Connection refused' in error_msg or 'bad gateway' in error_msg.lower():
@@ -195,73 +510,205 @@ User Question: {question}""")
         return JsonResponse({'error': f'Server error: {error_msg}'}, status=500)
 
 
-def ollama_chat_direct(user_message, context=""):
+@csrf_exempt
+@deadline_bound
+def chat_prefetch(request):
+    """Retrieval only, for a message still being typed (POST JSON 'message', 'session_id',
+    optional 'collections').
+
+    Returns a token to send back as 'prefetch_token' with the final message.
     """
-    Memory-efficient direct call to Ollama API with context injection.
-    Returns formatted response or ERROR: prefix on failure.
+    if request.method != 'POST':
+        return JsonResponse({'error': 'Method not allowed'}, status=405)
+    if not settings.CHAT_PREFETCH:
+        return JsonResponse({'token': None, 'enabled': False})
+    try:
+        data = json.loads(request.body)
+    except ValueError:
+        return JsonResponse({'error': 'Invalid JSON'}, status=400)
+    user_message = (data.get('message') or '').strip()
+    if len(user_message) < 3:
+        return JsonResponse({'error': 'Message too short'}, status=400)
+    try:
+        collections = requested_collections(data)
+    except ValueError as e:
+        return JsonResponse({'error': str(e)}, status=400)
+
+    # Peek: a prefetch must not create (or refresh) a chat session
+    retrieval_query = retrieval_query_for(conversations.peek(data.get('session_id')), user_message)
+    key = scoped_query(retrieval_query, collections)
+    context, how = prefetch_cache.get(key)
+    if not how:
+        context = retrieval_flights.do(request_key(key), lambda: bounded_retrieval(retrieval_query, collections),
+                                       timeout=call_timeout(settings.CHAT_COALESCE_TIMEOUT, 'retrieval'))
+    if not context:
+        # Nothing worth reusing; the submit will retrieve (and fall back) itself
+        return JsonResponse({'token': None, 'cached': False, 'context_chars': 0})
+    token = prefetch_cache.put(key, context, prefetched=True)
+    return JsonResponse({'token': token, 'cached': bool(how), 'context_chars': len(context)})
+
+
+def _stream_reply(flight_key, user_message, context, route, conversation, deadline):
+    """Yield response chunks for a streaming chat, degrading to context on failure.
+
+    Runs after the view has returned (outside its deadline scope), so the
+    deadline is passed explicitly; when it expires mid-answer the partial
+    answer is kept and marked as cut short.
     """
-    base = (settings.OLLAMA_API_BASE or '').rstrip('/')
-    if not base:
-        return 'ERROR: OLLAMA_API_BASE not configured'
-    
-    # Construct prompt with context
+    history = conversation.history_text()
+
+    def make_stream():
+        with llm_slots.slot(timeout=deadline.timeout(settings.LLM_SLOT_WAIT, 'llm slot')):
+            yield from ollama_chat_stream(user_message, context, route.model, route.num_predict, history,
+                                          deadline)
+
+    chunks = []
+    try:
+        # Only first turns are shareable - follow-ups carry per-session history
+        stream = make_stream() if history else chat_flights.stream(
+            flight_key, make_stream, timeout=deadline.timeout(settings.CHAT_COALESCE_TIMEOUT, 'coalesce'))
+        for chunk in stream:
+            chunks.append(chunk)
+            yield chunk
+        conversations.record(conversation, user_message, ''.join(chunks))
+    except DeadlineExceeded as e:
+        logger.warning('Streaming chat ran out of time: %s', str(e))
+        if chunks:
+            conversations.record(conversation, user_message, ''.join(chunks))
+            yield "…\n\n⏱️ (Answer cut short to reply in time.)"
+        elif context:
+            yield ("⏱️ I couldn't finish a full answer in time.\n\n" +
+                   "📚 Here's relevant information from our financial knowledge base:\n\n" + context[:600])
+        else:
+            yield "⏱️ I couldn't finish an answer in time. Please try again, or ask a shorter question."
+    except Exception as e:
+        logger.warning('Streaming chat failed: %s', str(e))
+        if context:
+            yield (
+                "\n\n⚠️ The AI service is temporarily unavailable.\n\n" +
+                "📚 Here's relevant information from our financial knowledge base:\n\n" +
+                context[:600]
+            )
+        else:
+            yield "\n\n⚠️ The AI service is temporarily unavailable. Please try again shortly."
+
+
+def build_prompt(user_message, context="", history="", continuing=False):
+    """Construct the prompt sent to /api/generate.
+
+    `history` is the text form of earlier turns; with `continuing=True` the
+    system prompt and history are already in Ollama's token context, so only
+    the new turn is sent.
+    """
+    parts = [] if continuing else [SYSTEM_PROMPT]
+    if history and not continuing:
+        parts.append(f"Conversation so far:\n{history}")
     if context:
-        full_prompt = f"""{SYSTEM_PROMPT}
+        parts.append(f"Financial Context:\n{context[:1000]}")
+    parts.append(f"User Question: {user_message}")
+    parts.append("Provide a helpful, concise response (max 250 words):")
+    return "\n\n".join(parts)
 
-Financial Context:
-{context[:1000]}
 
-User Question: {user_message}
+def ollama_chat_stream(user_message, context="", model_name=None, num_predict=300, history="", deadline=None):
+    """Stream response text chunks from Ollama's /api/generate; raises on failure
+    (DeadlineExceeded once `deadline` passes, after the chunks already sent)."""
+    if not ollama_pool.backends:
+        raise RuntimeError('OLLAMA_API_BASE not configured')
 
-Provide a helpful, concise response (max 250 words):"""
-    else:
-        full_prompt = f"""{SYSTEM_PROMPT}
+    payload = {
+        'model': model_name or settings.OLLAMA_MODEL,
+        'prompt': build_prompt(user_message, context, history),
+        'stream': True,
+        'keep_alive': settings.OLLAMA_KEEP_ALIVE,
+        'options': {
+            'num_predict': num_predict,
+            'temperature': 0.7,
+            'top_p': 0.9
+        }
+    }
+    timeout = (deadline.timeout(settings.OLLAMA_GENERATE_TIMEOUT, 'generation') if deadline
+               else settings.OLLAMA_GENERATE_TIMEOUT)
+    for line in ollama_pool.stream_lines('/api/generate', payload, timeout=timeout):
+        part = json.loads(line)
+        if part.get('response'):
+            yield part['response']
+        if part.get('done'):
+            generation_rates.observe(payload['model'], part)
+            break
+        if deadline:
+            deadline.check('generation')
+
+
+def ollama_chat_direct(user_message, context="", model_name=None, num_predict=300):
+    """
+    Memory-efficient direct call to Ollama API with context injection.
+    Returns formatted response or ERROR: prefix on failure.
+    """
+    return ollama_generate(user_message, context, model_name, num_predict)[0]
 
-User Question: {user_message}
 
-Provide a helpful, concise response (max 250 words):"""
-    
+def ollama_generate(user_message, context="", model_name=None, num_predict=300, conversation=None):
+    """
+    Generate a reply, continuing `conversation` when given.
+    Returns (response text or ERROR: string, Ollama context token list or None).
+    """
+    if not ollama_pool.backends:
+        return 'ERROR: OLLAMA_API_BASE not configured', None
+
+    model_name = model_name or settings.OLLAMA_MODEL
+    prior_context = conversation.reusable_context(model_name) if conversation else None
+    if prior_context:
+        # System prompt and earlier turns are already evaluated in this token context
+        prompt = build_prompt(user_message, context, continuing=True)
+    else:
+        prompt = build_prompt(user_message, context, conversation.history_text() if conversation else "")
+
     payload = {
-        'model': settings.OLLAMA_MODEL,
-        'prompt': full_prompt,
+        'model': model_name,
+        'prompt': prompt,
         'stream': False,
+        'keep_alive': settings.OLLAMA_KEEP_ALIVE,
         'options': {
-            'num_predict': 300,  # Limit tokens to reduce memory
+            'num_predict': num_predict,  # Limit tokens to reduce memory
             'temperature': 0.7,
             'top_p': 0.9
         }
     }
-    
-    url = f"{base}/api/generate"
+    if prior_context:
+        payload['context'] = prior_context
     
     try:
         logger.info('Calling Ollama with reduced memory settings')
-        # Timeout needs to account for model load time + generation
-        resp = requests.post(
-            url, 
-            json=payload, 
-            timeout=90,  # 90 second timeout for t3.micro with tinyllama
-            proxies={'http': None, 'https': None}
-        )
+        # Model load time + generation, capped by the request deadline;
+        # the pool routes to the least-busy healthy backend
+        resp = ollama_pool.post('/api/generate', payload,
+                                timeout=call_timeout(settings.OLLAMA_GENERATE_TIMEOUT, 'generation'))
         
         if resp.status_code == 200:
             try:
-                return resp.json().get('response', 'No response from model')
+                body = resp.json()
+                generation_rates.observe(model_name, body)
+                return body.get('response', 'No response from model'), body.get('context')
             except Exception:
-                return resp.text
+                return resp.text, None
         else:
             logger.error('Ollama returned %s: %s', resp.status_code, resp.text[:200])
-            return f'ERROR: Ollama returned status {resp.status_code}'
+            return f'ERROR: Ollama returned status {resp.status_code}', None
             
+    except CircuitOpenError:
+        return 'ERROR: Ollama circuit open - skipping generation', None
+    except DeadlineExceeded:
+        raise
     except requests.exceptions.Timeout:
-        logger.error('Ollama request timed out after 90s')
-        return 'ERROR: Request timed out - server may be overloaded'
+        logger.error('Ollama request timed out')
+        return 'ERROR: Request timed out - server may be overloaded', None
     except requests.exceptions.ConnectionError as e:
         logger.error('Cannot connect to Ollama: %s', str(e))
-        return 'ERROR: Cannot connect to Ollama service'
+        return 'ERROR: Cannot connect to Ollama service', None
     except Exception as e:
         logger.exception('Ollama request failed')
-        return f'ERROR: {str(e)}'
+        return f'ERROR: {str(e)}', None
 
 
 def ollama_chat(prompt):
@@ -270,6 +717,7 @@ def ollama_chat(prompt):
         'model': settings.OLLAMA_MODEL, 
         'prompt': prompt,
         'stream': False,
+        'keep_alive': settings.OLLAMA_KEEP_ALIVE,
         'options': {'num_predict': 256}  # Limit response length
     }
 
@@ -281,19 +729,15 @@ def ollama_chat(prompt):
         '/generate'
     ]
 
-    base = (settings.OLLAMA_API_BASE or '').rstrip('/')
-    if not base:
+    if not ollama_pool.backends:
         logger.error('OLLAMA_API_BASE not set')
         return 'Ollama error: OLLAMA_API_BASE not configured'
 
     last_exc = None
     for ep in endpoints:
-        url = f"{base}{ep}"
         try:
-            logger.debug('Trying Ollama endpoint: %s', url)
-            # Disable proxies for direct connection (fixes local proxy issues)
-            # Use shorter timeout for memory-constrained environments
-            resp = requests.post(url, json=payload, timeout=30, proxies={'http': None, 'https': None})
+            logger.debug('Trying Ollama endpoint: %s', ep)
+            resp = ollama_pool.post(ep, payload, timeout=call_timeout(settings.OLLAMA_GENERATE_TIMEOUT, 'generation'))
             # If we get a successful response, return its text
             if resp.status_code >= 200 and resp.status_code < 300:
                 try:
@@ -303,28 +747,39 @@ def ollama_chat(prompt):
                     return resp.text
 
             # Record non-2xx for logging and continue to next candidate
-            logger.warning('Ollama endpoint %s returned %s: %s', url, resp.status_code, resp.text[:400])
-            last_exc = requests.exceptions.HTTPError(f"{resp.status_code} for {url}")
+            logger.warning('Ollama endpoint %s returned %s: %s', ep, resp.status_code, resp.text[:400])
+            last_exc = requests.exceptions.HTTPError(f"{resp.status_code} for {ep}")
+        except (CircuitOpenError, DeadlineExceeded) as e:
+            last_exc = e
+            break
         except requests.exceptions.ConnectionError as e:
             last_exc = e
-            logger.warning('Connection failed for %s: %s (Ollama may not be running)', url, str(e))
+            logger.warning('Connection failed for %s: %s (Ollama may not be running)', ep, str(e))
+            # The pool already failed over across hosts - no point trying other paths
+            break
         except requests.exceptions.Timeout as e:
             last_exc = e
-            logger.warning('Timeout contacting %s: %s', url, str(e))
+            logger.warning('Timeout contacting %s: %s', ep, str(e))
+            break
         except Exception as e:
             last_exc = e
-            logger.warning('Failed contacting %s: %s', url, str(e))
+            logger.warning('Failed contacting %s: %s', ep, str(e))
             # try the next endpoint
 
     # If we're here, all attempts failed
     logger.error('All Ollama endpoint attempts failed; last error: %s', str(last_exc))
     
     # Provide more helpful error message
+    if isinstance(last_exc, CircuitOpenError):
+        return 'Ollama service unavailable: circuit open after repeated failures'
+    if isinstance(last_exc, DeadlineExceeded):
+        return 'The AI service took too long to respond. Please try again.'
     if isinstance(last_exc, requests.exceptions.ConnectionError):
         return 'Unable to connect to Ollama service. Please ensure Ollama is installed and running on the server.'
     return f'Ollama service unavailable: {str(last_exc)}'
 
 
+@deadline_bound
 def chatbot_api(request):
     """Compatibility endpoint for simple GET requests used in the guide.
 
@@ -345,10 +800,51 @@ def chatbot_api(request):
     if not user_msg:
         return JsonResponse({'response': ''})
 
+    if ollama_pool.is_open():
+        # Ollama is known to be down: answer from the knowledge base right away
+        context = retrieve_context(user_msg)
+        return JsonResponse({'response': context or 'The AI service is temporarily unavailable.'})
+
     reply = ollama_chat(user_msg)
     return JsonResponse({'response': reply})
 
 
+def health(request):
+    """Report cached backend health (circuit breaker state); never calls Ollama."""
+    from knowledge_sources import available_collections
+
+    pool = ollama_pool.snapshot()
+    all_closed = all(b['breaker']['state'] == 'closed' for b in pool['backends'])
+    under_pressure = settings.MEMORY_WATCHDOG and memory_watchdog.level > 0
+    return JsonResponse({
+        'status': 'ok' if all_closed and not under_pressure else 'degraded',
+        'ollama': pool,
+        'model_router': model_router.snapshot(),
+        'generation_rates': generation_rates.snapshot(),
+        'conversations': conversations.snapshot(),
+        'prefetch': prefetch_cache.snapshot() if settings.CHAT_PREFETCH else None,
+        'analytics': chat_events.snapshot() if settings.CHAT_ANALYTICS else None,
+        'warmup': warmup_snapshot() if WARMUP_ENABLED else None,
+        'memory': memory_watchdog.snapshot() if settings.MEMORY_WATCHDOG else None,
+        'ai_stack': ai_stack.state(),
+        'retriever': ai_stack.retriever is not None,
+        'retrieval_service': (ai_stack.retriever.snapshot()
+                              if hasattr(ai_stack.retriever, 'snapshot') else None),
+        'collections': available_collections(),
+        'simple_fallback': SIMPLE_FALLBACK_AVAILABLE,
+    })
+
+
+def ready(request):
+    """Readiness probe: 503 until model warm-up has finished."""
+    if not WARMUP_ENABLED:
+        return JsonResponse({'ready': True, 'warmup': None})
+    state = warmup_snapshot()['state']
+    return JsonResponse({'ready': state == READY, 'warmup': state},
+                        status=200 if state == READY else 503)
+
+
+@cached_page
 def budget(request):
     return render(request, 'financial/budget.html')
 
@@ -398,6 +894,7 @@ def calculate_budget(request):
     return JsonResponse({'error': 'Method not allowed'}, status=405)
 
 
+@cached_page
 def calculator(request):
     return render(request, 'financial/calculator.html')
 
@@ -407,23 +904,32 @@ def calculate_compound_interest(request):
     if request.method == 'POST':
         try:
             data = json.loads(request.body)
-            principal = float(data.get('principal', 0))
-            rate = float(data.get('rate', 0))
-            time = float(data.get('time', 0))
-            frequency = int(data.get('frequency', 12))
+            principal = finite_number(data.get('principal', 0), 'principal')
+            rate = finite_number(data.get('rate', 0), 'rate')
+            time = finite_number(data.get('time', 0), 'time')
+            frequency = compounding_frequency(data.get('frequency'))
 
             rate_decimal = rate / 100
-            amount = principal * ((1 + rate_decimal / frequency) ** (frequency * time))
+            if frequency == 'continuous':
+                amount = principal * math.exp(rate_decimal * time)
+            else:
+                amount = principal * ((1 + rate_decimal / frequency) ** (frequency * time))
+            amount = finite_number(amount, 'final amount')
             interest = amount - principal
 
-            return JsonResponse({
+            result = {
                 'principal': round(principal, 2),
                 'rate': rate,
                 'time': time,
                 'final_amount': round(amount, 2),
                 'interest_earned': round(interest, 2)
-            })
-        except (ValueError, KeyError) as e:
+            }
+            if data.get('series'):
+                result['series'] = series_response(data, {
+                    'principal': principal, 'contribution': 0.0, 'rate': rate,
+                    'years': time, 'compounding': frequency})
+            return JsonResponse(result, json_dumps_params=COMPACT_JSON)
+        except (ValueError, KeyError, TypeError, OverflowError) as e:
             return JsonResponse({'error': f'Invalid input: {str(e)}'}, status=400)
         except Exception as e:
             logger.exception('calculate_compound_interest error')
@@ -477,12 +983,17 @@ def calculate_investment_growth(request):
     if request.method == 'POST':
         try:
             data = json.loads(request.body)
-            initial = float(data.get('initial', 0))
-            monthly_contribution = float(data.get('monthly_contribution', 0))
-            annual_return = float(data.get('annual_return', 0))
+            initial = finite_number(data.get('initial', 0), 'initial')
+            monthly_contribution = finite_number(data.get('monthly_contribution', 0), 'monthly_contribution')
+            annual_return = finite_number(data.get('annual_return', 0), 'annual_return')
             years = int(data.get('years', 0))
+            compounding = compounding_frequency(data.get('compounding'))
 
-            monthly_rate = (annual_return / 100) / 12
+            # Effective monthly rate; contributions are monthly whatever the compounding
+            if compounding == 'continuous':
+                monthly_rate = math.exp(annual_return / 100 / 12) - 1
+            else:
+                monthly_rate = (1 + annual_return / 100 / compounding) ** (compounding / 12) - 1
             months = years * 12
 
             fv_initial = initial * ((1 + monthly_rate) ** months)
@@ -492,11 +1003,11 @@ def calculate_investment_growth(request):
             else:
                 fv_contributions = monthly_contribution * (((1 + monthly_rate) ** months - 1) / monthly_rate)
 
-            total_value = fv_initial + fv_contributions
+            total_value = finite_number(fv_initial + fv_contributions, 'total value')
             total_invested = initial + (monthly_contribution * months)
             total_gain = total_value - total_invested
 
-            return JsonResponse({
+            result = {
                 'initial': round(initial, 2),
                 'monthly_contribution': round(monthly_contribution, 2),
                 'annual_return': annual_return,
@@ -504,8 +1015,13 @@ def calculate_investment_growth(request):
                 'total_invested': round(total_invested, 2),
                 'total_value': round(total_value, 2),
                 'total_gain': round(total_gain, 2)
-            })
-        except (ValueError, KeyError) as e:
+            }
+            if data.get('series'):
+                result['series'] = series_response(data, {
+                    'principal': initial, 'contribution': monthly_contribution, 'rate': annual_return,
+                    'years': years, 'compounding': compounding})
+            return JsonResponse(result, json_dumps_params=COMPACT_JSON)
+        except (ValueError, KeyError, TypeError, OverflowError) as e:
             return JsonResponse({'error': f'Invalid input: {str(e)}'}, status=400)
         except Exception as e:
             logger.exception('calculate_investment_growth error')
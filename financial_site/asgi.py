@@ -14,3 +14,9 @@ from django.core.asgi import get_asgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'financial_site.settings')
 
 application = get_asgi_application()
+
+# Background threads (analytics writer, memory watchdog, warm-up) start here,
+# in the serving process, not when financial.views is imported
+from financial.startup import start_serving  # noqa: E402
+
+start_serving()
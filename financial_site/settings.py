@@ -48,12 +48,137 @@ CSRF_TRUSTED_ORIGINS = [
 ]
 
 # Ollama settings
+# One URL, a comma-separated list, or a JSON list of
+# {"url": ..., "weight": ..., "models": [...]} backends (see ollama_pool.py)
 OLLAMA_API_BASE = os.getenv('OLLAMA_API_BASE', 'http://localhost:11434')
 OLLAMA_MODEL = os.getenv('OLLAMA_MODEL', 'llama3.2:latest')
+# Warm-up (ollama_warmup.py): preload the models at startup and ask Ollama to
+# keep them resident for OLLAMA_KEEP_ALIVE after each request. A keep-warm
+# ping is sent every OLLAMA_KEEP_WARM_SECONDS to idle backends (0 = off).
+OLLAMA_WARMUP = os.getenv('OLLAMA_WARMUP', 'true').lower() == 'true'
+OLLAMA_KEEP_ALIVE = os.getenv('OLLAMA_KEEP_ALIVE', '30m')
+OLLAMA_KEEP_WARM_SECONDS = float(os.getenv('OLLAMA_KEEP_WARM_SECONDS', '0'))
+# Set (by start_concurrent.py) when a supervisor warms the models once for all
+# workers: the file it publishes the warm-up state to. Unset, a single server
+# process warms the models itself.
+OLLAMA_WARMUP_STATE = os.getenv('OLLAMA_WARMUP_STATE', '')
+
+# Model routing (model_router.py): simple, well-grounded questions go to the
+# small tier, complex ones to the large tier unless its queue wait exceeds
+# the latency budget. Both tiers default to OLLAMA_MODEL.
+OLLAMA_SMALL_MODEL = os.getenv('OLLAMA_SMALL_MODEL', OLLAMA_MODEL)
+OLLAMA_LARGE_MODEL = os.getenv('OLLAMA_LARGE_MODEL', OLLAMA_MODEL)
+SMALL_NUM_PREDICT = int(os.getenv('SMALL_NUM_PREDICT', '200'))
+LARGE_NUM_PREDICT = int(os.getenv('LARGE_NUM_PREDICT', '300'))
+LARGE_TIER_LATENCY_BUDGET = float(os.getenv('LARGE_TIER_LATENCY_BUDGET', '20'))
+# Multi-turn chat sessions (financial/conversations.py): history beyond the
+# token budget is summarised; Ollama context arrays longer than
+# CHAT_MAX_CONTEXT_TOKENS are dropped in favour of the text history
+CHAT_MAX_SESSIONS = int(os.getenv('CHAT_MAX_SESSIONS', '500'))
+CHAT_SESSION_IDLE_SECONDS = int(os.getenv('CHAT_SESSION_IDLE_SECONDS', '1800'))
+CHAT_SESSION_MAX_BYTES = int(os.getenv('CHAT_SESSION_MAX_BYTES', str(32 * 1024 * 1024)))
+CHAT_HISTORY_TOKEN_BUDGET = int(os.getenv('CHAT_HISTORY_TOKEN_BUDGET', '1500'))
+CHAT_MAX_CONTEXT_TOKENS = int(os.getenv('CHAT_MAX_CONTEXT_TOKENS', '4096'))
+
+# Memory watchdog (memory_watchdog.py): as available memory drops below each
+# threshold the chat path halves num_predict, then caps concurrent LLM calls
+# at 1, then answers from retrieval only. LLM_MAX_CONCURRENCY is the normal
+# cap; a request waits up to LLM_SLOT_WAIT seconds for a slot.
+MEMORY_WATCHDOG = os.getenv('MEMORY_WATCHDOG', 'true').lower() == 'true'
+MEMORY_WATCHDOG_INTERVAL = float(os.getenv('MEMORY_WATCHDOG_INTERVAL', '5'))
+MEMORY_ELEVATED_MB = int(os.getenv('MEMORY_ELEVATED_MB', '300'))
+MEMORY_HIGH_MB = int(os.getenv('MEMORY_HIGH_MB', '200'))
+MEMORY_CRITICAL_MB = int(os.getenv('MEMORY_CRITICAL_MB', '120'))
+MEMORY_HYSTERESIS_MB = int(os.getenv('MEMORY_HYSTERESIS_MB', '50'))
+LLM_MAX_CONCURRENCY = int(os.getenv('LLM_MAX_CONCURRENCY', '2'))
+LLM_SLOT_WAIT = float(os.getenv('LLM_SLOT_WAIT', '5'))
+
+# Seconds a duplicate chat request waits on the identical in-flight generation
+CHAT_COALESCE_TIMEOUT = float(os.getenv('CHAT_COALESCE_TIMEOUT', '100'))
+
+# End-to-end budget for one chat request (deadline.py): retrieval, slot
+# waits and generation all spend what is left of it, and num_predict shrinks
+# to fit. Clients may set their own budget with an X-Request-Timeout header
+# (seconds), at most CHAT_DEADLINE_MAX - keep that below gunicorn's
+# WORKER_TIMEOUT. CHAT_DEADLINE_RESERVE seconds are kept back to answer from
+# retrieved context when time runs out; retrieval alone may use at most
+# CHAT_RETRIEVAL_TIMEOUT. CHAT_TOKENS_PER_SECOND seeds the generation-rate
+# estimate until Ollama has reported real timings.
+CHAT_DEADLINE = float(os.getenv('CHAT_DEADLINE', '60'))
+CHAT_DEADLINE_MAX = float(os.getenv('CHAT_DEADLINE_MAX', '100'))
+CHAT_DEADLINE_RESERVE = float(os.getenv('CHAT_DEADLINE_RESERVE', '1.0'))
+CHAT_RETRIEVAL_TIMEOUT = float(os.getenv('CHAT_RETRIEVAL_TIMEOUT', '10'))
+CHAT_TOKENS_PER_SECOND = float(os.getenv('CHAT_TOKENS_PER_SECOND', '8'))
+# Longest single Ollama generation call (model load + generation), further
+# capped by whatever is left of the request deadline
+OLLAMA_GENERATE_TIMEOUT = float(os.getenv('OLLAMA_GENERATE_TIMEOUT', '90'))
+
+# Speculative retrieval while typing (financial/prefetch.py): how long a
+# prefetched context stays reusable, and how many are kept per process
+CHAT_PREFETCH = os.getenv('CHAT_PREFETCH', 'true').lower() == 'true'
+CHAT_PREFETCH_TTL = float(os.getenv('CHAT_PREFETCH_TTL', '120'))
+CHAT_PREFETCH_MAX_ENTRIES = int(os.getenv('CHAT_PREFETCH_MAX_ENTRIES', '512'))
+
+# Chat analytics (financial/analytics.py): ChatEvent rows are bulk-inserted
+# every CHAT_ANALYTICS_BATCH_SIZE events or CHAT_ANALYTICS_FLUSH_MS ms; when
+# the queue is full or the database fails they go to the spill file (or are
+# dropped if CHAT_ANALYTICS_SPILL_PATH is empty)
+CHAT_ANALYTICS = os.getenv('CHAT_ANALYTICS', 'true').lower() == 'true'
+CHAT_ANALYTICS_BATCH_SIZE = int(os.getenv('CHAT_ANALYTICS_BATCH_SIZE', '100'))
+CHAT_ANALYTICS_FLUSH_MS = int(os.getenv('CHAT_ANALYTICS_FLUSH_MS', '2000'))
+CHAT_ANALYTICS_MAX_QUEUE = int(os.getenv('CHAT_ANALYTICS_MAX_QUEUE', '10000'))
+CHAT_ANALYTICS_SPILL_PATH = os.getenv('CHAT_ANALYTICS_SPILL_PATH', str(BASE_DIR / 'chat_events.spill.jsonl'))
+
+# Per-client token buckets (financial/ratelimit.py). A client may spend
+# RATE_LIMIT_BURST tokens at once and regains RATE_LIMIT_PER_MINUTE a minute;
+# an LLM call costs RATE_LIMIT_COST_LLM, a calculator call far less.
+# RATE_LIMIT_STORE=sqlite shares buckets across workers via RATE_LIMIT_DB.
+RATE_LIMIT_ENABLED = os.getenv('RATE_LIMIT_ENABLED', 'true').lower() == 'true'
+RATE_LIMIT_STORE = os.getenv('RATE_LIMIT_STORE', 'sqlite').lower()
+RATE_LIMIT_DB = Path(os.getenv('RATE_LIMIT_DB', BASE_DIR / 'ratelimit.sqlite3'))
+RATE_LIMIT_BURST = int(os.getenv('RATE_LIMIT_BURST', '60'))
+RATE_LIMIT_PER_MINUTE = float(os.getenv('RATE_LIMIT_PER_MINUTE', '30'))
+RATE_LIMIT_COSTS = {
+    'llm': float(os.getenv('RATE_LIMIT_COST_LLM', '10')),
+    'retrieval': float(os.getenv('RATE_LIMIT_COST_RETRIEVAL', '1')),
+    'calculator': float(os.getenv('RATE_LIMIT_COST_CALCULATOR', '1')),
+}
+# Typing-time retrieval (chat_prefetch) draws on its own bucket per client
+RATE_LIMIT_PREFETCH_BURST = int(os.getenv('RATE_LIMIT_PREFETCH_BURST', '30'))
+RATE_LIMIT_PREFETCH_PER_MINUTE = float(os.getenv('RATE_LIMIT_PREFETCH_PER_MINUTE', '60'))
+# Addresses of reverse proxies (comma-separated) whose X-Forwarded-For is
+# trusted to carry the client address; requests from anywhere else are keyed
+# by their own address
+RATE_LIMIT_TRUSTED_PROXIES = {ip.strip() for ip in os.getenv('RATE_LIMIT_TRUSTED_PROXIES', '').split(',') if ip.strip()}
+
+# Embeddings (embeddings.py reads the same variables)
+EMBED_PROVIDER = os.getenv('EMBED_PROVIDER', 'ollama').lower()
+EMBED_MODEL = os.getenv('EMBED_MODEL', 'nomic-embed-text')
+
+# When LangChain, Chroma and the vector index load (financial/startup.py):
+# 'eager' before the server starts serving, 'background' in a thread once it
+# starts, or 'lazy' on the first chat request. Only the WSGI/ASGI entry points
+# act on it, so tests never load them. Calculator and static pages never need them.
+AI_STACK_LOAD = os.getenv('AI_STACK_LOAD', 'background')
+
+# Shared retrieval daemon (retrieval_service.py). When RETRIEVAL_SOCKET is set
+# workers query the daemon over that Unix socket instead of each loading the
+# index and embedding model; start_concurrent.py --retrieval-service sets it.
+# With RETRIEVAL_SERVICE_FALLBACK a worker loads its own retriever while the
+# daemon is unreachable.
+RETRIEVAL_SOCKET = os.getenv('RETRIEVAL_SOCKET', '')
+RETRIEVAL_POOL_SIZE = int(os.getenv('RETRIEVAL_POOL_SIZE', '4'))
+RETRIEVAL_SERVICE_TIMEOUT = float(os.getenv('RETRIEVAL_SERVICE_TIMEOUT', '5'))
+RETRIEVAL_SERVICE_FALLBACK = os.getenv('RETRIEVAL_SERVICE_FALLBACK', 'true').lower() == 'true'
 
 # Vector DB
 VECTOR_DB_PATH = os.getenv('VECTOR_DB_PATH', 'chrome_langchain_db')
 
+# Precomputed FAQ answers: minimum cosine similarity to serve one instead of
+# generating live, and how often workers reload the table
+FAQ_MATCH_THRESHOLD = float(os.getenv('FAQ_MATCH_THRESHOLD', '0.92'))
+FAQ_RELOAD_SECONDS = int(os.getenv('FAQ_RELOAD_SECONDS', '300'))
+
 
 # Application definition
 
@@ -69,10 +194,14 @@ INSTALLED_APPS = [
 
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
+    # Static assets and cached pages are answered before sessions/CSRF/auth run
+    'financial.static_assets.StaticAssetMiddleware',
+    'financial.pagecache.PageCacheMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'financial.ratelimit.RateLimitMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
@@ -148,6 +277,19 @@ STATICFILES_DIRS = [
     BASE_DIR / 'static',
 ]
 
+# collectstatic writes content-hashed names plus .gz/.br copies
+# (financial/static_assets.py); those are served with immutable caching
+STORAGES = {
+    'default': {'BACKEND': 'django.core.files.storage.FileSystemStorage'},
+    'staticfiles': {'BACKEND': 'financial.static_assets.CompressedManifestStorage'},
+}
+# max-age for static files without a content hash in their name
+STATIC_MAX_AGE = int(os.getenv('STATIC_MAX_AGE', '3600'))
+
+# Render-once cache for the static-content pages (financial/pagecache.py)
+PAGE_CACHE = os.getenv('PAGE_CACHE', 'true').lower() == 'true'
+PAGE_CACHE_MAX_AGE = int(os.getenv('PAGE_CACHE_MAX_AGE', '300'))
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/5.2/ref/settings/#default-auto-field
 
@@ -14,3 +14,22 @@ from django.core.wsgi import get_wsgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'financial_site.settings')
 
 application = get_wsgi_application()
+
+if os.getenv('DJANGO_PRELOAD_VIEWS') == '1':
+    # Under `gunicorn --preload` this runs once in the master: importing the
+    # URLconf and loading the AI stack (corpus, retriever, LangChain) before
+    # workers fork lets them share those pages copy-on-write instead of each
+    # loading their own copy.
+    from django.urls import get_resolver
+
+    get_resolver().url_patterns
+
+    from financial.startup import ai_stack
+
+    ai_stack.load()
+
+# Background threads (analytics writer, memory watchdog, warm-up) start here,
+# in the serving process, not when financial.views is imported
+from financial.startup import start_serving  # noqa: E402
+
+start_serving()
@@ -0,0 +1,200 @@
+"""
+Prebuilt vector index artifact
+
+A single file holding the embedded corpus, so containers don't re-embed
+5,800 rows on first request. Layout:
+
+  8 bytes   magic b"FGIDX\\x00\\x01\\x00"
+  8 bytes   header length (little-endian uint64)
+  header    UTF-8 JSON: format, corpus_version, embedding_model, chunking, dim,
+            count, chunks [{"id", "row_index", "text", "duplicates"?}], created_at
+  padding   to a 64-byte boundary
+  vectors   count x dim little-endian float32, L2-normalised
+
+`manage.py build_index` writes it (the Dockerfile runs that at image build
+time). vector_enhanced loads it with np.memmap, so opening it costs a JSON
+parse and no vector copies. The artifact is refused when its corpus hash,
+embedding model or chunking differs from the running configuration, and the
+app falls back to building the Chroma store.
+"""
+import json
+import os
+import struct
+import time
+from pathlib import Path
+
+import numpy as np
+
+MAGIC = b"FGIDX\x00\x01\x00"
+FORMAT_VERSION = 1
+ALIGN = 64
+DEFAULT_PATH = Path(os.getenv("INDEX_ARTIFACT", Path(__file__).resolve().parent / "finguide_index.fgix"))
+
+
+class StaleArtifactError(Exception):
+    """The artifact was built from a different corpus or embedding model"""
+
+
+def write_artifact(path, vectors, chunks, corpus_version, embedding_model, chunking="rows"):
+    vectors = np.asarray(vectors, dtype='<f4')
+    if vectors.ndim != 2 or len(vectors) != len(chunks):
+        raise ValueError(f"{len(chunks)} chunks but vectors have shape {vectors.shape}")
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    vectors = vectors / np.clip(norms, 1e-9, None)
+
+    header = json.dumps({
+        "format": FORMAT_VERSION,
+        "corpus_version": corpus_version,
+        "embedding_model": embedding_model,
+        "chunking": chunking,
+        "dim": int(vectors.shape[1]),
+        "count": int(vectors.shape[0]),
+        "created_at": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+        "chunks": chunks,
+    }, ensure_ascii=False).encode("utf-8")
+    offset = len(MAGIC) + 8 + len(header)
+    padding = (-offset) % ALIGN
+
+    path = Path(path)
+    tmp = path.with_suffix(path.suffix + ".tmp")
+    with open(tmp, "wb") as f:
+        f.write(MAGIC)
+        f.write(struct.pack("<Q", len(header)))
+        f.write(header)
+        f.write(b"\0" * padding)
+        f.write(np.ascontiguousarray(vectors).tobytes())
+    os.replace(tmp, path)
+    return path
+
+
+def read_header(path):
+    """(header dict, byte offset of the vector block)"""
+    with open(path, "rb") as f:
+        if f.read(len(MAGIC)) != MAGIC:
+            raise ValueError(f"{path} is not a FinGuide index artifact")
+        (length,) = struct.unpack("<Q", f.read(8))
+        header = json.loads(f.read(length).decode("utf-8"))
+    offset = len(MAGIC) + 8 + length
+    return header, offset + (-offset) % ALIGN
+
+
+def mmr_select(candidates, scores, vectors, k, lambda_mult=0.5):
+    """Pick k of the candidates (sorted by score, with their vectors), each
+    time taking the one most relevant to the query and least similar to
+    those already picked (lambda_mult=1 keeps plain similarity order)"""
+    if not len(candidates):
+        return candidates
+    picked = [0]
+    redundancy = vectors @ vectors[0]
+    while len(picked) < min(k, len(candidates)):
+        mmr_scores = lambda_mult * scores - (1 - lambda_mult) * redundancy
+        mmr_scores[picked] = -np.inf
+        best = int(np.argmax(mmr_scores))
+        picked.append(best)
+        redundancy = np.maximum(redundancy, vectors @ vectors[best])
+    return candidates[picked]
+
+
+class IndexArtifact:
+    def __init__(self, path, header, vectors):
+        self.path = path
+        self.header = header
+        self.vectors = vectors  # read-only memmap
+        self.chunks = header["chunks"]
+
+    @property
+    def corpus_version(self):
+        return self.header["corpus_version"]
+
+    @property
+    def embedding_model(self):
+        return self.header["embedding_model"]
+
+    def search(self, query_vector, k=5):
+        """Indices and cosine scores of the k nearest chunks"""
+        query = np.asarray(query_vector, dtype=np.float32)
+        query = query / max(float(np.linalg.norm(query)), 1e-9)
+        scores = self.vectors @ query
+        k = min(k, len(scores))
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        return top, scores[top]
+
+    def vectors_for(self, ids):
+        return np.asarray(self.vectors[np.asarray(ids)], dtype=np.float32)
+
+    def mmr(self, query_vector, k=5, fetch_k=20, lambda_mult=0.5):
+        """Maximal marginal relevance over the fetch_k nearest chunks"""
+        candidates, scores = self.search(query_vector, max(k, fetch_k))
+        return mmr_select(candidates, scores, self.vectors_for(candidates), k, lambda_mult)
+
+    def search_many(self, query_vectors, k=5):
+        """Top-k chunk indices for each row of `query_vectors` (one matrix product)"""
+        queries = np.asarray(query_vectors, dtype=np.float32)
+        queries = queries / np.clip(np.linalg.norm(queries, axis=1, keepdims=True), 1e-9, None)
+        scores = queries @ self.vectors.T
+        k = min(k, scores.shape[1])
+        top = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+        order = np.argsort(-np.take_along_axis(scores, top, axis=1), axis=1)
+        return np.take_along_axis(top, order, axis=1)
+
+
+def load_artifact(path=DEFAULT_PATH, corpus_version=None, embedding_model=None, chunking=None):
+    """Memory-map an artifact, refusing it if it doesn't match the expected
+    corpus version / embedding model / chunking (when those are given)"""
+    header, offset = read_header(path)
+    if header.get("format") != FORMAT_VERSION:
+        raise StaleArtifactError(f"artifact format {header.get('format')}, expected {FORMAT_VERSION}")
+    if corpus_version and header["corpus_version"] != corpus_version:
+        raise StaleArtifactError(
+            f"artifact built from corpus {header['corpus_version']}, current corpus is {corpus_version}")
+    if embedding_model and header["embedding_model"] != embedding_model:
+        raise StaleArtifactError(
+            f"artifact built with {header['embedding_model']}, current embeddings are {embedding_model}")
+    if chunking and header.get("chunking", "rows") != chunking:
+        raise StaleArtifactError(
+            f"artifact chunked as {header.get('chunking', 'rows')}, current chunking is {chunking}")
+    vectors = np.memmap(path, dtype='<f4', mode='r', offset=offset,
+                        shape=(header["count"], header["dim"]))
+    return IndexArtifact(Path(path), header, vectors)
+
+
+def chunk_document(chunk, **metadata):
+    """LangChain Document for an artifact chunk"""
+    from langchain_core.documents import Document
+
+    metadata["row_index"] = chunk.get("row_index")
+    if chunk.get("duplicates"):
+        # Same shape as the Chroma path (metadata values are scalars there)
+        metadata["duplicates"] = ",".join(map(str, chunk["duplicates"]))
+    return Document(page_content=chunk["text"], id=chunk["id"], metadata=metadata)
+
+
+class ArtifactRetriever:
+    """Minimal stand-in for Chroma's retriever: invoke(query) -> Documents.
+    With mmr=True results are diversified (IndexArtifact.mmr). `artifact` may
+    also be a cluster_index.HierarchicalIndex over the artifact."""
+
+    def __init__(self, artifact, embeddings, k=5, mmr=False, fetch_k=20, lambda_mult=0.5):
+        self.artifact = artifact
+        self.embeddings = embeddings
+        self.k = k
+        self.mmr = mmr
+        self.fetch_k = fetch_k
+        self.lambda_mult = lambda_mult
+
+    def _documents(self, indices):
+        return [chunk_document(self.artifact.chunks[i]) for i in indices]
+
+    def _search(self, vector, k):
+        if self.mmr:
+            return self.artifact.mmr(vector, k, self.fetch_k, self.lambda_mult)
+        return self.artifact.search(vector, k)[0]
+
+    def invoke(self, query, **kwargs):
+        return self._documents(self._search(self.embeddings.embed_query(query), self.k))
+
+    def invoke_by_vectors(self, vectors, k=None):
+        if self.mmr:
+            return [self._documents(self._search(vector, k or self.k)) for vector in vectors]
+        return [self._documents(top) for top in self.artifact.search_many(vectors, k or self.k)]
@@ -0,0 +1,343 @@
+"""
+Extra knowledge sources, ingested into one index shard per collection
+
+Besides Financial-Literacy-Compilation.csv (the "financial" collection,
+indexed by build_index), any CSV, plain-text or markdown file under
+KNOWLEDGE_DIR is searchable. Each top-level subdirectory is one collection,
+and so is each file directly in KNOWLEDGE_DIR:
+
+  knowledge/
+    retirement/           -> collection "retirement"
+      401k.md
+      roth-vs-traditional.txt
+    tax-brackets.csv      -> collection "tax-brackets"
+
+`manage.py ingest_sources` parses, chunks and embeds the collections in a
+process pool and writes SHARD_DIR/<collection>.fgix, one index artifact
+(index_artifact.py) per collection, stamped with a hash of its files.
+Unchanged collections are skipped on the next run. CSV files are cut into
+rows, the way the main corpus is. Text and markdown are cut into
+paragraphs of up to KNOWLEDGE_CHUNK_CHARS, each prefixed with its
+markdown heading.
+
+At query time ShardedRetriever searches the shards in parallel and merges
+their results by score. A `collections` filter limits a query to some of
+them. Shards with a clustering sidecar (manage.py cluster_index
+--artifact shards/<name>.fgix) use two-stage search.
+"""
+import hashlib
+import os
+import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import numpy as np
+
+from corpus import BASE_DIR, DEDUP_THRESHOLD, chunking_id
+from index_artifact import StaleArtifactError, chunk_document, load_artifact, mmr_select, write_artifact
+
+KNOWLEDGE_DIR = BASE_DIR / Path(os.getenv("KNOWLEDGE_DIR", "knowledge"))
+SHARD_DIR = BASE_DIR / Path(os.getenv("SHARD_DIR", "shards"))
+KNOWLEDGE_CHUNK_CHARS = int(os.getenv("KNOWLEDGE_CHUNK_CHARS", "1000"))
+# Threads used to search shards concurrently (numpy releases the GIL)
+SHARD_SEARCH_THREADS = int(os.getenv("SHARD_SEARCH_THREADS", "4"))
+
+# The main CSV corpus (the build_index artifact or the Chroma store)
+DEFAULT_COLLECTION = "financial"
+SUFFIXES = {".csv", ".txt", ".md", ".markdown"}
+CHUNKING = f"{chunking_id(DEDUP_THRESHOLD)}+text{KNOWLEDGE_CHUNK_CHARS}"
+
+_HEADING = re.compile(r"^#{1,6}\s+(.+?)\s*#*\s*$")
+_SENTENCE_END = re.compile(r"(?<=[.!?])\s+")
+
+
+def collection_name(name):
+    """'Retirement Plans' -> 'retirement-plans'"""
+    return re.sub(r"[^a-z0-9]+", "-", name.lower()).strip("-")
+
+
+def discover(directory=KNOWLEDGE_DIR):
+    """{collection: [source files]} under `directory`"""
+    directory = Path(directory)
+    collections = {}
+    if not directory.is_dir():
+        return collections
+    for entry in sorted(directory.iterdir()):
+        if entry.name.startswith("."):
+            continue
+        if entry.is_dir():
+            files = sorted(p for p in entry.rglob("*") if p.is_file() and p.suffix.lower() in SUFFIXES)
+        elif entry.suffix.lower() in SUFFIXES:
+            files = [entry]
+        else:
+            continue
+        name = collection_name(entry.stem if entry.is_file() else entry.name)
+        if files and name and name != DEFAULT_COLLECTION:
+            collections.setdefault(name, []).extend(files)
+    return collections
+
+
+def sources_version(files, root=KNOWLEDGE_DIR):
+    """Content hash over a collection's files (names included, so renames count)"""
+    digest = hashlib.sha256()
+    for path in sorted(files):
+        digest.update(str(Path(path).relative_to(root)).encode("utf-8") + b"\0")
+        with open(path, "rb") as f:
+            for block in iter(lambda: f.read(1 << 16), b""):
+                digest.update(block)
+    return digest.hexdigest()[:16]
+
+
+def split_text(text, max_chars=KNOWLEDGE_CHUNK_CHARS):
+    """Paragraph-packed chunks of at most ~max_chars, each prefixed with the
+    markdown heading it falls under"""
+    chunks, heading, parts = [], "", []
+
+    def emit():
+        if parts:
+            body = "\n\n".join(parts)
+            chunks.append(f"{heading}\n{body}" if heading else body)
+            parts.clear()
+
+    for block in re.split(r"\n\s*\n", text):
+        lines = block.strip().splitlines()
+        while lines and _HEADING.match(lines[0]):
+            emit()
+            heading = _HEADING.match(lines.pop(0)).group(1)
+        block = "\n".join(lines).strip()
+        if not block:
+            continue
+        # An over-long paragraph is cut at sentence ends
+        pieces, piece = [], ""
+        for sentence in _SENTENCE_END.split(block) if len(block) > max_chars else [block]:
+            if piece and len(piece) + len(sentence) + 1 > max_chars:
+                pieces.append(piece)
+                piece = ""
+            piece = f"{piece} {sentence}".strip()
+        pieces.append(piece)
+        for piece in pieces:
+            if parts and sum(len(p) + 2 for p in parts) + len(piece) > max_chars:
+                emit()
+            parts.append(piece)
+    emit()
+    return chunks
+
+
+def parse_source(path, root=KNOWLEDGE_DIR):
+    """Index chunks ({"id", "row_index", "text", "source"}) for one file"""
+    path = Path(path)
+    source = str(path.relative_to(root))
+    if path.suffix.lower() == ".csv":
+        from corpus import load
+
+        chunks = load(path).chunks(DEDUP_THRESHOLD)
+        for chunk in chunks:
+            chunk["id"] = f"{source}#{chunk['id']}"
+            chunk["source"] = source
+        return chunks
+    text = path.read_text(encoding="utf-8", errors="replace")
+    return [{"id": f"{source}#{i}", "row_index": None, "text": chunk, "source": source}
+            for i, chunk in enumerate(split_text(text))]
+
+
+def shard_path(collection, directory=SHARD_DIR):
+    return Path(directory) / f"{collection}.fgix"
+
+
+def build_shard(collection, files, output, version, batch_size=256, root=KNOWLEDGE_DIR):
+    """Parse, chunk and embed one collection into its shard (runs in a worker process)"""
+    from embeddings import embedding_model_id, shared_embeddings
+
+    started = time.monotonic()
+    chunks = [chunk for path in files for chunk in parse_source(path, root)]
+    if not chunks:
+        Path(output).unlink(missing_ok=True)
+        return {"collection": collection, "status": "empty", "files": len(files), "chunks": 0}
+    embeddings = shared_embeddings()
+    vectors = []
+    for start in range(0, len(chunks), batch_size):
+        vectors.extend(embeddings.embed_documents([c["text"] for c in chunks[start:start + batch_size]]))
+    write_artifact(output, vectors, chunks, version, embedding_model_id(embeddings), CHUNKING)
+    return {"collection": collection, "status": "built", "files": len(files), "chunks": len(chunks),
+            "seconds": round(time.monotonic() - started, 1)}
+
+
+def shard_is_current(path, version, embedding_model):
+    try:
+        load_artifact(path, version, embedding_model, CHUNKING)
+        return True
+    except (StaleArtifactError, ValueError, OSError):
+        return False
+
+
+def ingest(source_dir=KNOWLEDGE_DIR, shard_dir=SHARD_DIR, workers=None, force=False, only=None,
+           prune=True, on_result=None):
+    """Build the shard of every new or changed collection, `workers` at a time.
+    Returns one result dict per collection; on_result(result) is called as
+    each finishes."""
+    import multiprocessing
+    from concurrent.futures import ProcessPoolExecutor, as_completed
+
+    from embeddings import embedding_model_id, shared_embeddings
+
+    source_dir, shard_dir = Path(source_dir), Path(shard_dir)
+    shard_dir.mkdir(parents=True, exist_ok=True)
+    collections = discover(source_dir)
+    if only:
+        collections = {name: files for name, files in collections.items() if name in only}
+    model_id = embedding_model_id(shared_embeddings())
+
+    results, pending = [], {}
+    for name, files in collections.items():
+        version = sources_version(files, source_dir)
+        if not force and shard_is_current(shard_path(name, shard_dir), version, model_id):
+            results.append({"collection": name, "status": "current", "files": len(files)})
+        else:
+            pending[name] = (files, version)
+    if prune and not only:
+        for path in shard_dir.glob("*.fgix"):
+            if path.stem not in collections:
+                for stale in (path, Path(f"{path}.ivf")):
+                    stale.unlink(missing_ok=True)
+                results.append({"collection": path.stem, "status": "removed"})
+    for result in results:
+        if on_result:
+            on_result(result)
+
+    def record(name, build):
+        try:
+            result = build()
+        except Exception as e:
+            result = {"collection": name, "status": "failed", "error": str(e)}
+        results.append(result)
+        if on_result:
+            on_result(result)
+
+    workers = max(1, min(workers or os.cpu_count() or 1, len(pending) or 1))
+    if workers == 1:
+        for name, (files, version) in pending.items():
+            record(name, lambda: build_shard(name, files, shard_path(name, shard_dir), version, root=source_dir))
+        return results
+    # Spawned, not forked: each worker loads its own embedding model / HTTP pool
+    with ProcessPoolExecutor(workers, mp_context=multiprocessing.get_context("spawn")) as pool:
+        futures = {pool.submit(build_shard, name, files, shard_path(name, shard_dir), version,
+                               root=source_dir): name
+                   for name, (files, version) in pending.items()}
+        for future in as_completed(futures):
+            record(futures[future], future.result)
+    return results
+
+
+def available_collections(directory=SHARD_DIR):
+    """Collection names a query can be filtered to"""
+    directory = Path(directory)
+    shards = sorted(p.stem for p in directory.glob("*.fgix")) if directory.is_dir() else []
+    return [DEFAULT_COLLECTION] + [name for name in shards if name != DEFAULT_COLLECTION]
+
+
+def parse_collections(value):
+    """Request 'collections' (list or comma-separated string) -> sorted names, or None for all"""
+    if not value:
+        return None
+    names = value.split(",") if isinstance(value, str) else value
+    names = sorted({collection_name(str(name)) for name in names} - {""})
+    return names or None
+
+
+def load_shards(embedding_model, directory=SHARD_DIR, nprobe=8, hierarchical=True):
+    """{collection: index} for every current shard; stale ones are skipped
+    with a warning (re-run ingest_sources)"""
+    shards = {}
+    for path in sorted(Path(directory).glob("*.fgix")) if Path(directory).is_dir() else []:
+        try:
+            index = load_artifact(path, None, embedding_model, CHUNKING)
+        except (StaleArtifactError, ValueError, OSError) as e:
+            print(f"⚠️  Ignoring knowledge shard {path.name}: {e}")
+            continue
+        if hierarchical:
+            from cluster_index import load_hierarchical
+
+            index = load_hierarchical(index, nprobe=nprobe) or index
+        shards[path.stem] = index
+    return shards
+
+
+class ShardedRetriever:
+    """Retriever over several indexes (collections): searches the selected
+    ones in parallel and merges their hits by cosine score. Same invoke /
+    invoke_by_vectors interface as ArtifactRetriever, plus `collections`."""
+
+    def __init__(self, shards, embeddings, k=5, mmr=False, fetch_k=20, lambda_mult=0.5,
+                 threads=SHARD_SEARCH_THREADS):
+        self.shards = dict(shards)
+        self.embeddings = embeddings
+        self.k = k
+        self.mmr = mmr
+        self.fetch_k = fetch_k
+        self.lambda_mult = lambda_mult
+        self._pool = ThreadPoolExecutor(max(1, min(threads, len(self.shards))), thread_name_prefix="shard-search")
+
+    @property
+    def collections(self):
+        return sorted(self.shards)
+
+    def _select(self, collections):
+        if not collections:
+            return list(self.shards)
+        unknown = set(collections) - set(self.shards)
+        if unknown:
+            raise ValueError(f"Unknown collection(s) {', '.join(sorted(unknown))}; "
+                             f"available: {', '.join(self.collections)}")
+        return list(collections)
+
+    def _search(self, vector, k, collections=None):
+        """[(collection, chunk index)] best first"""
+        names = self._select(collections)
+        fetch = max(k, self.fetch_k) if self.mmr else k
+        search = lambda name: self.shards[name].search(vector, fetch)
+        hits = list(self._pool.map(search, names)) if len(names) > 1 else [search(names[0])]
+        owners = np.concatenate([np.full(len(ids), n) for n, (ids, _) in enumerate(hits)]).astype(int)
+        ids = np.concatenate([ids for ids, _ in hits]).astype(int)
+        scores = np.concatenate([scores for _, scores in hits])
+        order = np.argsort(-scores, kind="stable")[:fetch]
+        if self.mmr and len(order):
+            vectors = np.vstack([self.shards[names[owners[i]]].vectors_for([ids[i]]) for i in order])
+            order = mmr_select(order, scores[order], vectors, k, self.lambda_mult)
+        return [(names[owners[i]], ids[i]) for i in order[:k]]
+
+    def _documents(self, hits):
+        return [chunk_document(self.shards[name].chunks[i], collection=name) for name, i in hits]
+
+    def invoke(self, query, collections=None, **kwargs):
+        return self._documents(self._search(self.embeddings.embed_query(query), self.k, collections))
+
+    def invoke_by_vectors(self, vectors, k=None, collections=None):
+        return [self._documents(self._search(vector, k or self.k, collections)) for vector in vectors]
+
+
+_keyword_corpora = None
+_keyword_lock = threading.Lock()
+
+
+def keyword_corpora(directory=SHARD_DIR):
+    """{collection: Corpus} of shard chunk texts, for the keyword fallback
+    (read from the shard headers; loaded once per process)"""
+    global _keyword_corpora
+    if _keyword_corpora is None:
+        with _keyword_lock:
+            if _keyword_corpora is None:
+                from corpus import Corpus
+                from index_artifact import read_header
+
+                corpora = {}
+                for name in available_collections(directory)[1:]:
+                    try:
+                        header, _ = read_header(shard_path(name, directory))
+                    except (OSError, ValueError):
+                        continue
+                    title = name.replace("-", " ").title()
+                    corpora[name] = Corpus([title], ([c["text"]] for c in header["chunks"]))
+                _keyword_corpora = corpora
+    return _keyword_corpora
@@ -0,0 +1,216 @@
+"""
+Memory watchdog and adaptive degradation
+
+Small instances (see OOM_FIX_GUIDE.md) fail by running out of memory while
+Ollama generates. Instead of waiting for the OOM killer, the watchdog samples
+system available memory (plus this process's and Ollama's RSS) every
+MEMORY_WATCHDOG_INTERVAL seconds and steps the app down as pressure rises:
+
+  normal    full service
+  elevated  available < MEMORY_ELEVATED_MB: halve num_predict
+  high      available < MEMORY_HIGH_MB: also cap concurrent LLM calls at 1
+  critical  available < MEMORY_CRITICAL_MB: answer from retrieval only
+
+Levels step back down only once available memory is MEMORY_HYSTERESIS_MB
+above the threshold, so the app does not flap around a boundary. Every
+transition is counted and exposed through /api/health/. Recycling bloated
+gunicorn workers is done by the supervisor (start_concurrent.py), which can
+see all of them.
+"""
+import logging
+import os
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+NORMAL, ELEVATED, HIGH, CRITICAL = 0, 1, 2, 3
+LEVEL_NAMES = {NORMAL: 'normal', ELEVATED: 'elevated', HIGH: 'high', CRITICAL: 'critical'}
+
+
+# --- /proc sampling ----------------------------------------------------
+
+def available_memory_mb():
+    """MemAvailable from /proc/meminfo, falling back to total physical memory"""
+    try:
+        with open('/proc/meminfo') as f:
+            for line in f:
+                if line.startswith('MemAvailable:'):
+                    return int(line.split()[1]) // 1024
+    except OSError:
+        pass
+    try:
+        return os.sysconf('SC_PAGE_SIZE') * os.sysconf('SC_PHYS_PAGES') // (1024 * 1024)
+    except (ValueError, OSError):
+        return None
+
+
+def rss_mb(pid):
+    """Resident set size of `pid` in MB, or None if it is gone/unreadable"""
+    try:
+        with open(f'/proc/{pid}/status') as f:
+            for line in f:
+                if line.startswith('VmRSS:'):
+                    return int(line.split()[1]) / 1024
+    except (OSError, ValueError):
+        pass
+    return None
+
+
+def child_pids(pid):
+    """Direct children of `pid` (e.g. a gunicorn master's workers)"""
+    try:
+        with open(f'/proc/{pid}/task/{pid}/children') as f:
+            return [int(p) for p in f.read().split()]
+    except OSError:
+        return []
+
+
+def pids_named(prefix):
+    """PIDs whose command name starts with `prefix` (Ollama server and runners)"""
+    pids = []
+    try:
+        entries = os.listdir('/proc')
+    except OSError:
+        return pids
+    for entry in entries:
+        if not entry.isdigit():
+            continue
+        try:
+            with open(f'/proc/{entry}/comm') as f:
+                if f.read().strip().startswith(prefix):
+                    pids.append(int(entry))
+        except OSError:
+            continue
+    return pids
+
+
+# --- LLM concurrency slots --------------------------------------------
+
+class SlotUnavailable(Exception):
+    """No LLM slot freed up within the wait time"""
+
+
+class SlotLimiter:
+    """Resizable cap on concurrent LLM generations"""
+
+    def __init__(self, limit, wait=5.0):
+        self.max_limit = max(1, int(limit))
+        self.limit = self.max_limit
+        self.wait = wait
+        self.in_use = 0
+        self.rejected = 0
+        self._cond = threading.Condition()
+
+    def resize(self, limit):
+        with self._cond:
+            self.limit = max(0, int(limit))
+            self._cond.notify_all()
+
+    @contextmanager
+    def slot(self, timeout=None):
+        timeout = self.wait if timeout is None else timeout
+        with self._cond:
+            if not self._cond.wait_for(lambda: self.in_use < self.limit, timeout):
+                self.rejected += 1
+                raise SlotUnavailable(f'all {self.limit} LLM slot(s) busy')
+            self.in_use += 1
+        try:
+            yield
+        finally:
+            with self._cond:
+                self.in_use -= 1
+                self._cond.notify()
+
+    def snapshot(self):
+        with self._cond:
+            return {'limit': self.limit, 'max': self.max_limit,
+                    'in_use': self.in_use, 'rejected': self.rejected}
+
+
+# --- watchdog ----------------------------------------------------------
+
+class MemoryWatchdog:
+    def __init__(self, limiter, elevated_mb=300, high_mb=200, critical_mb=120,
+                 hysteresis_mb=50, interval=5.0, sampler=available_memory_mb):
+        self.limiter = limiter
+        self.thresholds = {ELEVATED: elevated_mb, HIGH: high_mb, CRITICAL: critical_mb}
+        self.hysteresis_mb = hysteresis_mb
+        self.interval = interval
+        self.sampler = sampler
+        self.level = NORMAL
+        self.transitions = Counter()
+        self.last_sample = {}
+        self._pid = None
+        self._lock = threading.Lock()
+
+    def _target_level(self, available):
+        """Level for `available` MB, holding the current level inside the hysteresis band"""
+        level = NORMAL
+        for candidate in (ELEVATED, HIGH, CRITICAL):
+            if available < self.thresholds[candidate]:
+                level = candidate
+        if level < self.level:
+            # Only step down once we're clear of the current threshold
+            if available < self.thresholds[self.level] + self.hysteresis_mb:
+                return self.level
+        return level
+
+    def sample(self):
+        available = self.sampler()
+        ollama = [rss_mb(p) for p in pids_named('ollama')]
+        self.last_sample = {
+            'at': time.time(),
+            'available_mb': available,
+            'process_rss_mb': rss_mb(os.getpid()),
+            'ollama_rss_mb': round(sum(r for r in ollama if r), 1) if ollama else None,
+        }
+        if available is not None:
+            self.set_level(self._target_level(available))
+        return self.last_sample
+
+    def set_level(self, level):
+        with self._lock:
+            if level == self.level:
+                return
+            previous, self.level = self.level, level
+            self.transitions[f'{LEVEL_NAMES[previous]}->{LEVEL_NAMES[level]}'] += 1
+        self.limiter.resize(self.limiter.max_limit if level < HIGH else (1 if level == HIGH else 0))
+        log = logger.warning if level > previous else logger.info
+        log('Memory pressure %s -> %s (available %s MB)', LEVEL_NAMES[previous],
+            LEVEL_NAMES[level], self.last_sample.get('available_mb'))
+
+    # Policy used by the views
+    def num_predict(self, requested):
+        return max(64, requested // 2) if self.level >= ELEVATED else requested
+
+    def retrieval_only(self):
+        return self.level >= CRITICAL
+
+    def _loop(self):
+        while True:
+            try:
+                self.sample()
+            except Exception:
+                logger.exception('Memory watchdog sample failed')
+            time.sleep(self.interval)
+
+    def ensure_started(self):
+        """Start the sampling thread in this process once (keyed by pid, so
+        forked gunicorn workers each get their own; see financial.startup.start_serving)"""
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+        threading.Thread(target=self._loop, name='memory-watchdog', daemon=True).start()
+
+    def snapshot(self):
+        return {
+            'level': LEVEL_NAMES[self.level],
+            'thresholds_mb': {LEVEL_NAMES[k]: v for k, v in self.thresholds.items()},
+            'transitions': dict(self.transitions),
+            'sample': self.last_sample,
+            'llm_slots': self.limiter.snapshot(),
+        }
@@ -0,0 +1,152 @@
+"""
+Latency-aware routing between a small and a large Ollama model
+
+Each question is scored on length, detected intent, how well the retrieved
+context covers it, and how busy the large tier is. Simple, well-grounded
+questions go to the fast small model; long or open-ended ones go to the large
+model. If the large tier's estimated queue wait exceeds its latency budget,
+the question is downgraded to the small tier.
+"""
+import logging
+import re
+import threading
+from collections import Counter
+from dataclasses import dataclass, field
+
+logger = logging.getLogger(__name__)
+
+_WORDS = re.compile(r"\w+")
+
+# Phrasings that usually need multi-step reasoning or a personalised plan
+COMPLEX_PATTERNS = re.compile(
+    r"\b(compare|comparison|versus|vs\.?|pros and cons|strategy|strategies|plan|planning|"
+    r"should i|which is better|step[- ]by[- ]step|optimi[sz]e|portfolio|allocation|"
+    r"retirement|estate|tax(es)?|scenario|why)\b",
+    re.IGNORECASE,
+)
+# Short definitional questions the small model handles well
+SIMPLE_PATTERNS = re.compile(
+    r"^(what is|what's|what are|define|meaning of|how much is|is a|is an)\b",
+    re.IGNORECASE,
+)
+STOP_WORDS = {'what', 'is', 'a', 'an', 'the', 'how', 'to', 'do', 'does', 'can', 'could', 'should',
+              'would', 'about', 'tell', 'me', 'explain', 'my', 'i', 'and', 'or', 'of', 'for', 'in'}
+
+
+@dataclass
+class Tier:
+    name: str
+    model: str
+    num_predict: int
+
+
+@dataclass
+class RouteDecision:
+    tier: str
+    model: str
+    num_predict: int
+    score: int
+    confidence: float
+    queue_wait: float
+    reasons: list = field(default_factory=list)
+
+    def as_dict(self):
+        return {
+            'tier': self.tier,
+            'model': self.model,
+            'num_predict': self.num_predict,
+            'score': self.score,
+            'confidence': round(self.confidence, 2),
+            'queue_wait': round(self.queue_wait, 2),
+            'reasons': self.reasons,
+        }
+
+
+def retrieval_confidence(question, context):
+    """Fraction of the question's content words that appear in the retrieved context"""
+    words = {w for w in _WORDS.findall(question.lower()) if w not in STOP_WORDS and len(w) > 2}
+    if not words or not context:
+        return 0.0
+    context_lower = context.lower()
+    return sum(1 for w in words if w in context_lower) / len(words)
+
+
+class ModelRouter:
+    def __init__(self, small, large, pool=None, latency_budget=20.0, threshold=2):
+        self.small = small
+        self.large = large
+        self.pool = pool
+        self.latency_budget = latency_budget
+        self.threshold = threshold
+        self._lock = threading.Lock()
+        self._counts = Counter()
+
+    def large_queue_wait(self):
+        """Estimated seconds a new request would wait on the least-busy large-tier backend"""
+        if self.pool is None:
+            return 0.0
+        waits = [
+            b.outstanding * (b.latency_ewma or 0.0)
+            for b in self.pool.backends
+            if b.serves(self.large.model) and not b.breaker.is_open()
+        ]
+        return min(waits) if waits else float('inf')
+
+    def route(self, question, context=""):
+        score = 0
+        reasons = []
+
+        words = len(_WORDS.findall(question))
+        if words > 60:
+            score += 2
+            reasons.append('long question')
+        elif words > 25:
+            score += 1
+            reasons.append('medium-length question')
+
+        if COMPLEX_PATTERNS.search(question):
+            score += 2
+            reasons.append('complex intent')
+        elif SIMPLE_PATTERNS.search(question.strip()):
+            score -= 1
+            reasons.append('definitional intent')
+
+        confidence = retrieval_confidence(question, context)
+        if confidence >= 0.6:
+            score -= 1
+            reasons.append('well-covered by retrieved context')
+        elif confidence < 0.3:
+            score += 1
+            reasons.append('weak retrieval match')
+
+        queue_wait = 0.0
+        downgraded = False
+        tier = self.large if score >= self.threshold else self.small
+        if tier is self.large and self.large.model != self.small.model:
+            queue_wait = self.large_queue_wait()
+            if queue_wait > self.latency_budget:
+                tier = self.small
+                downgraded = True
+                reasons.append(f'large tier queue {queue_wait:.1f}s over {self.latency_budget:.0f}s budget')
+
+        decision = RouteDecision(tier.name, tier.model, tier.num_predict, score,
+                                 confidence, queue_wait, reasons)
+        with self._lock:
+            self._counts[tier.name] += 1
+            if downgraded:
+                self._counts['downgraded'] += 1
+        logger.info('Model route: %s', decision.as_dict())
+        return decision
+
+    def snapshot(self):
+        with self._lock:
+            counts = dict(self._counts)
+        queue_wait = self.large_queue_wait()
+        return {
+            'small': {'model': self.small.model, 'num_predict': self.small.num_predict},
+            'large': {'model': self.large.model, 'num_predict': self.large.num_predict},
+            'latency_budget': self.latency_budget,
+            # None when no large-tier backend is currently healthy
+            'large_queue_wait': None if queue_wait == float('inf') else queue_wait,
+            'decisions': counts,
+        }
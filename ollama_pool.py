@@ -0,0 +1,373 @@
+"""
+Pool of Ollama backends with least-outstanding-requests routing
+
+OLLAMA_API_BASE may name one server (as before), a comma-separated list of
+URLs, or a JSON list with per-backend weights and model lists:
+
+  OLLAMA_API_BASE='[{"url": "http://gpu-1:11434", "weight": 2, "models": ["llama3.2:latest"]},
+                    {"url": "http://cpu-1:11434", "models": ["tinyllama", "nomic-embed-text"]}]'
+
+Each request goes to the backend serving its model with the fewest
+outstanding requests per unit of weight. Every backend has its own circuit
+breaker, so a failing host is ejected and re-admitted after its /api/tags
+probe succeeds. OLLAMA_HEDGE_AFTER (seconds, 0 = off) sends a duplicate of a
+slow non-streaming request to a second backend and keeps whichever answers
+first. The other request's connection is then shut down, which makes Ollama
+stop generating, and it doesn't count as a failure of its backend.
+"""
+import json
+import logging
+import os
+import random
+import socket
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+import requests
+from urllib3.connection import HTTPConnection, HTTPSConnection
+from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+
+from circuit_breaker import CircuitBreaker, CircuitOpenError
+from deadline import call_timeout
+
+logger = logging.getLogger(__name__)
+
+NO_PROXY = {'http': None, 'https': None}
+BREAKER_FAILURES = int(os.getenv("OLLAMA_BREAKER_FAILURES", "3"))
+BREAKER_RESET_SECONDS = float(os.getenv("OLLAMA_BREAKER_RESET_SECONDS", "30"))
+HEDGE_AFTER = float(os.getenv("OLLAMA_HEDGE_AFTER", "0"))
+
+
+def _tags_probe(url):
+    def probe():
+        from scripts.check_ollama import tags_ok
+        return tags_ok(url)
+    return probe
+
+
+class Backend:
+    def __init__(self, url, weight=1.0, models=None):
+        self.url = url.rstrip('/')
+        self.weight = max(float(weight), 0.01)
+        self.models = set(models or [])
+        self.outstanding = 0
+        self.requests = 0
+        self.latency_ewma = None
+        self.breaker = CircuitBreaker(
+            f"ollama@{self.url}",
+            failure_threshold=BREAKER_FAILURES,
+            reset_timeout=BREAKER_RESET_SECONDS,
+            probe=_tags_probe(self.url),
+        )
+
+    def serves(self, model):
+        return not self.models or model is None or model in self.models
+
+    def load(self):
+        return (self.outstanding + 1) / self.weight
+
+    def observe_latency(self, seconds):
+        if self.latency_ewma is None:
+            self.latency_ewma = seconds
+        else:
+            self.latency_ewma = 0.8 * self.latency_ewma + 0.2 * seconds
+
+    def snapshot(self):
+        return {
+            'url': self.url,
+            'weight': self.weight,
+            'models': sorted(self.models),
+            'outstanding': self.outstanding,
+            'requests': self.requests,
+            'latency_ewma': self.latency_ewma,
+            'breaker': self.breaker.snapshot(),
+        }
+
+
+# The Cancellable whose request this thread is sending, if any
+_sending = threading.local()
+
+
+def _track(connection):
+    cancellable = getattr(_sending, 'request', None)
+    if cancellable is not None:
+        cancellable.attach(connection)
+
+
+class _TrackedHTTPConnection(HTTPConnection):
+    def connect(self):
+        super().connect()
+        _track(self)
+
+
+class _TrackedHTTPSConnection(HTTPSConnection):
+    def connect(self):
+        super().connect()
+        _track(self)
+
+
+class _TrackedHTTPPool(HTTPConnectionPool):
+    ConnectionCls = _TrackedHTTPConnection
+
+    def _get_conn(self, timeout=None):
+        connection = super()._get_conn(timeout)
+        _track(connection)  # reused keep-alive connections are already connected
+        return connection
+
+
+class _TrackedHTTPSPool(HTTPSConnectionPool):
+    ConnectionCls = _TrackedHTTPSConnection
+
+    def _get_conn(self, timeout=None):
+        connection = super()._get_conn(timeout)
+        _track(connection)
+        return connection
+
+
+def _hedging_session():
+    """Session whose connections a Cancellable can shut down from another thread"""
+    session = requests.Session()
+    for prefix in ('http://', 'https://'):
+        adapter = requests.adapters.HTTPAdapter(pool_maxsize=16)
+        adapter.poolmanager.pool_classes_by_scheme = {'http': _TrackedHTTPPool, 'https': _TrackedHTTPSPool}
+        session.mount(prefix, adapter)
+    return session
+
+
+class Cancellable:
+    """One side of a hedged request. cancel() shuts down its connection, so a
+    blocked send fails at once and Ollama abandons the generation."""
+
+    def __init__(self, session):
+        self.session = session
+        self.cancelled = False
+        self._connections = []
+        self._lock = threading.Lock()
+
+    def post(self, url, **kwargs):
+        if self.cancelled:
+            raise requests.exceptions.ConnectionError('hedged request cancelled')
+        _sending.request = self
+        try:
+            return self.session.post(url, **kwargs)
+        finally:
+            _sending.request = None
+            # The connection goes back to the pool; it's no longer ours to shut down
+            with self._lock:
+                self._connections = []
+
+    def attach(self, connection):
+        with self._lock:
+            self._connections.append(connection)
+            if self.cancelled:
+                self._shutdown(connection)
+
+    def cancel(self):
+        with self._lock:
+            self.cancelled = True
+            for connection in self._connections:
+                self._shutdown(connection)
+
+    @staticmethod
+    def _shutdown(connection):
+        sock = getattr(connection, 'sock', None)
+        if sock is not None:
+            try:
+                sock.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+
+
+def parse_backends(spec):
+    """Parse OLLAMA_API_BASE into Backend objects (single URL, CSV list or JSON list)"""
+    spec = (spec or '').strip()
+    if not spec:
+        return []
+    if spec.startswith('['):
+        entries = json.loads(spec)
+        return [
+            Backend(e['url'], e.get('weight', 1), e.get('models'))
+            if isinstance(e, dict) else Backend(e)
+            for e in entries
+        ]
+    return [Backend(url.strip()) for url in spec.split(',') if url.strip()]
+
+
+class OllamaPool:
+    def __init__(self, backends, hedge_after=HEDGE_AFTER):
+        self.backends = list(backends)
+        self.hedge_after = hedge_after
+        self._lock = threading.Lock()
+        self._hedge_executor = None
+        self._hedge_session = None
+
+    # --- routing -------------------------------------------------------
+
+    def is_open(self):
+        """True when no backend can take traffic (every breaker is open)"""
+        return all(b.breaker.is_open() for b in self.backends)
+
+    def pick(self, model=None, exclude=()):
+        """Reserve the least-loaded healthy backend serving `model`, or None"""
+        with self._lock:
+            candidates = [b for b in self.backends if b not in exclude and b.serves(model)]
+            random.shuffle(candidates)  # spread ties
+            candidates.sort(key=lambda b: b.load())
+            for backend in candidates:
+                if backend.breaker.allow():
+                    backend.outstanding += 1
+                    backend.requests += 1
+                    return backend
+        return None
+
+    def release(self, backend):
+        with self._lock:
+            backend.outstanding -= 1
+
+    # --- requests ------------------------------------------------------
+
+    def _send(self, backend, path, payload, timeout, stream=False, cancellable=None):
+        started = time.monotonic()
+        post = requests.post if cancellable is None else cancellable.post
+        try:
+            resp = post(f"{backend.url}{path}", json=payload, timeout=timeout,
+                        stream=stream, proxies=NO_PROXY)
+        except requests.exceptions.RequestException as e:
+            if cancellable is None or not cancellable.cancelled:
+                # A hedge we cancelled says nothing about the backend's health
+                backend.breaker.record_failure(e)
+            raise
+        if resp.status_code >= 500:
+            backend.breaker.record_failure(f"status {resp.status_code}")
+        else:
+            backend.breaker.record_success()
+            backend.observe_latency(time.monotonic() - started)
+        return resp
+
+    def _post_with_failover(self, path, payload, timeout, tried=None, cancellable=None):
+        model = payload.get('model')
+        tried = [] if tried is None else tried
+        last_error = None
+        while True:
+            backend = self.pick(model, exclude=tried)
+            if backend is None:
+                if last_error is not None:
+                    raise last_error
+                raise CircuitOpenError(f"No healthy Ollama backend for model {model}")
+            tried.append(backend)
+            try:
+                return self._send(backend, path, payload, timeout, cancellable=cancellable)
+            except requests.exceptions.ConnectionError as e:
+                if cancellable is not None and cancellable.cancelled:
+                    raise
+                # Refused/unreachable fails fast - worth trying the next host
+                logger.warning('Ollama backend %s unreachable, failing over', backend.url)
+                last_error = e
+            finally:
+                self.release(backend)
+
+    def post(self, path, payload, timeout=90):
+        """POST to the best backend; returns requests.Response
+
+        Raises CircuitOpenError when no backend is available and
+        requests exceptions for timeouts on the chosen backend. `timeout` is
+        capped at what remains of the active request deadline (deadline.py).
+        """
+        timeout = call_timeout(timeout, path)
+        if not self.hedge_after or len(self.backends) < 2:
+            return self._post_with_failover(path, payload, timeout)
+
+        if self._hedge_executor is None:
+            with self._lock:
+                if self._hedge_executor is None:
+                    self._hedge_session = _hedging_session()
+                    self._hedge_executor = ThreadPoolExecutor(max_workers=8, thread_name_prefix='ollama-hedge')
+
+        primary_tried = []
+        requests_by_future = {}
+        cancellable = Cancellable(self._hedge_session)
+        primary = self._hedge_executor.submit(self._post_with_failover, path, payload, timeout,
+                                              primary_tried, cancellable)
+        requests_by_future[primary] = cancellable
+        done, _ = wait([primary], timeout=self.hedge_after)
+        if done:
+            return primary.result()
+
+        backend = self.pick(payload.get('model'), exclude=list(primary_tried))
+        if backend is None:
+            return primary.result()
+        logger.info('Hedging slow Ollama request to %s', backend.url)
+
+        cancellable = Cancellable(self._hedge_session)
+
+        def hedge():
+            try:
+                return self._send(backend, path, payload, timeout, cancellable=cancellable)
+            finally:
+                self.release(backend)
+
+        requests_by_future[self._hedge_executor.submit(hedge)] = cancellable
+        pending = set(requests_by_future)
+        error = None
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                try:
+                    resp = future.result()
+                except Exception as e:
+                    error = e
+                    continue
+                if resp.status_code < 500 or not pending:
+                    for loser in pending:
+                        requests_by_future[loser].cancel()
+                    return resp
+        raise error
+
+    def stream_lines(self, path, payload, timeout=90):
+        """POST with stream=True and yield non-empty response lines, holding the
+        backend's outstanding slot until the stream is consumed"""
+        timeout = call_timeout(timeout, path)
+        backend = self.pick(payload.get('model'))
+        if backend is None:
+            raise CircuitOpenError(f"No healthy Ollama backend for model {payload.get('model')}")
+        try:
+            with self._send(backend, path, payload, timeout, stream=True) as resp:
+                resp.raise_for_status()
+                try:
+                    for line in resp.iter_lines():
+                        if line:
+                            yield line
+                except (requests.exceptions.ConnectionError,
+                        requests.exceptions.ChunkedEncodingError) as e:
+                    # Backend died mid-generation
+                    backend.breaker.record_failure(e)
+                    raise
+        finally:
+            self.release(backend)
+
+    def snapshot(self):
+        return {
+            'state': 'open' if self.is_open() else 'closed',
+            'hedge_after': self.hedge_after,
+            'backends': [b.snapshot() for b in self.backends],
+        }
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def configure(spec, hedge_after=HEDGE_AFTER):
+    """(Re)build the shared pool from an OLLAMA_API_BASE-style spec"""
+    global _pool
+    with _pool_lock:
+        _pool = OllamaPool(parse_backends(spec), hedge_after=hedge_after)
+    return _pool
+
+
+def get_pool():
+    """Shared pool used by views, embeddings and scripts"""
+    if _pool is None:
+        return configure(os.getenv("OLLAMA_API_BASE", "http://localhost:11434"))
+    return _pool
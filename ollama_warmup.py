@@ -0,0 +1,224 @@
+"""
+Model warm-up and keep-warm pings for Ollama
+
+Without this, the first chat after a deploy (or after Ollama unloaded an idle
+model) pays the full model-load time on top of generation. Warm-up waits for
+every backend's /api/tags, pulls any configured model the backend is
+missing, then sends an empty generate request (Ollama's documented way to
+load a model) and a one-word embedding so both models are resident. Each
+request carries `keep_alive` so Ollama keeps the model loaded that long
+after its last use.
+
+With OLLAMA_KEEP_WARM_SECONDS > 0 a background thread repeats the preload on
+any backend that has served no traffic since the previous tick, so a quiet
+period never lets the model fall out of memory.
+
+With several worker processes the models are warmed once, by the
+supervisor (`manage.py warm_ollama --state PATH`), which publishes its
+snapshot to PATH; workers read readiness from there (read_state) instead
+of each warming the same models.
+"""
+import json
+import logging
+import os
+import threading
+import time
+
+import requests
+
+logger = logging.getLogger(__name__)
+
+NO_PROXY = {'http': None, 'https': None}
+KEEP_ALIVE = os.getenv("OLLAMA_KEEP_ALIVE", "30m")
+KEEP_WARM_SECONDS = float(os.getenv("OLLAMA_KEEP_WARM_SECONDS", "0"))
+PULL_MISSING = os.getenv("OLLAMA_PULL_MISSING", "true").lower() == "true"
+
+PENDING = "pending"
+WARMING = "warming"
+READY = "ready"
+FAILED = "failed"
+
+
+def write_state(path, snapshot):
+    """Publish a warm-up snapshot for other processes (atomic replace)"""
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    tmp = f'{path}.{os.getpid()}.tmp'
+    with open(tmp, 'w') as f:
+        json.dump(snapshot, f)
+    os.replace(tmp, path)
+
+
+def read_state(path):
+    """The snapshot published at `path`; pending until one has been written"""
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {'state': PENDING}
+
+
+def installed_models(url, timeout=5):
+    """Model names the backend has pulled (names with and without ':latest')"""
+    resp = requests.get(f"{url}/api/tags", timeout=timeout, proxies=NO_PROXY)
+    resp.raise_for_status()
+    names = set()
+    for m in resp.json().get('models', []):
+        name = m.get('name') or m.get('model') or ''
+        names.add(name)
+        if name.endswith(':latest'):
+            names.add(name[:-len(':latest')])
+    return names
+
+
+def wait_for_tags(url, timeout=60):
+    """Block until GET /api/tags answers, or timeout; returns True when up"""
+    deadline = time.monotonic() + timeout
+    while True:
+        try:
+            installed_models(url, timeout=2)
+            return True
+        except requests.exceptions.RequestException:
+            if time.monotonic() >= deadline:
+                return False
+            time.sleep(1)
+
+
+def pull(url, model, timeout=1800):
+    logger.info('Pulling %s on %s', model, url)
+    resp = requests.post(f"{url}/api/pull", json={'model': model, 'stream': False},
+                         timeout=timeout, proxies=NO_PROXY)
+    resp.raise_for_status()
+
+
+def preload_generate(url, model, keep_alive=KEEP_ALIVE, timeout=300):
+    """Load `model` into memory without generating anything"""
+    resp = requests.post(f"{url}/api/generate",
+                         json={'model': model, 'prompt': '', 'stream': False, 'keep_alive': keep_alive},
+                         timeout=timeout, proxies=NO_PROXY)
+    resp.raise_for_status()
+
+
+def preload_embed(url, model, keep_alive=KEEP_ALIVE, timeout=120):
+    resp = requests.post(f"{url}/api/embed",
+                         json={'model': model, 'input': 'warm-up', 'keep_alive': keep_alive},
+                         timeout=timeout, proxies=NO_PROXY)
+    resp.raise_for_status()
+
+
+class Warmer:
+    """Warms every backend in an OllamaPool and optionally keeps it warm"""
+
+    def __init__(self, pool, models, embed_model=None, keep_alive=KEEP_ALIVE,
+                 keep_warm_seconds=KEEP_WARM_SECONDS, pull_missing=PULL_MISSING, state_path=None):
+        self.pool = pool
+        self.models = [m for m in dict.fromkeys(models) if m]
+        self.embed_model = embed_model
+        self.keep_alive = keep_alive
+        self.keep_warm_seconds = keep_warm_seconds
+        self.pull_missing = pull_missing
+        self.state_path = state_path
+        self.state = PENDING
+        self.errors = {}
+        self.warmed_at = None
+        self.pings = 0
+        self._pid = None
+        self._lock = threading.Lock()
+
+    def _models_for(self, backend):
+        models = [m for m in self.models if backend.serves(m)]
+        embed = self.embed_model if self.embed_model and backend.serves(self.embed_model) else None
+        return models, embed
+
+    def warm_backend(self, backend, tags_timeout=60):
+        models, embed = self._models_for(backend)
+        if not wait_for_tags(backend.url, timeout=tags_timeout):
+            raise RuntimeError('/api/tags did not answer')
+        if self.pull_missing:
+            have = installed_models(backend.url)
+            for model in models + ([embed] if embed else []):
+                if model not in have:
+                    pull(backend.url, model)
+        for model in models:
+            preload_generate(backend.url, model, self.keep_alive)
+        if embed:
+            preload_embed(backend.url, embed, self.keep_alive)
+
+    def _publish(self):
+        if self.state_path:
+            try:
+                write_state(self.state_path, self.snapshot())
+            except OSError as e:
+                logger.warning('Could not publish warm-up state to %s: %s', self.state_path, e)
+
+    def warm(self, tags_timeout=60):
+        """Warm all backends; READY if at least one backend is warm"""
+        self.state = WARMING
+        self._publish()
+        started = time.monotonic()
+        errors = {}
+        for backend in self.pool.backends:
+            try:
+                self.warm_backend(backend, tags_timeout)
+            except Exception as e:
+                errors[backend.url] = str(e)
+                logger.warning('Warm-up failed on %s: %s', backend.url, e)
+        self.errors = errors
+        ok = len(errors) < len(self.pool.backends)
+        self.state = READY if ok else FAILED
+        self.warmed_at = time.time()
+        self._publish()
+        logger.info('Ollama warm-up %s in %.1fs (models: %s)', self.state,
+                    time.monotonic() - started, ', '.join(self.models))
+        return ok
+
+    def keep_warm(self):
+        """Ping idle backends every keep_warm_seconds, forever"""
+        last_seen = {b.url: b.requests for b in self.pool.backends}
+        while True:
+            time.sleep(self.keep_warm_seconds)
+            for backend in self.pool.backends:
+                idle = backend.requests == last_seen.get(backend.url)
+                last_seen[backend.url] = backend.requests
+                if not idle or backend.breaker.is_open():
+                    continue
+                models, _ = self._models_for(backend)
+                for model in models:
+                    try:
+                        preload_generate(backend.url, model, self.keep_alive, timeout=60)
+                        self.pings += 1
+                    except requests.exceptions.RequestException as e:
+                        logger.debug('Keep-warm ping to %s failed: %s', backend.url, e)
+
+    def ensure_started(self):
+        """Start warm-up (and keep-warm) in this process once (keyed by pid).
+
+        For a single server process only; with several workers the
+        supervisor warms once and workers read the published state.
+        """
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            self.state = PENDING
+
+        def run():
+            self.warm()
+            if self.keep_warm_seconds > 0:
+                self.keep_warm()
+
+        threading.Thread(target=run, name='ollama-warmup', daemon=True).start()
+
+    def is_ready(self):
+        return self.state == READY
+
+    def snapshot(self):
+        return {
+            'state': self.state,
+            'models': self.models,
+            'embed_model': self.embed_model,
+            'keep_alive': self.keep_alive,
+            'keep_warm_seconds': self.keep_warm_seconds,
+            'warmed_at': self.warmed_at,
+            'keep_warm_pings': self.pings,
+            'errors': self.errors,
+        }
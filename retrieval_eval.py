@@ -0,0 +1,270 @@
+"""
+Retrieval quality and latency evaluation
+
+Runs each retrieval backend over a labeled question set at several values of
+k. For every (backend, k) configuration it reports recall@k, MRR, nDCG@k
+(binary relevance), p50/p99 latency per query, and memory (RSS growth while
+the backend was built, and peak process RSS during its run).
+
+A labeled set is JSONL, one question per line:
+
+  {"question": "How does a Roth IRA work?", "relevant": [812, 813]}
+  {"question": "...", "relevant_text": ["contribution limit"]}
+
+"relevant" lists corpus row indices (the chunk ids in the index).
+"relevant_text" is resolved to every row that contains the phrase. Without a
+labeled file, synthesize() builds a known-item set: each question is a short
+phrase taken from a random row, and the relevant rows are the ones that
+contain that phrase. That measures whether the source row is found, and it
+favours keyword search, so use it for relative comparisons between versions
+of the same backend.
+
+Rows folded into a canonical chunk by near-duplicate dedup count as that
+canonical row, in rankings and in the labels alike.
+
+Backends register with @backend(name). A factory returns search(query, k),
+which gives back ranked row indices, or raises BackendUnavailable. New index
+types plug in the same way. `manage.py evaluate_retrieval` is the CLI.
+"""
+import json
+import math
+import os
+import random
+import re
+import time
+
+from corpus import DEDUP_THRESHOLD, chunking_id, corpus_version, get_corpus
+from memory_watchdog import rss_mb
+
+BACKENDS = {}
+
+
+class BackendUnavailable(Exception):
+    """The backend can't be built in this environment (e.g. no artifact file)"""
+
+
+def backend(name):
+    def register(factory):
+        BACKENDS[name] = factory
+        return factory
+    return register
+
+
+@backend("keyword")
+def keyword_backend(**options):
+    from simple_fallback import keyword_rank, keywords
+
+    corpus = get_corpus()
+    return lambda query, k: [row for row, _ in keyword_rank(keywords(query), k, corpus)]
+
+
+def _open_artifact(artifact_path):
+    from embeddings import embedding_model_id, shared_embeddings
+    from index_artifact import DEFAULT_PATH, StaleArtifactError, load_artifact
+
+    path = artifact_path or DEFAULT_PATH
+    if not os.path.exists(path):
+        raise BackendUnavailable(f"{path} not found (run manage.py build_index)")
+    embeddings = shared_embeddings()
+    try:
+        artifact = load_artifact(path, corpus_version(), embedding_model_id(embeddings),
+                                 chunking_id(DEDUP_THRESHOLD))
+    except StaleArtifactError as e:
+        raise BackendUnavailable(str(e))
+    return artifact, embeddings
+
+
+@backend("artifact")
+def artifact_backend(artifact_path=None, **options):
+    artifact, embeddings = _open_artifact(artifact_path)
+
+    def search(query, k):
+        top, _ = artifact.search(embeddings.embed_query(query), k)
+        return [artifact.chunks[i]["row_index"] for i in top]
+    return search
+
+
+@backend("artifact-mmr")
+def artifact_mmr_backend(artifact_path=None, fetch_k=20, lambda_mult=0.5, **options):
+    artifact, embeddings = _open_artifact(artifact_path)
+
+    def search(query, k):
+        top = artifact.mmr(embeddings.embed_query(query), k, fetch_k, lambda_mult)
+        return [artifact.chunks[i]["row_index"] for i in top]
+    return search
+
+
+@backend("chroma")
+def chroma_backend(**options):
+    from vector_enhanced import build_chroma_retriever
+
+    store = build_chroma_retriever().vectorstore
+    return lambda query, k: [doc.metadata["row_index"] for doc in store.similarity_search(query, k=k)]
+
+
+@backend("ivf")
+def ivf_backend(artifact_path=None, nprobe=8, **options):
+    from cluster_index import load_hierarchical
+
+    artifact, embeddings = _open_artifact(artifact_path)
+    index = load_hierarchical(artifact, nprobe=nprobe)
+    if index is None:
+        raise BackendUnavailable("no clustering for this artifact (run manage.py cluster_index)")
+
+    def search(query, k):
+        top, _ = index.search(embeddings.embed_query(query), k)
+        return [index.chunks[i].get("row_index") for i in top]
+    return search
+
+
+# --- labeled sets ------------------------------------------------------------
+
+def load_labels(path):
+    corpus = get_corpus()
+    labels = []
+    with open(path) as f:
+        for line_no, line in enumerate(f, 1):
+            if not line.strip():
+                continue
+            record = json.loads(line)
+            relevant = set(record.get("relevant", []))
+            for text in record.get("relevant_text", []):
+                relevant.update(corpus.count_matches([text.lower()]))
+            if not relevant:
+                raise ValueError(f"{path}:{line_no}: no relevant rows for {record.get('question')!r}")
+            labels.append({"question": record["question"], "relevant": sorted(relevant)})
+    return labels
+
+
+def synthesize(n=200, words=8, seed=0, max_relevant=5):
+    """Known-item questions: a `words`-long phrase from a random row"""
+    corpus = get_corpus()
+    rng = random.Random(seed)
+    candidates = [i for i in range(len(corpus)) if len(corpus.cell(i).split()) >= words]
+    labels = []
+    for row in rng.sample(candidates, min(len(candidates), n * 3)):
+        tokens = corpus.cell(row).split()
+        start = rng.randrange(len(tokens) - words + 1)
+        phrase = " ".join(tokens[start:start + words])
+        relevant = sorted(corpus.count_matches([phrase.lower()]))
+        # Boilerplate phrases that recur everywhere say little about ranking
+        if row in relevant and len(relevant) <= max_relevant:
+            labels.append({"question": re.sub(r"\[\d+\]", "", phrase).strip(), "relevant": relevant})
+        if len(labels) == n:
+            break
+    return labels
+
+
+# --- metrics -----------------------------------------------------------------
+
+def score_ranking(ranked, relevant, k):
+    """(recall@k, reciprocal rank, nDCG@k) for one query"""
+    seen, top = set(), []
+    for row in ranked:
+        if row not in seen:
+            seen.add(row)
+            top.append(row)
+    top = top[:k]
+    relevant = set(relevant)
+    hits = [i for i, row in enumerate(top) if row in relevant]
+    recall = len(hits) / len(relevant)
+    rr = 1.0 / (hits[0] + 1) if hits else 0.0
+    dcg = sum(1.0 / math.log2(i + 2) for i in hits)
+    ideal = sum(1.0 / math.log2(i + 2) for i in range(min(len(relevant), k)))
+    return recall, rr, dcg / ideal
+
+
+def percentile(values, p):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(math.ceil(p / 100 * len(values))) - 1)]
+
+
+def evaluate(search, labels, k, canonical=None):
+    canonical = canonical or {}
+    latencies, recalls, rrs, ndcgs = [], [], [], []
+    peak_rss = rss_mb(os.getpid()) or 0.0
+    search(labels[0]["question"], k)  # warm caches outside the timings
+    for label in labels:
+        started = time.perf_counter()
+        ranked = search(label["question"], k)
+        latencies.append((time.perf_counter() - started) * 1000)
+        recall, rr, ndcg = score_ranking([canonical.get(row, row) for row in ranked],
+                                         {canonical.get(row, row) for row in label["relevant"]}, k)
+        recalls.append(recall)
+        rrs.append(rr)
+        ndcgs.append(ndcg)
+        peak_rss = max(peak_rss, rss_mb(os.getpid()) or 0.0)
+    n = len(labels)
+    return {
+        "k": k,
+        "queries": n,
+        "recall": sum(recalls) / n,
+        "mrr": sum(rrs) / n,
+        "ndcg": sum(ndcgs) / n,
+        "p50_ms": percentile(latencies, 50),
+        "p99_ms": percentile(latencies, 99),
+        "peak_rss_mb": peak_rss,
+    }
+
+
+def run(labels, backends, ks, variants=None, **options):
+    """Results for every available backend x k, plus {backend: reason} for
+    skipped ones. `variants` sweeps backend options: {"ivf": [{"nprobe": 4},
+    {"nprobe": 16}]} evaluates ivf/nprobe=4 and ivf/nprobe=16."""
+    results, skipped = [], {}
+    canonical = get_corpus().canonical_rows(DEDUP_THRESHOLD)
+    configs = []
+    for name in backends:
+        for extra in (variants or {}).get(name) or [{}]:
+            label = "/".join([name] + [f"{key}={value}" for key, value in extra.items()])
+            configs.append((label, name, {**options, **extra}))
+    for label, name, backend_options in configs:
+        before = rss_mb(os.getpid()) or 0.0
+        started = time.perf_counter()
+        try:
+            search = BACKENDS[name](**backend_options)
+        except BackendUnavailable as e:
+            skipped[label] = str(e)
+            continue
+        init_s = time.perf_counter() - started
+        init_mb = max(0.0, (rss_mb(os.getpid()) or 0.0) - before)
+        for k in ks:
+            result = evaluate(search, labels, k, canonical)
+            result.update(backend=label, init_s=init_s, init_mb=init_mb)
+            results.append(result)
+    return results, skipped
+
+
+# --- reporting ---------------------------------------------------------------
+
+COLUMNS = [
+    ("backend", "{:<16}"), ("k", "{:>3}"), ("recall", "{:>7.3f}"), ("mrr", "{:>6.3f}"),
+    ("ndcg", "{:>6.3f}"), ("p50_ms", "{:>8.2f}"), ("p99_ms", "{:>8.2f}"),
+    ("init_mb", "{:>8.1f}"), ("peak_rss_mb", "{:>11.1f}"),
+]
+
+
+def format_table(results):
+    header = "  ".join(fmt.replace(".3f", "").replace(".2f", "").replace(".1f", "").format(name)
+                       for name, fmt in COLUMNS)
+    lines = [header, "-" * len(header)]
+    for result in results:
+        lines.append("  ".join(fmt.format(result[name]) for name, fmt in COLUMNS))
+    return "\n".join(lines)
+
+
+def compare(results, baseline, latency_tolerance=0.10):
+    """[(result, base, wins)] for configurations present in both runs. A
+    configuration wins when nDCG and recall are no lower and p50 latency is
+    no more than `latency_tolerance` slower (or 1 ms, whichever is larger,
+    so sub-millisecond backends aren't failed on timer noise)."""
+    by_key = {(b["backend"], b["k"]): b for b in baseline}
+    rows = []
+    for result in results:
+        base = by_key.get((result["backend"], result["k"]))
+        if base is None:
+            continue
+        wins = (result["ndcg"] >= base["ndcg"] - 1e-9 and result["recall"] >= base["recall"] - 1e-9
+                and result["p50_ms"] <= base["p50_ms"] + max(base["p50_ms"] * latency_tolerance, 1.0))
+        rows.append((result, base, wins))
+    return rows
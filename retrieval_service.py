@@ -0,0 +1,570 @@
+#!/usr/bin/env python3
+"""
+Shared retrieval daemon over a Unix socket
+
+Without it every web worker loads its own copy of the corpus, the
+embedding model and the vector index (vector_enhanced), so N workers cost N
+times the memory and N warm-ups. This daemon holds the only copy. Workers
+talk to it through RetrievalClient, which has the same invoke() interface
+as the in-process retrievers. AIStack hands one out when RETRIEVAL_SOCKET is
+set, and `start_concurrent.py --retrieval-service` supervises the daemon.
+
+Protocol: each message is a fixed header plus a body. Integers are
+little-endian and strings are UTF-8, prefixed with their length.
+
+  request   "FR" | version u8 | op u8 | k u16 | count u16 | body length u32
+            search body: collections (u16 str, comma-separated, "" = all),
+                         then `count` queries (u16 str each, cut to
+                         MAX_QUERY_BYTES by the client)
+            vector search body: collections (u16 str), dimension u16, then
+                         `count` x dimension float32 (queries already embedded)
+  response  "FR" | version u8 | status u8 | body length u32
+            search body: for each query, hits u16, then for each hit
+                         id (u16 str), text (u32 str), metadata (u16 str, JSON)
+            info body:   JSON; error body: the message
+
+Connections are persistent and carry any number of requests. Queries that
+arrive within RETRIEVAL_BATCH_WINDOW_MS of each other, from any
+connection, are embedded with one embed_documents() call before searching.
+
+The client keeps a small pool of connections per process and reconnects
+after a fork. A circuit breaker covers the daemon. When it can't be
+reached (connection refused, no socket, circuit open) and
+RETRIEVAL_SERVICE_FALLBACK is on, the in-process retriever starts loading
+in a background thread and queries run on it once it is ready. Until then,
+and for any other failure such as a timeout from a slow daemon, the call
+raises and chat falls back to keyword search.
+
+Usage:
+  python retrieval_service.py --socket /tmp/financial_tools/retrieval.sock
+"""
+import argparse
+import json
+import logging
+import os
+import queue
+import signal
+import socket
+import socketserver
+import struct
+import sys
+import threading
+import time
+from concurrent.futures import Future
+
+from circuit_breaker import CircuitBreaker, CircuitOpenError
+from deadline import call_timeout
+
+logger = logging.getLogger(__name__)
+
+MAGIC = b"FR"
+VERSION = 1
+OP_SEARCH = 1
+OP_INFO = 2
+OP_SEARCH_VECTORS = 3
+STATUS_OK = 0
+STATUS_ERROR = 1
+REQUEST = struct.Struct("<2sBBHHI")
+RESPONSE = struct.Struct("<2sBBI")
+MAX_BODY = 64 * 1024 * 1024
+# Longer queries are cut; embedding models see far less than this anyway
+MAX_QUERY_BYTES = 8 * 1024
+
+DEFAULT_SOCKET = os.getenv("RETRIEVAL_SOCKET") or "/tmp/financial_tools/retrieval.sock"
+BATCH_WINDOW_MS = float(os.getenv("RETRIEVAL_BATCH_WINDOW_MS", "2"))
+MAX_BATCH = int(os.getenv("RETRIEVAL_MAX_BATCH", "64"))
+
+
+class ProtocolError(Exception):
+    """Malformed or unexpected message on the retrieval socket"""
+
+
+class RetrievalServiceError(Exception):
+    """The daemon answered with an error"""
+
+
+# The daemon isn't there at all: worth searching in-process instead. A timeout
+# (a slow or overloaded daemon) is not, it goes to keyword search.
+UNREACHABLE = (ConnectionRefusedError, FileNotFoundError, CircuitOpenError)
+
+
+# --- encoding ----------------------------------------------------------
+
+def _str16(text):
+    data = text.encode("utf-8")
+    if len(data) > 0xFFFF:
+        raise ValueError(f"string of {len(data)} bytes does not fit a u16 length")
+    return struct.pack("<H", len(data)) + data
+
+
+def _str32(text):
+    data = text.encode("utf-8")
+    return struct.pack("<I", len(data)) + data
+
+
+class _Reader:
+    def __init__(self, data):
+        self.data = memoryview(data)
+        self.pos = 0
+
+    def _take(self, size):
+        if self.pos + size > len(self.data):
+            raise ProtocolError("truncated message")
+        chunk = self.data[self.pos:self.pos + size]
+        self.pos += size
+        return chunk
+
+    def u16(self):
+        return struct.unpack("<H", self._take(2))[0]
+
+    def u32(self):
+        return struct.unpack("<I", self._take(4))[0]
+
+    def str16(self):
+        return bytes(self._take(self.u16())).decode("utf-8")
+
+    def str32(self):
+        return bytes(self._take(self.u32())).decode("utf-8")
+
+
+def _recv_exact(sock, size):
+    buffer = bytearray()
+    while len(buffer) < size:
+        chunk = sock.recv(size - len(buffer))
+        if not chunk:
+            if buffer:
+                raise ProtocolError("connection closed mid-message")
+            return None
+        buffer.extend(chunk)
+    return bytes(buffer)
+
+
+def _truncate(text, limit=MAX_QUERY_BYTES):
+    """`text` cut to at most `limit` UTF-8 bytes, on a character boundary"""
+    data = text.encode("utf-8")
+    return text if len(data) <= limit else data[:limit].decode("utf-8", "ignore")
+
+
+def encode_search(queries, k, collections=None):
+    body = _str16(",".join(collections or ())) + b"".join(_str16(_truncate(q)) for q in queries)
+    return REQUEST.pack(MAGIC, VERSION, OP_SEARCH, k, len(queries), len(body)) + body
+
+
+def decode_search(count, body):
+    reader = _Reader(body)
+    collections = [c for c in reader.str16().split(",") if c] or None
+    return [reader.str16() for _ in range(count)], collections
+
+
+def encode_vector_search(vectors, k, collections=None):
+    dimension = len(vectors[0]) if vectors else 0
+    values = [float(x) for vector in vectors for x in vector]
+    body = (_str16(",".join(collections or ())) + struct.pack("<H", dimension)
+            + struct.pack(f"<{len(values)}f", *values))
+    return REQUEST.pack(MAGIC, VERSION, OP_SEARCH_VECTORS, k, len(vectors), len(body)) + body
+
+
+def decode_vector_search(count, body):
+    reader = _Reader(body)
+    collections = [c for c in reader.str16().split(",") if c] or None
+    dimension = reader.u16()
+    values = struct.unpack(f"<{count * dimension}f", reader._take(4 * count * dimension))
+    return [list(values[i * dimension:(i + 1) * dimension]) for i in range(count)], collections
+
+
+def encode_hits(results):
+    parts = []
+    for documents in results:
+        parts.append(struct.pack("<H", len(documents)))
+        for doc in documents:
+            parts.append(_str16(str(doc.id or "")) + _str32(doc.page_content)
+                         + _str16(json.dumps(doc.metadata or {}, ensure_ascii=False)))
+    return b"".join(parts)
+
+
+def decode_hits(count, body):
+    from langchain_core.documents import Document
+
+    reader = _Reader(body)
+    results = []
+    for _ in range(count):
+        documents = []
+        for _ in range(reader.u16()):
+            doc_id, text, metadata = reader.str16(), reader.str32(), json.loads(reader.str16())
+            documents.append(Document(page_content=text, id=doc_id or None, metadata=metadata))
+        results.append(documents)
+    return results
+
+
+def encode_response(status, body=b""):
+    return RESPONSE.pack(MAGIC, VERSION, status, len(body)) + body
+
+
+# --- daemon -----------------------------------------------------------
+
+class Batcher:
+    """Collects queries from concurrent connections for `window_ms` (up to
+    `max_batch`), embeds them with one call, then searches. Queries sent
+    as vectors skip the embedding."""
+
+    def __init__(self, embed, search, window_ms=BATCH_WINDOW_MS, max_batch=MAX_BATCH):
+        self.embed = embed
+        self.search = search
+        self.window = window_ms / 1000.0
+        self.max_batch = max(1, max_batch)
+        self._queue = queue.Queue()
+        self.stats = {"requests": 0, "queries": 0, "batches": 0, "errors": 0}
+        threading.Thread(target=self._loop, name="retrieval-batcher", daemon=True).start()
+
+    def submit(self, queries, k, collections=None, vectors=None):
+        future = Future()
+        self._queue.put((queries, vectors, k, collections, future))
+        return future.result()
+
+    def _loop(self):
+        while True:
+            batch = [self._queue.get()]
+            size = len(batch[0][0])
+            deadline = time.monotonic() + self.window
+            while size < self.max_batch:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    item = self._queue.get(timeout=remaining)
+                except queue.Empty:
+                    break
+                batch.append(item)
+                size += len(item[0])
+            self._run(batch)
+
+    def _run(self, batch):
+        self.stats["requests"] += len(batch)
+        self.stats["batches"] += 1
+        texts = [q for queries, vectors, *_ in batch if vectors is None for q in queries]
+        try:
+            embedded = self.embed(texts) if texts else []
+        except Exception as e:
+            for queries, vectors, *_, future in batch:
+                if vectors is None:
+                    self.stats["errors"] += 1
+                    future.set_exception(e)
+            batch = [item for item in batch if item[1] is not None]
+            embedded = []
+        start = 0
+        for queries, vectors, k, collections, future in batch:
+            if vectors is None:
+                vectors = embedded[start:start + len(queries)]
+                start += len(queries)
+            try:
+                future.set_result(self.search(vectors, k, collections))
+                self.stats["queries"] += len(vectors)
+            except Exception as e:
+                self.stats["errors"] += 1
+                future.set_exception(e)
+
+
+class _Handler(socketserver.BaseRequestHandler):
+    def handle(self):
+        server = self.server
+        while True:
+            try:
+                header = _recv_exact(self.request, REQUEST.size)
+                if header is None:
+                    return
+                magic, version, op, k, count, length = REQUEST.unpack(header)
+                if magic != MAGIC or version != VERSION or length > MAX_BODY:
+                    raise ProtocolError(f"bad header {header!r}")
+                body = _recv_exact(self.request, length) if length else b""
+            except (ProtocolError, OSError) as e:
+                logger.warning("Dropping retrieval connection: %s", e)
+                return
+            try:
+                if op == OP_SEARCH:
+                    queries, collections = decode_search(count, body)
+                    reply = encode_response(STATUS_OK, encode_hits(server.batcher.submit(queries, k, collections)))
+                elif op == OP_SEARCH_VECTORS:
+                    vectors, collections = decode_vector_search(count, body)
+                    reply = encode_response(STATUS_OK, encode_hits(
+                        server.batcher.submit([None] * count, k, collections, vectors)))
+                elif op == OP_INFO:
+                    reply = encode_response(STATUS_OK, json.dumps(server.info()).encode("utf-8"))
+                else:
+                    raise ProtocolError(f"unknown op {op}")
+            except Exception as e:
+                reply = encode_response(STATUS_ERROR, str(e).encode("utf-8"))
+            try:
+                self.request.sendall(reply)
+            except OSError:
+                return
+
+
+class RetrievalServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+    # Every worker may open pool_size connections at once when it starts
+    request_queue_size = 128
+
+    def __init__(self, path, batcher, info):
+        self.path = path
+        self.batcher = batcher
+        self._info = info
+        self.started = time.time()
+        super().__init__(path, _Handler)
+        os.chmod(path, 0o660)
+
+    def info(self):
+        return dict(self._info, pid=os.getpid(), uptime_s=round(time.time() - self.started),
+                    **self.batcher.stats)
+
+
+def _remove_stale_socket(path):
+    """Unlink a socket file left by a dead daemon; refuse if one is listening"""
+    if not os.path.exists(path):
+        return
+    probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        probe.connect(path)
+    except OSError:
+        os.unlink(path)
+        return
+    finally:
+        probe.close()
+    raise SystemExit(f"❌ A retrieval service is already listening on {path}")
+
+
+def serve(path=DEFAULT_SOCKET, window_ms=BATCH_WINDOW_MS, max_batch=MAX_BATCH):
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    _remove_stale_socket(path)
+    print("📚 Loading the retrieval stack...")
+    started = time.monotonic()
+    import vector_enhanced
+
+    retriever = vector_enhanced.get_retriever()
+    info = {
+        "retriever": type(retriever).__name__,
+        "embedding_model": vector_enhanced.embedding_model,
+        "collections": getattr(retriever, "collections", None),
+    }
+    batcher = Batcher(vector_enhanced.embeddings.embed_documents, vector_enhanced.search_vectors,
+                      window_ms, max_batch)
+    server = RetrievalServer(path, batcher, info)
+
+    def stop(signum, frame):
+        threading.Thread(target=server.shutdown, daemon=True).start()
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+
+    print(f"✅ Retrieval service ready on {path} ({info['retriever']}, "
+          f"loaded in {time.monotonic() - started:.1f}s)")
+    try:
+        server.serve_forever()
+    finally:
+        server.server_close()
+        if os.path.exists(path):
+            os.unlink(path)
+        print("✅ Retrieval service stopped")
+
+
+# --- client -----------------------------------------------------------
+
+class RetrievalClient:
+    """Retriever backed by the daemon: invoke(query) -> Documents.
+
+    Keeps up to `pool_size` idle connections per process. Calls are bounded
+    by `timeout` and by the request deadline (deadline.py). `fallback`
+    returns an in-process retriever; it is loaded in the background the
+    first time the daemon is unreachable and used while it stays so.
+    """
+
+    def __init__(self, path=DEFAULT_SOCKET, pool_size=4, timeout=5.0, k=5, fallback=None):
+        self.path = path
+        self.pool_size = max(1, pool_size)
+        self.timeout = timeout
+        self.k = k
+        self._fallback = fallback
+        self._fallback_retriever = None
+        self._fallback_loading = False
+        self._lock = threading.Lock()
+        self._pid = None
+        self._idle = None
+        self._info = None
+        self.breaker = CircuitBreaker("retrieval-service", failure_threshold=2, reset_timeout=10.0,
+                                      probe=self.ping)
+        self.stats = {"calls": 0, "fallbacks": 0, "connects": 0}
+
+    # connections
+    def _pool(self):
+        # Sockets must not be shared with a forked parent
+        if self._pid != os.getpid():
+            with self._lock:
+                if self._pid != os.getpid():
+                    self._idle = queue.LifoQueue(maxsize=self.pool_size)
+                    self._pid = os.getpid()
+        return self._idle
+
+    def _connect(self, timeout):
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.settimeout(timeout)
+        try:
+            sock.connect(self.path)
+        except OSError:
+            sock.close()
+            raise
+        self.stats["connects"] += 1
+        return sock
+
+    def _exchange(self, message, timeout):
+        pool = self._pool()
+        try:
+            sock = pool.get_nowait()
+        except queue.Empty:
+            return self._send(self._connect(timeout), message, pool)
+        sock.settimeout(timeout)
+        try:
+            return self._send(sock, message, pool)
+        except TimeoutError:
+            raise
+        except (OSError, ProtocolError):
+            # Idle connections die when the daemon restarts; retry once on a new one
+            while not pool.empty():
+                pool.get_nowait().close()
+            return self._send(self._connect(timeout), message, pool)
+
+    def _send(self, sock, message, pool):
+        try:
+            sock.sendall(message)
+            header = _recv_exact(sock, RESPONSE.size)
+            if header is None:
+                raise ProtocolError("connection closed by the retrieval service")
+            magic, version, status, length = RESPONSE.unpack(header)
+            if magic != MAGIC or version != VERSION:
+                raise ProtocolError(f"bad response header {header!r}")
+            body = _recv_exact(sock, length) if length else b""
+        except BaseException:
+            sock.close()
+            raise
+        try:
+            pool.put_nowait(sock)
+        except queue.Full:
+            sock.close()
+        if status != STATUS_OK:
+            raise RetrievalServiceError(body.decode("utf-8", "replace"))
+        return body
+
+    def _call(self, message, timeout=None):
+        timeout = call_timeout(self.timeout if timeout is None else timeout, "retrieval service")
+        if not self.breaker.allow():
+            raise CircuitOpenError("retrieval service circuit is open")
+        try:
+            body = self._exchange(message, timeout)
+        except RetrievalServiceError:
+            # The daemon is up; the query itself failed
+            self.breaker.record_success()
+            raise
+        except (OSError, ProtocolError) as e:
+            self.breaker.record_failure(e)
+            raise
+        self.breaker.record_success()
+        return body
+
+    # protocol
+    def ping(self):
+        try:
+            self._info = json.loads(self._exchange(REQUEST.pack(MAGIC, VERSION, OP_INFO, 0, 0, 0), self.timeout))
+            return True
+        except (OSError, ProtocolError, RetrievalServiceError, ValueError):
+            return False
+
+    def info(self):
+        return json.loads(self._call(REQUEST.pack(MAGIC, VERSION, OP_INFO, 0, 0, 0)))
+
+    @property
+    def collections(self):
+        """Collections the daemon can filter to (None without knowledge shards)"""
+        if self._info is None and not self.ping():
+            return getattr(self._fallback_search(), "collections", None)
+        return self._info.get("collections")
+
+    def _fallback_search(self):
+        """The in-process retriever if it has loaded, else None (and start
+        loading it, off the request path)"""
+        if self._fallback is None or self._fallback_retriever is not None:
+            return self._fallback_retriever
+        with self._lock:
+            if self._fallback_loading:
+                return None
+            self._fallback_loading = True
+        logger.warning("Retrieval service unavailable; loading the in-process retriever in the background")
+        threading.Thread(target=self._load_fallback, name="retrieval-fallback-loader", daemon=True).start()
+        return None
+
+    def _load_fallback(self):
+        try:
+            self._fallback_retriever = self._fallback()
+        except Exception as e:
+            logger.warning("In-process retriever failed to load: %s", e)
+        finally:
+            self._fallback_loading = False
+
+    def search_many(self, queries, k=None, collections=None):
+        """Documents for each query, in one round trip"""
+        k = k or self.k
+        self.stats["calls"] += 1
+        try:
+            return decode_hits(len(queries), self._call(encode_search(queries, k, collections)))
+        except UNREACHABLE as e:
+            fallback = self._fallback_search()
+            if fallback is None:
+                raise
+            logger.info("Retrieval service call failed (%s); searching in-process", e)
+            self.stats["fallbacks"] += 1
+            if collections:
+                return [fallback.invoke(q, collections=collections) for q in queries]
+            return [fallback.invoke(q) for q in queries]
+
+    def search_vectors(self, vectors, k=None, collections=None):
+        """Documents for each query embedding (same model as the daemon's)"""
+        k = k or self.k
+        self.stats["calls"] += 1
+        try:
+            return decode_hits(len(vectors), self._call(encode_vector_search(vectors, k, collections)))
+        except UNREACHABLE as e:
+            if self._fallback_search() is None:
+                raise
+            logger.info("Retrieval service call failed (%s); searching in-process", e)
+            self.stats["fallbacks"] += 1
+            from vector_enhanced import search_vectors
+            return search_vectors(vectors, k, collections)
+
+    def invoke(self, query, collections=None, **kwargs):
+        return self.search_many([query], collections=collections)[0]
+
+    def snapshot(self):
+        return dict(self.stats, path=self.path, breaker=self.breaker.snapshot()["state"],
+                    fallback_loaded=self._fallback_retriever is not None)
+
+
+def connect(path=DEFAULT_SOCKET, pool_size=4, timeout=5.0, fallback=True):
+    """RetrievalClient for `path`, falling back to vector_enhanced in-process"""
+    def in_process():
+        from vector_enhanced import get_retriever
+
+        return get_retriever()
+
+    return RetrievalClient(path, pool_size, timeout, fallback=in_process if fallback else None)
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Serve retrieval to the web workers over a Unix socket")
+    parser.add_argument("--socket", default=DEFAULT_SOCKET, help="Unix socket path")
+    parser.add_argument("--window-ms", type=float, default=BATCH_WINDOW_MS,
+                        help="How long to collect concurrent queries into one embedding batch")
+    parser.add_argument("--max-batch", type=int, default=MAX_BATCH, help="Queries per embedding batch")
+    return parser.parse_args(argv)
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
+    args = parse_args()
+    serve(args.socket, args.window_ms, args.max_batch)
+    sys.exit(0)
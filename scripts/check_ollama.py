@@ -17,6 +17,15 @@ ENDPOINTS = [
     '/generate',
 ]
 
+def tags_ok(base, timeout=2):
+    """Cheap liveness check: True if GET /api/tags answers 200."""
+    try:
+        resp = requests.get(f"{base.rstrip('/')}/api/tags", timeout=timeout,
+                            proxies={'http': None, 'https': None})
+        return resp.status_code == 200
+    except requests.exceptions.RequestException:
+        return False
+
 def check(base, model, prompt='Hello'):
     base = base.rstrip('/')
     payload = {'model': model, 'prompt': prompt}
@@ -43,5 +52,10 @@ if __name__ == '__main__':
     parser = argparse.ArgumentParser()
     parser.add_argument('--base', default='http://localhost:11434', help='Ollama base URL')
     parser.add_argument('--model', default='llama3.1', help='Model name to request')
+    parser.add_argument('--tags-only', action='store_true', help='Only check that /api/tags responds')
     args = parser.parse_args()
+    if args.tags_only:
+        ok = tags_ok(args.base)
+        print('Ollama /api/tags', 'OK' if ok else 'unreachable')
+        raise SystemExit(0 if ok else 2)
     raise SystemExit(check(args.base, args.model))
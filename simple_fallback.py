@@ -1,63 +1,73 @@
 """
 Simple keyword-based financial advice fallback (no AI required)
 """
-import pandas as pd
 import re
 
-# Load financial data
-try:
-    df = pd.read_csv("Financial-Literacy-Compilation.csv")
-    print(f"✅ Successfully loaded {len(df)} financial records for fallback")
-except FileNotFoundError:
-    print("❌ Error: Financial-Literacy-Compilation.csv not found!")
-    df = None
+from corpus import get_corpus
 
-def simple_search(query, top_k=3):
+STOP_WORDS = {'what', 'is', 'a', 'an', 'the', 'how', 'to', 'do', 'does', 'can', 'could', 'should', 'would', 'about', 'tell', 'me', 'explain'}
+
+
+def keywords(query):
+    """Lowercase query words worth matching (no stop words or short words)"""
+    return [w for w in re.findall(r'\w+', query.lower()) if w not in STOP_WORDS and len(w) > 2]
+
+
+def keyword_rank(words, top_k=3, corpus=None):
+    """[(row, score)] for the top_k rows by keyword occurrences"""
+    scores = (corpus or get_corpus()).count_matches(words)
+    return sorted(scores.items(), key=lambda item: (-item[1], item[0]))[:top_k]
+
+
+def search_corpora(collections=None):
+    """[(collection, Corpus)] to search: the main corpus plus any knowledge
+    shards (knowledge_sources.py), limited to `collections` when given"""
+    from knowledge_sources import DEFAULT_COLLECTION, keyword_corpora
+
+    corpora = []
+    if not collections or DEFAULT_COLLECTION in collections:
+        corpora.append((DEFAULT_COLLECTION, get_corpus()))
+    for name, corpus in keyword_corpora().items():
+        if not collections or name in collections:
+            corpora.append((name, corpus))
+    return corpora
+
+
+def simple_search(query, top_k=3, collections=None):
     """
     Simple keyword-based search - no embeddings required
     Returns relevant financial information based on keyword matching
     """
-    if df is None or df.empty:
+    try:
+        corpora = [(name, corpus) for name, corpus in search_corpora(collections) if len(corpus)]
+    except FileNotFoundError:
+        print("❌ Error: Financial-Literacy-Compilation.csv not found!")
+        return "Unable to access financial database."
+    if not corpora:
         return "Unable to access financial database."
-    
-    query_lower = query.lower()
     
     # Extract keywords (remove common words)
-    stop_words = {'what', 'is', 'a', 'an', 'the', 'how', 'to', 'do', 'does', 'can', 'could', 'should', 'would', 'about', 'tell', 'me', 'explain'}
-    words = [w for w in re.findall(r'\w+', query_lower) if w not in stop_words and len(w) > 2]
+    words = keywords(query)
     
     if not words:
         return "Please ask a specific financial question."
     
-    # Score each row based on keyword matches
-    scores = []
-    for idx, row in df.iterrows():
-        score = 0
-        row_text = " ".join([str(val).lower() for val in row.values if pd.notna(val)])
-        
-        for word in words:
-            # Count occurrences of each keyword
-            score += row_text.count(word)
-        
-        if score > 0:
-            scores.append((score, idx, row))
+    # Score each row by keyword occurrences (one pass over each packed lowercase text)
+    ranked = [(score, corpus, idx) for _, corpus in corpora
+              for idx, score in keyword_rank(words, top_k, corpus)]
+    top_results = sorted(ranked, key=lambda item: -item[0])[:top_k]
     
-    if not scores:
+    if not top_results:
         return "I couldn't find specific information about that. Try asking about common topics like budgeting, savings, investing, or debt."
     
-    # Sort by score and get top results
-    scores.sort(reverse=True, key=lambda x: x[0])
-    top_results = scores[:top_k]
-    
     # Format response
     response = "📚 **Here's what I found in our financial database:**\n\n"
     
-    for i, (score, idx, row) in enumerate(top_results, 1):
+    for i, (score, corpus, idx) in enumerate(top_results, 1):
         # Get the most relevant fields from the row
         relevant_text = []
-        for col in df.columns:
-            val = str(row[col])
-            if pd.notna(row[col]) and len(val) > 10 and any(word in val.lower() for word in words):
+        for col, val in zip(corpus.columns, corpus.values(idx)):
+            if len(val) > 10 and any(word in val.lower() for word in words):
                 relevant_text.append(f"**{col}**: {val[:300]}")
         
         if relevant_text:
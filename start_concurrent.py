@@ -2,21 +2,74 @@
 """
 Concurrent Server Runner - Runs Django and Ollama simultaneously
 Handles process management, logging, and graceful shutdown
+
+Django is served by gunicorn (WSGI, default) or uvicorn (ASGI) instead of
+runserver. The worker count is derived from CPU cores and available memory,
+gunicorn preloads the app so workers share the loaded corpus and index
+copy-on-write, and workers are recycled after --max-requests requests.
+SIGTERM drains in-flight requests before stopping; crashed processes are
+restarted with exponential backoff. Workers whose RSS grows past
+WORKER_MAX_RSS_MB (or the largest one, when the host is nearly out of
+memory) are recycled; the app itself degrades via memory_watchdog.py.
+
+With --retrieval-service one supervised daemon (retrieval_service.py) holds
+the index and embedding model and the workers query it over a Unix socket,
+instead of each worker loading its own copy.
+
+Models are warmed once, here, before Django starts (manage.py warm_ollama);
+the result is published to LOG_DIR/warmup.json, which every worker reads
+for /api/ready/. With OLLAMA_KEEP_WARM_SECONDS one supervised
+`warm_ollama --keep-warm` process keeps them loaded.
+
+Usage:
+  python start_concurrent.py                      # Ollama + gunicorn
+  python start_concurrent.py --server uvicorn
+  python start_concurrent.py --no-ollama          # Ollama runs elsewhere (Docker)
+  python start_concurrent.py --retrieval-service  # share one retriever across workers
 """
 
-import subprocess
-import time
+import argparse
 import os
-import sys
+import shutil
 import signal
-import requests
+import socket
+import subprocess
+import sys
+import threading
+import time
 from pathlib import Path
 
+import requests
+
+from memory_watchdog import available_memory_mb, child_pids, rss_mb
+
 # Configuration
-PROJECT_DIR = Path("/Users/shazibsiddique/Desktop/ai capstone project ")
-DJANGO_PORT = 8000
+PROJECT_DIR = Path(__file__).resolve().parent
+DJANGO_PORT = int(os.getenv("DJANGO_PORT", "8000"))
 OLLAMA_PORT = 11434
-LOG_DIR = Path("/tmp/financial_tools")
+LOG_DIR = Path(os.getenv("LOG_DIR", "/tmp/financial_tools"))
+RETRIEVAL_SOCKET = os.getenv("RETRIEVAL_SOCKET") or str(LOG_DIR / "retrieval.sock")
+WARMUP_STATE = str(LOG_DIR / "warmup.json")
+KEEP_WARM_SECONDS = float(os.getenv("OLLAMA_KEEP_WARM_SECONDS", "0"))
+
+# Memory budget used to size the worker pool
+WORKER_MEMORY_MB = int(os.getenv("WORKER_MEMORY_MB", "350"))
+OLLAMA_RESERVE_MB = int(os.getenv("OLLAMA_RESERVE_MB", "1500"))
+MAX_REQUESTS = int(os.getenv("MAX_REQUESTS", "1000"))
+GRACEFUL_TIMEOUT = int(os.getenv("GRACEFUL_TIMEOUT", "30"))
+WORKER_TIMEOUT = int(os.getenv("WORKER_TIMEOUT", "120"))
+
+# Memory watchdog: recycle a worker whose RSS passes WORKER_MAX_RSS_MB, or the
+# largest worker when available memory falls below MEMORY_CRITICAL_MB
+WORKER_MAX_RSS_MB = int(os.getenv("WORKER_MAX_RSS_MB", "600"))
+MEMORY_CRITICAL_MB = int(os.getenv("MEMORY_CRITICAL_MB", "120"))
+WATCHDOG_INTERVAL = float(os.getenv("MEMORY_WATCHDOG_INTERVAL", "5"))
+RECYCLE_COOLDOWN = 30.0
+
+# Restart backoff: 1s, 2s, 4s ... capped; reset once a process stays up
+BACKOFF_BASE = 1.0
+BACKOFF_MAX = 60.0
+STABLE_AFTER = 60.0
 
 # Colors
 GREEN = '\033[0;32m'
@@ -25,38 +78,126 @@ YELLOW = '\033[1;33m'
 RED = '\033[0;31m'
 NC = '\033[0m'
 
+
+def default_worker_count(with_ollama=True):
+    """2 x cores + 1, capped by how many workers fit in available memory"""
+    cores = os.cpu_count() or 1
+    by_cpu = 2 * cores + 1
+    memory = available_memory_mb()
+    if memory is None:
+        return by_cpu
+    reserve = OLLAMA_RESERVE_MB if with_ollama else 0
+    by_memory = (memory - reserve) // WORKER_MEMORY_MB
+    return max(1, min(by_cpu, by_memory))
+
+
+class ManagedProcess:
+    """A supervised child process with exponential restart backoff"""
+
+    def __init__(self, name, command, log_file, env=None):
+        self.name = name
+        self.command = command
+        self.log_file = log_file
+        self.env = env
+        self.process = None
+        self.started_at = None
+        self.failures = 0
+        self.next_start = 0.0
+
+    def start(self):
+        self.process = subprocess.Popen(
+            self.command,
+            stdout=open(self.log_file, 'a'),
+            stderr=subprocess.STDOUT,
+            cwd=PROJECT_DIR,
+            env=self.env,
+            start_new_session=True,
+        )
+        self.started_at = time.monotonic()
+        return self.process.pid
+
+    def is_alive(self):
+        return self.process is not None and self.process.poll() is None
+
+    def schedule_restart(self, ran=True):
+        """Record a crash (or, with ran=False, a failed start) and return the delay before the next start"""
+        # Orphaned workers of a crashed master still hold the listening socket
+        self.signal(signal.SIGKILL)
+        if ran and self.started_at and time.monotonic() - self.started_at > STABLE_AFTER:
+            self.failures = 0
+        delay = min(BACKOFF_BASE * (2 ** self.failures), BACKOFF_MAX)
+        self.failures += 1
+        self.next_start = time.monotonic() + delay
+        return delay
+
+    def signal(self, signum):
+        # Each child leads its own session, so its pid is also its process group id
+        if self.process is not None:
+            try:
+                os.killpg(self.process.pid, signum)
+            except (ProcessLookupError, PermissionError):
+                pass
+
+    def stop(self, timeout):
+        """SIGTERM, wait up to `timeout` seconds for a graceful exit, then SIGKILL"""
+        if not self.is_alive():
+            self.signal(signal.SIGKILL)  # reap any orphaned workers
+            return
+        self.signal(signal.SIGTERM)
+        try:
+            self.process.wait(timeout=timeout)
+        except subprocess.TimeoutExpired:
+            self.signal(signal.SIGKILL)
+            self.process.wait()
+
+
 class ConcurrentServer:
-    def __init__(self):
-        self.ollama_process = None
-        self.django_process = None
-        self.venv_path = PROJECT_DIR / ".venv" / "bin" / "activate"
+    def __init__(self, server='gunicorn', workers=None, with_ollama=True,
+                 max_requests=MAX_REQUESTS, port=DJANGO_PORT, warmup=True,
+                 retrieval_service=False, retrieval_socket=RETRIEVAL_SOCKET):
+        self.server = server
+        self.retrieval_socket = retrieval_socket if retrieval_service else None
+        self.warmup = warmup
+        self.with_ollama = with_ollama
+        self.workers = workers or default_worker_count(with_ollama)
+        self.max_requests = max_requests
+        self.port = port
         self.log_dir = LOG_DIR
         self.log_dir.mkdir(parents=True, exist_ok=True)
-        
+        self.ollama = None
+        self.retrieval = None
+        self.keep_warm = None
+        self.web = None
+        self.recycled = {'bloated': 0, 'pressure': 0}
+        self._recycling = {}  # worker pid -> time SIGTERM was sent
+        self._last_pressure_recycle = 0.0
+        self.stopping = threading.Event()
+        # Woken by SIGCHLD so crashes are handled immediately rather than on a poll tick
+        self.wakeup = threading.Event()
+
     def print_banner(self, title):
         print(f"{BLUE}╔════════════════════════════════════════════════════════════╗{NC}")
         print(f"{BLUE}║{title.center(60)}║{NC}")
         print(f"{BLUE}╚════════════════════════════════════════════════════════════╝{NC}")
-    
+
     def print_status(self, icon, message):
         print(f"{GREEN}{icon} {message}{NC}")
-    
+
     def print_warning(self, icon, message):
         print(f"{YELLOW}{icon} {message}{NC}")
-    
+
     def print_error(self, icon, message):
         print(f"{RED}{icon} {message}{NC}")
-    
+
     def check_ollama(self):
         """Check if Ollama is installed"""
-        result = subprocess.run(['which', 'ollama'], capture_output=True)
-        return result.returncode == 0
-    
+        return shutil.which('ollama') is not None
+
     def wait_for_ollama(self, timeout=30):
         """Wait for Ollama to be ready"""
         self.print_warning('⏳', 'Waiting for Ollama to be ready...')
         start = time.time()
-        while time.time() - start < timeout:
+        while time.time() - start < timeout and not self.stopping.is_set():
             try:
                 response = requests.get(f'http://localhost:{OLLAMA_PORT}/api/tags', timeout=1)
                 if response.status_code == 200:
@@ -64,157 +205,342 @@ class ConcurrentServer:
                     return True
             except Exception:
                 pass
-            time.sleep(1)
+            self.stopping.wait(0.5)
         self.print_warning('⚠️ ', 'Ollama timeout, continuing anyway...')
         return False
-    
+
     def start_ollama(self):
         """Start Ollama server"""
         self.print_status('🚀', 'Starting Ollama server...')
-        log_file = self.log_dir / "ollama.log"
+        if self.ollama is None:
+            self.ollama = ManagedProcess('Ollama', ['ollama', 'serve'], self.log_dir / "ollama.log")
         try:
-            self.ollama_process = subprocess.Popen(
-                ['ollama', 'serve'],
-                stdout=open(log_file, 'w'),
+            pid = self.ollama.start()
+            self.print_status('✅', f'Ollama started (PID: {pid})')
+            return True
+        except Exception as e:
+            self.print_error('❌', f'Failed to start Ollama: {e}')
+            return False
+
+    def warm_up_models(self):
+        """Pull and preload the chat/embedding models so the first request is not a cold start"""
+        if not self.warmup:
+            return True
+        self.print_status('🔥', 'Warming up Ollama models...')
+        with open(self.log_dir / "warmup.log", 'a') as log:
+            result = subprocess.run(
+                [sys.executable, 'manage.py', 'warm_ollama', '--state', WARMUP_STATE],
+                cwd=PROJECT_DIR,
+                stdout=log,
                 stderr=subprocess.STDOUT,
-                preexec_fn=os.setsid
             )
-            self.print_status('✅', f'Ollama started (PID: {self.ollama_process.pid})')
-            time.sleep(2)
+        if result.returncode != 0:
+            self.print_warning('⚠️ ', f'Warm-up failed, first requests may be slow (see {self.log_dir}/warmup.log)')
+            return False
+        self.print_status('✅', 'Models loaded and pinned (keep_alive)')
+        return True
+
+    def start_keep_warm(self):
+        """Start the process that pings idle models every OLLAMA_KEEP_WARM_SECONDS"""
+        if not self.warmup or KEEP_WARM_SECONDS <= 0:
+            return True
+        if self.keep_warm is None:
+            self.keep_warm = ManagedProcess(
+                'Keep-warm', [sys.executable, 'manage.py', 'warm_ollama', '--keep-warm'],
+                self.log_dir / "warmup.log")
+        try:
+            pid = self.keep_warm.start()
+            self.print_status('✅', f'Keep-warm started (PID: {pid}, every {KEEP_WARM_SECONDS:g}s)')
             return True
         except Exception as e:
-            self.print_error('❌', f'Failed to start Ollama: {e}')
+            self.print_error('❌', f'Failed to start keep-warm: {e}')
+            return False
+
+    def start_retrieval(self, wait=True):
+        """Start the shared retrieval daemon; with `wait`, block until it accepts connections"""
+        self.print_status('🚀', 'Starting retrieval service...')
+        if self.retrieval is None:
+            self.retrieval = ManagedProcess(
+                'Retrieval', [sys.executable, 'retrieval_service.py', '--socket', self.retrieval_socket],
+                self.log_dir / "retrieval.log")
+        try:
+            pid = self.retrieval.start()
+        except Exception as e:
+            self.print_error('❌', f'Failed to start the retrieval service: {e}')
             return False
-    
+        return self.wait_for_retrieval(pid) if wait else True
+
+    def wait_for_retrieval(self, pid, timeout=300):
+        """Wait for the daemon to load the index and open its socket"""
+        self.print_warning('⏳', 'Waiting for the retrieval service to load the index...')
+        start = time.time()
+        while time.time() - start < timeout and not self.stopping.is_set() and self.retrieval.is_alive():
+            probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            try:
+                probe.connect(self.retrieval_socket)
+                self.print_status('✅', f'Retrieval service ready (PID: {pid})')
+                return True
+            except OSError:
+                pass
+            finally:
+                probe.close()
+            self.stopping.wait(0.5)
+        self.print_warning('⚠️ ', f'Retrieval service not ready, workers will search in-process '
+                                  f'until it is (see {self.log_dir}/retrieval.log)')
+        return False
+
+    def web_command(self):
+        if self.server == 'uvicorn':
+            # uvicorn has no preload: each worker imports the app itself
+            return [
+                sys.executable, '-m', 'uvicorn', 'financial_site.asgi:application',
+                '--host', '0.0.0.0', '--port', str(self.port),
+                '--workers', str(self.workers),
+                '--limit-max-requests', str(self.max_requests),
+                '--timeout-graceful-shutdown', str(GRACEFUL_TIMEOUT),
+            ]
+        return [
+            sys.executable, '-m', 'gunicorn', 'financial_site.wsgi:application',
+            '--bind', f'0.0.0.0:{self.port}',
+            '--workers', str(self.workers),
+            '--preload',
+            '--max-requests', str(self.max_requests),
+            '--max-requests-jitter', str(max(1, self.max_requests // 10)),
+            '--graceful-timeout', str(GRACEFUL_TIMEOUT),
+            '--timeout', str(WORKER_TIMEOUT),
+        ]
+
     def start_django(self):
-        """Start Django server"""
-        self.print_status('🚀', 'Starting Django server...')
-        
+        """Start Django under gunicorn/uvicorn"""
+        self.print_status('🚀', f'Starting Django ({self.server}, {self.workers} workers)...')
+
         # Run migrations
         self.print_status('🔄', 'Running migrations...')
-        os.chdir(PROJECT_DIR)
         migrate_result = subprocess.run(
-            f'source {self.venv_path} && python manage.py migrate',
-            shell=True,
+            [sys.executable, 'manage.py', 'migrate', '--noinput'],
+            cwd=PROJECT_DIR,
             capture_output=True,
             text=True
         )
         if migrate_result.returncode != 0:
             self.print_warning('⚠️ ', 'Migration warning (may be okay)')
-        
-        # Start server
-        log_file = self.log_dir / "django.log"
+
+        if self.web is None:
+            env = dict(os.environ)
+            # Import views in the gunicorn master so corpus + retriever are shared copy-on-write
+            env.setdefault('DJANGO_PRELOAD_VIEWS', '1' if self.server == 'gunicorn' else '0')
+            if self.retrieval_socket:
+                env['RETRIEVAL_SOCKET'] = self.retrieval_socket
+            # Warm-up ran once above; workers only read its published state
+            if self.warmup:
+                env['OLLAMA_WARMUP_STATE'] = WARMUP_STATE
+            else:
+                env['OLLAMA_WARMUP'] = 'false'
+            self.web = ManagedProcess('Django', self.web_command(), self.log_dir / "django.log", env)
         try:
-            self.django_process = subprocess.Popen(
-                f'source {self.venv_path} && python manage.py runserver 0.0.0.0:{DJANGO_PORT}',
-                shell=True,
-                stdout=open(log_file, 'w'),
-                stderr=subprocess.STDOUT,
-                preexec_fn=os.setsid,
-                cwd=PROJECT_DIR
-            )
-            self.print_status('✅', f'Django started (PID: {self.django_process.pid})')
-            time.sleep(2)
+            pid = self.web.start()
+            self.print_status('✅', f'Django started (PID: {pid})')
             return True
         except Exception as e:
             self.print_error('❌', f'Failed to start Django: {e}')
             return False
-    
+
     def display_info(self):
         """Display startup information"""
         print()
         self.print_banner('🎉 SERVERS RUNNING 🎉')
         print()
         self.print_status('📍', 'Services Available:')
-        print(f"   🤖 Ollama:  {YELLOW}http://localhost:{OLLAMA_PORT}{NC}")
-        print(f"   💻 Django:  {YELLOW}http://localhost:{DJANGO_PORT}{NC}")
+        if self.with_ollama:
+            print(f"   🤖 Ollama:  {YELLOW}http://localhost:{OLLAMA_PORT}{NC}")
+        if self.retrieval_socket:
+            print(f"   📚 Retrieval: {YELLOW}{self.retrieval_socket}{NC}")
+        print(f"   💻 Django:  {YELLOW}http://localhost:{self.port}{NC} ({self.server} x{self.workers})")
         print()
         self.print_status('📊', 'Open in Browser:')
-        print(f"   {YELLOW}http://localhost:{DJANGO_PORT}{NC}")
+        print(f"   {YELLOW}http://localhost:{self.port}{NC}")
         print()
         self.print_status('📋', 'Log Files:')
-        print(f"   {self.log_dir}/ollama.log")
+        if self.with_ollama:
+            print(f"   {self.log_dir}/ollama.log")
+        if self.warmup:
+            print(f"   {self.log_dir}/warmup.log")
+        if self.retrieval_socket:
+            print(f"   {self.log_dir}/retrieval.log")
         print(f"   {self.log_dir}/django.log")
         print()
-        self.print_warning('⌨️ ', 'Press Ctrl+C to stop both servers')
+        self.print_warning('⌨️ ', 'Press Ctrl+C to stop (in-flight requests are drained first)')
         print()
-    
-    def is_process_alive(self, process):
-        """Check if process is still running"""
-        if process is None:
-            return False
-        return process.poll() is None
-    
+
+    def _restart_if_due(self, managed, start, when_started=None):
+        """Restart a dead process once its backoff delay has passed.
+
+        `when_started` (readiness waits, warm-up) runs on its own thread so the
+        monitor loop keeps watching the other processes meanwhile.
+        """
+        if managed is None or managed.process is None or managed.is_alive():
+            return
+        if managed.next_start <= managed.started_at:
+            # First time we notice this exit
+            delay = managed.schedule_restart()
+            code = managed.process.returncode if managed.process else None
+            self.print_warning('⚠️ ', f'{managed.name} exited (code {code}), restarting in {delay:.0f}s...')
+        if time.monotonic() < managed.next_start:
+            return
+        started_at = managed.started_at
+        try:
+            start()
+        except Exception as e:
+            self.print_error('❌', f'Failed to restart {managed.name}: {e}')
+        if managed.started_at == started_at:
+            # Nothing was launched (e.g. Popen raised): back off instead of retrying every tick
+            delay = managed.schedule_restart(ran=False)
+            self.print_warning('⚠️ ', f'{managed.name} did not start, retrying in {delay:.0f}s...')
+        elif when_started is not None:
+            threading.Thread(target=when_started, name=f'{managed.name} warm-up', daemon=True).start()
+
+    def _recycle_worker(self, pid, rss, reason):
+        """SIGTERM one web worker; gunicorn/uvicorn drain it and fork a fresh one"""
+        try:
+            os.kill(pid, signal.SIGTERM)
+        except ProcessLookupError:
+            return
+        self._recycling[pid] = time.monotonic()
+        self.recycled[reason] += 1
+        self.print_warning('♻️ ', f'Recycling worker {pid} ({rss:.0f} MB, {reason}) - '
+                                  f'recycled so far: {self.recycled}')
+
+    def check_memory(self):
+        """Recycle bloated workers, and the largest one under critical memory pressure"""
+        if not self.web or not self.web.is_alive():
+            return
+        now = time.monotonic()
+        self._recycling = {p: t for p, t in self._recycling.items() if now - t < RECYCLE_COOLDOWN}
+        workers = {}
+        for pid in child_pids(self.web.process.pid):
+            rss = rss_mb(pid)
+            if rss is not None and pid not in self._recycling:
+                workers[pid] = rss
+        for pid, rss in workers.items():
+            if rss > WORKER_MAX_RSS_MB:
+                self._recycle_worker(pid, rss, 'bloated')
+        available = available_memory_mb()
+        if (available is not None and available < MEMORY_CRITICAL_MB and len(workers) > 1
+                and now - self._last_pressure_recycle > RECYCLE_COOLDOWN):
+            pid = max(workers, key=workers.get)
+            if pid not in self._recycling:
+                self._last_pressure_recycle = now
+                self._recycle_worker(pid, workers[pid], 'pressure')
+
     def monitor_processes(self):
-        """Monitor and restart processes if they crash"""
-        while True:
+        """Monitor and restart processes if they crash; watch worker memory"""
+        next_memory_check = 0.0
+        while not self.stopping.is_set():
             try:
-                if not self.is_process_alive(self.ollama_process):
-                    self.print_warning('⚠️ ', 'Ollama crashed, restarting...')
-                    self.start_ollama()
-                    self.wait_for_ollama()
-                
-                if not self.is_process_alive(self.django_process):
-                    self.print_warning('⚠️ ', 'Django crashed, restarting...')
-                    self.start_django()
-                
-                time.sleep(5)
-            except KeyboardInterrupt:
-                break
+                self._restart_if_due(self.ollama, self.start_ollama,
+                                     lambda: self.wait_for_ollama() and self.warm_up_models())
+                self._restart_if_due(self.retrieval, lambda: self.start_retrieval(wait=False),
+                                     lambda: self.wait_for_retrieval(self.retrieval.process.pid))
+                self._restart_if_due(self.keep_warm, self.start_keep_warm)
+                self._restart_if_due(self.web, self.start_django)
+                if time.monotonic() >= next_memory_check:
+                    next_memory_check = time.monotonic() + WATCHDOG_INTERVAL
+                    self.check_memory()
             except Exception as e:
                 self.print_error('❌', f'Monitor error: {e}')
-                time.sleep(5)
-    
+            self.wakeup.wait(1.0)
+            self.wakeup.clear()
+
     def cleanup(self, signum, frame):
-        """Clean up processes on exit"""
+        """Drain and stop processes on exit"""
+        if self.stopping.is_set():
+            return
+        self.stopping.set()
+        self.wakeup.set()
         print()
-        self.print_warning('⏹️ ', 'Shutting down servers...')
-        
-        if self.ollama_process and self.is_process_alive(self.ollama_process):
-            try:
-                os.killpg(os.getpgid(self.ollama_process.pid), signal.SIGTERM)
-            except Exception:
-                pass
-        
-        if self.django_process and self.is_process_alive(self.django_process):
-            try:
-                os.killpg(os.getpgid(self.django_process.pid), signal.SIGTERM)
-            except Exception:
-                pass
-        
+        self.print_warning('⏹️ ', 'Draining in-flight requests and shutting down...')
+
+        # gunicorn/uvicorn finish in-flight requests on SIGTERM; stop the web
+        # tier first so those requests can still reach Ollama and the retriever
+        if self.web:
+            self.web.stop(timeout=GRACEFUL_TIMEOUT + 5)
+        if self.retrieval:
+            self.retrieval.stop(timeout=10)
+        if self.keep_warm:
+            self.keep_warm.stop(timeout=5)
+        if self.ollama:
+            self.ollama.stop(timeout=10)
+
         self.print_status('✅', 'Servers stopped')
         sys.exit(0)
-    
+
     def run(self):
         """Run both servers concurrently"""
         # Set up signal handlers
         signal.signal(signal.SIGINT, self.cleanup)
         signal.signal(signal.SIGTERM, self.cleanup)
-        
+        signal.signal(signal.SIGCHLD, lambda signum, frame: self.wakeup.set())
+
         print()
         self.print_banner('💰 Financial Tools - Concurrent Server Runner 💰')
         print()
-        
-        # Check prerequisites
-        if not self.check_ollama():
-            self.print_error('❌', 'Ollama not found')
-            self.print_warning('⚠️ ', 'Install from https://ollama.ai')
-            sys.exit(1)
-        
-        # Start servers
-        if not self.start_ollama():
-            sys.exit(1)
-        
-        self.wait_for_ollama()
-        
+
+        if self.with_ollama:
+            # Check prerequisites
+            if not self.check_ollama():
+                self.print_error('❌', 'Ollama not found')
+                self.print_warning('⚠️ ', 'Install from https://ollama.ai (or pass --no-ollama)')
+                sys.exit(1)
+
+            # Start servers
+            if not self.start_ollama():
+                sys.exit(1)
+
+            self.wait_for_ollama()
+
+        # Before starting Django so the server is only reported ready once models are resident
+        self.warm_up_models()
+        self.start_keep_warm()
+
+        # The daemon embeds queries with the warmed-up embedding model
+        if self.retrieval_socket:
+            self.start_retrieval()
+
         if not self.start_django():
             self.cleanup(None, None)
-            sys.exit(1)
-        
+
         # Display info and monitor
         self.display_info()
         self.monitor_processes()
 
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='Supervise Ollama and the Django app server')
+    parser.add_argument('--server', choices=['gunicorn', 'uvicorn'], default=os.getenv('APP_SERVER', 'gunicorn'))
+    parser.add_argument('--workers', type=int, default=int(os.getenv('WEB_WORKERS', '0')) or None,
+                        help='Worker processes (default: from CPU cores and available memory)')
+    parser.add_argument('--max-requests', type=int, default=MAX_REQUESTS,
+                        help='Recycle a worker after this many requests')
+    parser.add_argument('--port', type=int, default=DJANGO_PORT)
+    parser.add_argument('--no-ollama', action='store_true', help='Do not start/supervise a local Ollama')
+    parser.add_argument('--skip-warmup', action='store_true', help='Do not preload models before serving')
+    parser.add_argument('--retrieval-service', action='store_true',
+                        default=os.getenv('RETRIEVAL_SERVICE', 'false').lower() == 'true',
+                        help='Serve retrieval from one shared daemon instead of in every worker')
+    parser.add_argument('--retrieval-socket', default=RETRIEVAL_SOCKET, help='Unix socket for --retrieval-service')
+    return parser.parse_args()
+
+
 if __name__ == '__main__':
-    server = ConcurrentServer()
+    args = parse_args()
+    server = ConcurrentServer(
+        server=args.server,
+        workers=args.workers,
+        with_ollama=not args.no_ollama,
+        max_requests=args.max_requests,
+        port=args.port,
+        warmup=not args.skip_warmup,
+        retrieval_service=args.retrieval_service,
+        retrieval_socket=args.retrieval_socket,
+    )
     server.run()
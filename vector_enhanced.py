@@ -1,57 +1,188 @@
-from langchain_ollama import OllamaEmbeddings
-from langchain_chroma import Chroma
-from langchain_core.documents import Document
+import json
 import os
-import pandas as pd
+from pathlib import Path
 from dotenv import load_dotenv
 
-EMBED_MODEL = os.getenv("EMBED_MODEL", "nomic-embed-text")
+from corpus import BASE_DIR, DEDUP_THRESHOLD, chunking_id, corpus_version, get_corpus
+from embeddings import shared_embeddings, embedding_model_id
+from index_artifact import DEFAULT_PATH as ARTIFACT_PATH, ArtifactRetriever, StaleArtifactError, load_artifact
+
 # Load financial data
 try:
-    df = pd.read_csv("Financial-Literacy-Compilation.csv")
-    print(f"✅ Successfully loaded {len(df)} financial records")
+    corpus = get_corpus()
 except FileNotFoundError:
     print("❌ Error: Financial-Literacy-Compilation.csv not found!")
     raise
 
-embeddings = OllamaEmbeddings(model=EMBED_MODEL)
+embeddings = shared_embeddings()
+embedding_model = embedding_model_id(embeddings)
+# Near-duplicate rows are embedded once (corpus.Corpus.duplicates)
+chunking = chunking_id(DEDUP_THRESHOLD)
+
+# Results per query, and maximal-marginal-relevance diversification: pick
+# RETRIEVAL_K of the RETRIEVAL_FETCH_K nearest chunks, trading relevance
+# against similarity to chunks already picked (lambda 1 = similarity only)
+RETRIEVAL_K = int(os.getenv("RETRIEVAL_K", "5"))
+RETRIEVAL_MMR = os.getenv("RETRIEVAL_MMR", "true").lower() == "true"
+RETRIEVAL_FETCH_K = int(os.getenv("RETRIEVAL_FETCH_K", "20"))
+RETRIEVAL_MMR_LAMBDA = float(os.getenv("RETRIEVAL_MMR_LAMBDA", "0.5"))
+# Two-stage search (cluster_index.py) when the artifact has a clustering
+# sidecar: only the passages of the RETRIEVAL_NPROBE nearest clusters are
+# scored. RETRIEVAL_HIERARCHICAL=false always scans every passage.
+RETRIEVAL_HIERARCHICAL = os.getenv("RETRIEVAL_HIERARCHICAL", "true").lower() == "true"
+RETRIEVAL_NPROBE = int(os.getenv("RETRIEVAL_NPROBE", "8"))
+
+# Relative VECTOR_DB_PATH values resolve against the project, not the cwd
+db_location = str(BASE_DIR / Path(os.getenv("VECTOR_DB_PATH", "chrome_langchain_db")))
+# Records which embedding model, corpus version and chunking built the index;
+# vectors from a different provider live in a different space, so a mismatch
+# forces a rebuild, as does an edited CSV or a new dedup threshold.
+manifest_path = os.path.join(db_location, "finguide_index.json")
+
+
+def read_manifest():
+    try:
+        with open(manifest_path) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def load_prebuilt_retriever():
+    """Retriever over the prebuilt index artifact (manage.py build_index), or
+    None if there is none or it doesn't match this corpus/embedding model"""
+    if not ARTIFACT_PATH.exists():
+        return None
+    try:
+        artifact = load_artifact(ARTIFACT_PATH, corpus_version(), embedding_model, chunking)
+    except (StaleArtifactError, ValueError, OSError) as e:
+        print(f"⚠️  Ignoring index artifact {ARTIFACT_PATH}: {e}")
+        return None
+    print(f"✅ Loaded prebuilt index ({artifact.header['count']} chunks, {embedding_model})")
+    index = artifact
+    if RETRIEVAL_HIERARCHICAL:
+        from cluster_index import load_hierarchical
+
+        index = load_hierarchical(artifact, nprobe=RETRIEVAL_NPROBE) or artifact
+        if index is not artifact:
+            stats = index.stats()
+            print(f"✅ Two-stage search: {stats['clusters']} clusters, nprobe {stats['nprobe']} "
+                  f"(~{stats['scanned_per_query']} of {stats['passages']} passages scored per query)")
+    return ArtifactRetriever(index, embeddings, k=RETRIEVAL_K, mmr=RETRIEVAL_MMR,
+                             fetch_k=RETRIEVAL_FETCH_K, lambda_mult=RETRIEVAL_MMR_LAMBDA)
+
 
-db_location = "./chrome_langchain_db"
-add_documents = not os.path.exists(db_location)
+def build_chroma_retriever():
+    from langchain_chroma import Chroma
+    from langchain_core.documents import Document
 
-if add_documents:
-    print("🔄 Building vector database for the first time...")
-    documents = []
-    ids = []
+    manifest = read_manifest()
+    version = corpus_version()
+    add_documents = (manifest is None or manifest.get("embedding_model") != embedding_model
+                     or manifest.get("corpus_version") != version
+                     or manifest.get("chunking", "rows") != chunking)
 
-    for i, row in df.iterrows():
-        # Combine ALL columns into one text block
-        row_text = "\n".join([f"{col}: {row[col]}" for col in df.columns])
+    if add_documents:
+        if manifest is not None and manifest.get("embedding_model") != embedding_model:
+            print(f"⚠️  Index was built with {manifest.get('embedding_model')}, "
+                  f"current provider is {embedding_model} - rebuilding...")
+        elif manifest is not None and manifest.get("corpus_version") == version:
+            print(f"⚠️  Chunking changed to {chunking} - rebuilding...")
+        elif manifest is not None:
+            print("⚠️  Financial-Literacy-Compilation.csv changed - rebuilding...")
+        else:
+            print("🔄 Building vector database for the first time...")
+        documents = []
+        ids = []
 
-        document = Document(
-            page_content=row_text,
-            metadata={"row_index": i},
-            id=str(i)
-        )
-        documents.append(document)
-        ids.append(str(i))
+        for chunk in corpus.chunks(DEDUP_THRESHOLD):
+            metadata = {"row_index": chunk["row_index"]}
+            if chunk.get("duplicates"):
+                # Rows folded into this one (Chroma metadata values are scalars)
+                metadata["duplicates"] = ",".join(map(str, chunk["duplicates"]))
+            # Combine ALL columns into one text block
+            document = Document(
+                page_content=chunk["text"],
+                metadata=metadata,
+                id=chunk["id"]
+            )
+            documents.append(document)
+            ids.append(chunk["id"])
 
-vector_store = Chroma(
-    collection_name="finguide_financial_data",
-    persist_directory=db_location,
-    embedding_function=embeddings
-)
+    vector_store = Chroma(
+        collection_name="finguide_financial_data",
+        persist_directory=db_location,
+        embedding_function=embeddings
+    )
 
-if add_documents:
-    print(f"📚 Adding {len(documents)} documents to vector store...")
-    vector_store.add_documents(documents=documents, ids=ids)
-    print("✅ Vector database created successfully!")
-else:
-    print("✅ Loading existing vector database...")
+    if add_documents:
+        # Drop any stale or half-built collection before re-embedding
+        vector_store.reset_collection()
+        print(f"📚 Adding {len(documents)} documents to vector store...")
+        # Chroma caps how many records one upsert may carry (~5.4k), below our row count
+        batch_size = 1000
+        for start in range(0, len(documents), batch_size):
+            vector_store.add_documents(
+                documents=documents[start:start + batch_size],
+                ids=ids[start:start + batch_size]
+            )
+        with open(manifest_path, "w") as f:
+            json.dump({
+                "embedding_model": embedding_model,
+                "corpus_version": version,
+                "chunking": chunking,
+                "collection": "finguide_financial_data",
+                "documents": len(documents),
+            }, f, indent=2)
+        print(f"✅ Vector database created successfully with {embedding_model}!")
+    else:
+        print(f"✅ Loading existing vector database ({embedding_model})...")
+
+    if RETRIEVAL_MMR:
+        return vector_store.as_retriever(search_type="mmr", search_kwargs={
+            "k": RETRIEVAL_K, "fetch_k": RETRIEVAL_FETCH_K, "lambda_mult": RETRIEVAL_MMR_LAMBDA})
+    return vector_store.as_retriever(search_kwargs={"k": RETRIEVAL_K})
+
+
+def with_knowledge_shards(base):
+    """Search the knowledge-source shards (manage.py ingest_sources) alongside
+    the main corpus, as collections of one ShardedRetriever"""
+    from knowledge_sources import DEFAULT_COLLECTION, ShardedRetriever, load_shards
+
+    shards = load_shards(embedding_model, nprobe=RETRIEVAL_NPROBE, hierarchical=RETRIEVAL_HIERARCHICAL)
+    if not shards:
+        return base
+    if not isinstance(base, ArtifactRetriever):
+        print("⚠️  Knowledge shards need the prebuilt index (manage.py build_index); "
+              "searching the main corpus only")
+        return base
+    print(f"✅ Searching {len(shards) + 1} collections: {DEFAULT_COLLECTION}, {', '.join(shards)}")
+    return ShardedRetriever({DEFAULT_COLLECTION: base.artifact, **shards}, embeddings, k=RETRIEVAL_K,
+                            mmr=RETRIEVAL_MMR, fetch_k=RETRIEVAL_FETCH_K, lambda_mult=RETRIEVAL_MMR_LAMBDA)
+
+
+retriever = with_knowledge_shards(load_prebuilt_retriever() or build_chroma_retriever())
 
-retriever = vector_store.as_retriever(search_kwargs={"k": 5})
 
 def get_retriever():
     """Return the retriever for use in views"""
     return retriever
 
+
+def search_vectors(vectors, k=RETRIEVAL_K, collections=None):
+    """Documents for each query vector; `collections` filters knowledge shards
+    (without shards there is only the main corpus)"""
+    if getattr(retriever, "collections", None):
+        return retriever.invoke_by_vectors(vectors, k, collections=collections)
+    if hasattr(retriever, "invoke_by_vectors"):
+        return retriever.invoke_by_vectors(vectors, k)
+    store = retriever.vectorstore
+    if RETRIEVAL_MMR:
+        return [store.max_marginal_relevance_search_by_vector(
+            v, k=k, fetch_k=RETRIEVAL_FETCH_K, lambda_mult=RETRIEVAL_MMR_LAMBDA) for v in vectors]
+    return [store.similarity_search_by_vector(v, k=k) for v in vectors]
+
+
+def retrieve_many(queries, k=RETRIEVAL_K, collections=None):
+    """Retrieve documents for many queries, embedding them in one batched call"""
+    return search_vectors(embeddings.embed_documents(list(queries)), k, collections)